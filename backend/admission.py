@@ -0,0 +1,192 @@
+"""
+Admission control for the engine-bound routes.
+
+A fixed number of slots is shared by all engine work. Each route has its own
+concurrency limit, queue limit and priority; when no slot is free a request
+waits in a priority queue, so interactive moves are served before hints and
+hints before background analysis. A request that finds the queue full, or
+waits too long, is rejected right away with a suggested retry delay instead of
+piling up more latency.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Priorities, lower is served first
+MOVE, HINT, BACKGROUND = 0, 1, 2
+
+
+class Overloaded(Exception):
+    """ status is 503 when the server is saturated, 429 when one route's queue is full """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RouteLimit:
+    __slots__ = ('concurrency', 'max_queued', 'priority', 'running', 'queued',
+                 'admitted', 'rejected', 'timed_out', 'wait_ms')
+
+    def __init__(self, concurrency, max_queued, priority):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.priority = priority
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_ms = 0.0
+
+
+class Waiter:
+    __slots__ = ('route', 'granted')
+
+    def __init__(self, route):
+        self.route = route
+        self.granted = False
+
+
+class AdmissionControl:
+
+    def __init__(self, slots, max_queue, queue_timeout, routes):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.routes = routes
+        self.running = 0
+        self.queue = []  # heap of (priority, sequence, waiter)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.service_time = 0.5  # moving average of a slot's hold time in seconds
+        self.on_pressure = None  # called when a request has to queue, background work can free its slot
+
+    def can_start(self, limit):
+        return self.running < self.slots and limit.running < limit.concurrency
+
+    def start(self, name, limit):
+        self.running += 1
+        limit.running += 1
+        limit.admitted += 1
+
+    def dispatch(self):
+        """ Grant freed slots to the waiters in priority order, call with the condition held """
+        granted = False
+        for entry in sorted(self.queue):
+            if self.running >= self.slots:
+                break
+            waiter = entry[2]
+            limit = self.routes[waiter.route]
+            if limit.running < limit.concurrency:
+                self.queue.remove(entry)
+                limit.queued -= 1
+                self.start(waiter.route, limit)
+                waiter.granted = True
+                granted = True
+        if granted:
+            heapq.heapify(self.queue)
+            self.condition.notify_all()
+
+    def retry_after(self):
+        """ Seconds until the queue has likely drained """
+        return max(1, math.ceil(self.service_time * (len(self.queue) + 1) / self.slots))
+
+    def expected_wait(self):
+        """ Seconds a request arriving now would likely wait for a slot """
+        with self.condition:
+            if self.running < self.slots:
+                return 0.0
+            return self.service_time * (len(self.queue) + 1) / self.slots
+
+    def acquire(self, name, reject=True):
+        """
+        Take a slot for the route, waiting in the queue when none is free.
+        Raises Overloaded when rejected; reject=False waits as long as needed.
+        """
+        limit = self.routes[name]
+        if self.on_pressure is not None and self.running >= self.slots:
+            self.on_pressure()
+        with self.condition:
+            if not self.queue and self.can_start(limit):
+                self.start(name, limit)
+                return time.monotonic()
+
+            if reject and len(self.queue) >= self.max_queue:
+                limit.rejected += 1
+                raise Overloaded('Server is busy', 503, self.retry_after())
+            if reject and limit.queued >= limit.max_queued:
+                limit.rejected += 1
+                raise Overloaded('Too many requests queued for this route', 429, self.retry_after())
+
+            waiter = Waiter(name)
+            entry = (limit.priority, next(self.sequence), waiter)
+            heapq.heappush(self.queue, entry)
+            limit.queued += 1
+            queued_at = time.monotonic()
+            deadline = queued_at + self.queue_timeout if reject else None
+            self.dispatch()
+
+            while not waiter.granted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.queue.remove(entry)
+                    heapq.heapify(self.queue)
+                    limit.queued -= 1
+                    limit.timed_out += 1
+                    raise Overloaded('Timed out waiting for an engine', 503, self.retry_after())
+                self.condition.wait(remaining)
+
+            limit.wait_ms += (time.monotonic() - queued_at) * 1000
+            return time.monotonic()
+
+    def try_acquire(self, name):
+        """ Take a slot only when one is free right away and nobody queues, None otherwise """
+        limit = self.routes[name]
+        with self.condition:
+            if self.queue or not self.can_start(limit):
+                return None
+            self.start(name, limit)
+            return time.monotonic()
+
+    def release(self, name, started, record=True):
+        """ record=False keeps the hold time out of the service time, for work stopped at will """
+        with self.condition:
+            self.running -= 1
+            self.routes[name].running -= 1
+            if record:
+                self.service_time = 0.9 * self.service_time + 0.1 * (time.monotonic() - started)
+            self.dispatch()
+
+    @contextmanager
+    def slot(self, name, reject=True):
+        started = self.acquire(name, reject)
+        try:
+            yield
+        finally:
+            self.release(name, started)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'slots': self.slots,
+                'running': self.running,
+                'queue_depth': len(self.queue),
+                'max_queue': self.max_queue,
+                'service_time_ms': round(self.service_time * 1000, 1),
+                'routes': {
+                    name: {
+                        'running': limit.running,
+                        'queued': limit.queued,
+                        'admitted': limit.admitted,
+                        'rejected': limit.rejected,
+                        'timed_out': limit.timed_out,
+                        'avg_wait_ms': round(limit.wait_ms / limit.admitted, 1) if limit.admitted else 0.0
+                    }
+                    for name, limit in self.routes.items()
+                }
+            }
@@ -1,35 +1,219 @@
-from flask import Flask, jsonify, request, send_from_directory
+import time
+import datetime
+STARTUP_BEGIN = time.perf_counter()  # Cold start is measured from here
+
+from flask import Flask, jsonify, request, send_from_directory, g, Response
 import os
 import chess
 import chess.engine
 from draughts import Board, Move, WHITE, BLACK
-from draughts.engine import HubEngine, Limit
-from flasgger import Swagger
+from draughts.engine import Limit
 from flask_cors import CORS
 import uuid
 import socket
-from collections import Counter
+from collections import deque
 import re
+import json
+import queue
+import threading
+from request_log import SlowRequestLog
+from chess_ai import BuiltinEngine
+from checkers_ai import DraughtsEngine
+from review import ReviewPool, position_key
+from challenge_analysis import analyse_challenge
+from lazy_docs import LazySwagger
+from engine_supervisor import EngineSupervisor, EnginePool, EngineUnavailable, EngineTimeout
+from engines import STOCKFISH_PATH, stockfish_available, start_stockfish, stop_stockfish, is_fatal_stockfish_error, initialize_engine, stop_scan
+from core_scheduler import CoreScheduler
+from engine_client import EngineClient
+from game_record import GameRecord
+from game_clock import GameClock, now_ms
+from game_archive import GameArchive
+from timer_wheel import TimerWheel
+from tracked_board import TrackedBoard
+from state_store import open_store, StoreMapping
+from compression import install_gzip
+from wire_format import install_msgpack, wants_msgpack, pack_chess_fen, pack_moves, pack_legal_moves, pack_checkers_map
+from single_flight import SingleFlight
+from time_manager import TimeManager
+from live_analysis import AnalysisEngines, analyse
+from ponder import PonderManager
+from admission import AdmissionControl, RouteLimit, Overloaded, MOVE, HINT, BACKGROUND
 
-STOCKFISH_PATH = "C:\\stockfish\\stockfish-windows-x86-64-avx2.exe"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 THEMES_DIRECTORY = os.path.join(BASE_DIR, 'themes')
 
 app = Flask(__name__)
 CORS(app)  # This will allow all domains to make requests
-swagger = Swagger(app)
+app.wsgi_app = LazySwagger(app)  # Swagger UI and spec are built on the first /apidocs request
+
+# Request bodies are small JSON documents, anything bigger is rejected with 413
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_REQUEST_BYTES', 1024 * 1024))
+# Responses of at least this many bytes are gzipped for clients accepting it, 0 turns it off
+GZIP_MIN_SIZE = int(os.environ.get('GZIP_MIN_SIZE', 1024))
+if GZIP_MIN_SIZE > 0:
+    install_gzip(app, GZIP_MIN_SIZE)
+# Clients sending Accept: application/x-msgpack get MessagePack instead of JSON (see wire_format.py)
+install_msgpack(app)
+
+# Games, challenges and difficulties live in the state store (see state_store.py).
+# 'memory' keeps them in this process; a shared store such as
+# STATE_STORE=sqlite:///state.db lets several worker processes serve them.
+store = open_store(os.environ.get('STATE_STORE', 'memory'))
 
 # Create a global chess board object to represent the current game
-board = chess.Board()
+board = TrackedBoard()
 # A global list to store the move history to be able to undo moves
 move_history = []
 
-difficulties = {
+# With a shared store the single player game is loaded before and saved after
+# every request using it, under a lock held for the whole request, so the
+# workers take turns on it.
+SESSION_ENDPOINTS = {
+    'new_game', 'new_tutorial', 'make_move', 'make_move_white', 'ai_move', 'get_hint', 'undo_move',
+    'legal_moves', 'simulate_move', 'get_game_state', 'get_captured_pieces', 'set_fen',
+    'update_board', 'get_updated_board', 'review_game'
+}
+session_loaded = None  # the stored session this process last loaded or saved
+
+def session_state():
+    return {
+        'root_fen': board.root().fen(),
+        'moves': [move.uci() for move in board.move_stack],
+        'move_history': list(move_history)
+    }
+
+def load_session():
+    global board, move_history, session_loaded
+    state = store.get('session', 'chess')
+    if state is None or state == session_loaded:
+        return
+    board = TrackedBoard(state['root_fen'])
+    for uci in state['moves']:
+        board.push(chess.Move.from_uci(uci))
+    move_history = list(state['move_history'])
+    session_loaded = state
+
+@app.before_request
+def lock_session():
+    if not store.shared or request.endpoint not in SESSION_ENDPOINTS:
+        return
+    g.session_lock = store.locked('session', 'chess')
+    g.session_lock.__enter__()
+    load_session()
+
+@app.after_request
+def save_session(response):
+    global session_loaded
+    if 'session_lock' in g:
+        state = session_state()
+        if state != session_loaded:
+            store.put('session', 'chess', state)
+            session_loaded = state
+    return response
+
+@app.teardown_request
+def unlock_session(error=None):
+    if 'session_lock' in g:
+        g.pop('session_lock').__exit__(None, None, None)
+
+difficulties = StoreMapping(store, 'difficulties')
+for level, settings in {
     "beginner": {"Depth": 3, "Move Overhead": 100, "Skill Level": 5, "UCI_LimitStrength": True, "UCI_Elo": 1320},
-    "intermediate": {"Depth": 6, "Move Overhead": 100, "Skill Level": 15, "UCI_LimitStrength": True, "UCI_Elo": 2000},
+    "intermediate": {"Depth": 6, "Move Overhead": 100, "Skill Level": 15, "UCI_LimitStrength": True, "UCI_Elo": 2000, "Target Latency": 2000},
     "none": {"Skill Level": 0, "Depth": 0},
-    "random1": {"Depth": 6, "Move Overhead": 100, "Skill Level": 20, "UCI_LimitStrength": False, "UCI_Elo": 2500},
-}
+    "random1": {"Depth": 6, "Move Overhead": 100, "Skill Level": 20, "UCI_LimitStrength": False, "UCI_Elo": 2500, "Target Latency": 2000},
+}.items():
+    difficulties.setdefault(level, settings)
+# A difficulty may also set "Target Latency" (ms for the whole AI move) and "Max Nodes",
+# the search limits of each move are then picked by the time manager (see time_manager.py)
+
+# Levels up to this depth are played by the built-in engine, spawning Stockfish for them is pure overhead.
+# A difficulty can force either engine with "Engine": "builtin" / "stockfish".
+BUILTIN_ENGINE_MAX_DEPTH = 3
+BUILTIN_ENGINE_TIME = 0.008         # seconds per move for the low levels
+BUILTIN_ENGINE_FALLBACK_TIME = 1.0  # seconds per move when standing in for a missing Stockfish
+builtin_engine = BuiltinEngine()
+builtin_engine_lock = threading.Lock()
+
+def builtin_engine_move(board, depth, time_limit, skill_level=20):
+    """ Search a move with the in-process engine """
+    with builtin_engine_lock:
+        started = time.perf_counter()
+        move = builtin_engine.play(board, depth, time_limit, skill_level)
+        time_manager.record_search('builtin', builtin_engine.nodes, time.perf_counter() - started)
+        return move
+
+# Stockfish processes are kept running and supervised (see engine_supervisor.py).
+# Each search gets a hard deadline, a wedged or crashed engine is restarted and
+# the request is answered by the built-in engine instead.
+STOCKFISH_POOL_SIZE = int(os.environ.get('STOCKFISH_POOL_SIZE', 2))
+AI_MOVE_DEADLINE = float(os.environ.get('AI_MOVE_DEADLINE', 10))  # seconds, depth limited searches
+SEARCH_DEADLINE_GRACE = 2.0  # seconds on top of a time limited search
+
+# Threads and Hash of the pooled engines are set per search from the cores and
+# memory below and the number of searches running (see core_scheduler.py)
+ENGINE_THREADS = int(os.environ.get('ENGINE_THREADS', os.cpu_count() or 1))
+ENGINE_HASH_MB = int(os.environ.get('ENGINE_HASH_MB', 256))
+core_scheduler = CoreScheduler(ENGINE_THREADS, ENGINE_HASH_MB)
+stockfish_pool = EnginePool('stockfish', STOCKFISH_POOL_SIZE, start_stockfish, stop_stockfish, is_fatal_stockfish_error,
+                            core_scheduler)
+
+# With ENGINE_SERVICE=unix:/path/to/socket or tcp:host:port the AI moves, hints and
+# checkers moves are searched by the engine service all workers share (see
+# engine_service.py) instead of this process' own engines
+ENGINE_SERVICE = os.environ.get('ENGINE_SERVICE')
+engine_service = EngineClient(ENGINE_SERVICE) if ENGINE_SERVICE else None
+
+# Identical searches running at the same time (the same position with the same
+# settings) are done once, the other requests wait for its result
+engine_searches = SingleFlight()
+
+# Engine work takes one of ADMISSION_SLOTS slots, further requests queue by
+# priority (moves, then hints, then background analysis) and are turned away
+# with 503/429 and Retry-After when the queue is full (see admission.py)
+ADMISSION_SLOTS = int(os.environ.get('ADMISSION_SLOTS', max(2, os.cpu_count() or 1)))
+ADMISSION_QUEUE = int(os.environ.get('ADMISSION_QUEUE', 4 * ADMISSION_SLOTS))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 5))  # seconds
+admission = AdmissionControl(ADMISSION_SLOTS, ADMISSION_QUEUE, ADMISSION_QUEUE_TIMEOUT, {
+    'ai_move': RouteLimit(ADMISSION_SLOTS, ADMISSION_QUEUE, MOVE),
+    'checkers_ai_move': RouteLimit(ADMISSION_SLOTS, ADMISSION_QUEUE, MOVE),
+    'hint': RouteLimit(ADMISSION_SLOTS, max(1, ADMISSION_QUEUE // 2), HINT),
+    'review': RouteLimit(max(1, ADMISSION_SLOTS // 2), max(1, ADMISSION_QUEUE // 4), BACKGROUND),
+    'analysis': RouteLimit(max(1, ADMISSION_SLOTS // 2), max(1, ADMISSION_QUEUE // 4), HINT),
+    'challenge_analysis': RouteLimit(1, ADMISSION_QUEUE, BACKGROUND),
+    # Pondering never queues, it only takes a slot that is free right away
+    'ponder': RouteLimit(max(1, ADMISSION_SLOTS // 2), 0, BACKGROUND)
+})
+
+# Budgets of the difficulties with a target latency, shortened by the expected wait for a slot
+time_manager = TimeManager(admission.expected_wait)
+
+# With "ponder": true on /ai_move (or /move with "respond") Stockfish keeps
+# searching the position after the human's expected reply on a spare engine.
+# Foreground searches waiting for an engine or a slot stop it (see ponder.py).
+PONDER_MAX_TIME = float(os.environ.get('PONDER_MAX_TIME', 30))  # seconds
+ponders = PonderManager(stockfish_pool, admission, 'ponder', PONDER_MAX_TIME)
+stockfish_pool.on_busy = ponders.preempt
+admission.on_pressure = ponders.preempt
+
+@app.after_request
+def cancel_stale_ponder(response):
+    # Any other position than the pondered one (or the one before it) ends the ponder
+    if request.endpoint in SESSION_ENDPOINTS:
+        ponders.cancel_unless('chess', board.fen())
+    return response
+
+def admitted(route, search):
+    """ Run search() in an admission slot of the route """
+    with admission.slot(route):
+        return search()
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
 
 
 @app.route('/new_game', methods=['GET'])
@@ -50,13 +234,13 @@ def new_game():
     """
     global board
     global move_history
-    board = chess.Board()  # Reset the board to the starting position
+    board = TrackedBoard()  # Reset the board to the starting position
     move_history = [] # Clear the move history
     return jsonify({
         'message': 'New game started',
         'fen': board.fen(),  # Return the FEN notation for the starting position
         'turn': 'white',
-        'material_balance': material_balance(board)
+        'material_balance': board.material_balance()
     })
 
 @app.route('/new_tutorial', methods=['GET'])
@@ -76,7 +260,7 @@ def new_tutorial():
               type: string
     """
     global board
-    board = chess.Board()  # Reset the board to the starting position
+    board = TrackedBoard()  # Reset the board to the starting position
     board.set_fen("8/8/8/8/8/8/8/R6R w KQkq - 0 1")  
     return jsonify({
         'message': 'New game started',
@@ -84,7 +268,66 @@ def new_tutorial():
         'turn': 'white'
     })
 
-challenges = {}
+challenges = StoreMapping(store, 'challenges')
+
+# Saved challenges are analysed in the background. The solution lines are indexed
+# by position, so /hint and /check_solution answer without starting a search.
+CHALLENGE_ANALYSIS_TIME = float(os.environ.get('CHALLENGE_ANALYSIS_TIME', 1.0))
+challenge_queue = queue.Queue()
+challenge_worker = None
+solution_index = {}  # position key -> best move (UCI)
+solution_index_generation = None  # challenges generation the index was built from
+
+def rebuild_solution_index():
+    global solution_index, solution_index_generation
+    solution_index_generation = store.generation('challenges')
+    index = {}
+    # Request handlers change the challenges meanwhile, work on a copy of each
+    for challenge in list(challenges.values()):
+        analysis = dict(challenge.get('analysis') or {})
+        if analysis.get('status') != 'done':
+            continue
+        line_board = chess.Board(analysis['fen'])
+        for uci in list(analysis['line']):
+            index.setdefault(position_key(line_board), uci)
+            line_board.push(chess.Move.from_uci(uci))
+    solution_index = index
+
+def current_solution_index():
+    """ The solution index, rebuilt when the challenges changed (possibly in another worker) """
+    if solution_index_generation != store.generation('challenges'):
+        rebuild_solution_index()
+    return solution_index
+
+def challenge_analysis_worker():
+    while True:
+        challenge_id, fen = challenge_queue.get()
+        try:
+            # Waits behind the interactive requests, never rejected
+            with admission.slot('challenge_analysis', reject=False):
+                analysis = analyse_challenge(fen, STOCKFISH_PATH, CHALLENGE_ANALYSIS_TIME)
+        except Exception as e:
+            print(f"Error analysing challenge {challenge_id}: {e}")
+            analysis = {'fen': fen, 'status': 'error', 'error': str(e)}
+
+        # The challenge may have been deleted or given a new FEN in the meantime
+        with challenges.locked(challenge_id):
+            challenge = challenges.get(challenge_id)
+            if challenge is not None and challenge['fen'] == fen:
+                challenge['analysis'] = analysis
+                challenges[challenge_id] = challenge
+        challenge_queue.task_done()
+
+def enqueue_challenge_analysis(challenge_id, challenge):
+    """ Save the challenge marked as pending and queue it for the background worker """
+    global challenge_worker
+    fen = challenge['fen']
+    challenge['analysis'] = {'fen': fen, 'status': 'pending'}
+    challenges[challenge_id] = challenge
+    if challenge_worker is None:
+        challenge_worker = threading.Thread(target=challenge_analysis_worker, daemon=True)
+        challenge_worker.start()
+    challenge_queue.put((challenge_id, fen))
 
 @app.route('/save_challenge', methods=['POST'])
 def save_challenge():
@@ -99,7 +342,7 @@ def save_challenge():
     if not fen:
         return jsonify({'error': 'FEN string is required'}), 400
 
-    challenges[challenge_id] = {'fen': fen, 'name': name}
+    enqueue_challenge_analysis(challenge_id, {'fen': fen, 'name': name})
     return jsonify({'message': 'Challenge saved', 'challenge_id': challenge_id}), 201
 
 @app.route('/get_challenges', methods=['GET'])
@@ -107,7 +350,7 @@ def get_challenges():
     """
     Get all saved challenges
     """
-    return jsonify({'challenges': challenges}), 200
+    return jsonify({'challenges': dict(challenges.items())}), 200
 
 @app.route('/delete_challenge/<challenge_id>', methods=['DELETE'])
 def delete_challenge(challenge_id):
@@ -169,12 +412,78 @@ def update_challenge(challenge_id):
     if not fen:
         return jsonify({'error': 'FEN string is required'}), 400
 
-    if challenge_id not in challenges:
-        return jsonify({'error': 'Challenge not found'}), 404
+    with challenges.locked(challenge_id):
+        previous = challenges.get(challenge_id)
+        if previous is None:
+            return jsonify({'error': 'Challenge not found'}), 404
 
-    challenges[challenge_id] = {'fen': fen, 'name': name}
+        challenge = {'fen': fen, 'name': name}
+        # Only a changed position needs a new analysis
+        if previous['fen'] == fen and 'analysis' in previous:
+            challenge['analysis'] = previous['analysis']
+            challenges[challenge_id] = challenge
+        else:
+            enqueue_challenge_analysis(challenge_id, challenge)
     return jsonify({'message': 'Challenge updated', 'challenge_id': challenge_id}), 200
 
+@app.route('/check_solution', methods=['POST'])
+def check_solution():
+    """
+    Check moves played in a challenge against its precomputed solution line
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            challenge_id:
+              type: string
+            moves:
+              type: array
+              items:
+                type: string
+              description: Moves played so far in UCI format, both sides
+    responses:
+      200:
+        description: How far the moves follow the solution
+      400:
+        description: Missing challenge_id or invalid moves
+      404:
+        description: Challenge not found
+      409:
+        description: The solution is not computed yet
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('challenge_id'):
+        return jsonify({'error': 'challenge_id is required'}), 400
+    moves = data.get('moves', [])
+    if not isinstance(moves, list):
+        return jsonify({'error': 'moves must be a list of UCI moves'}), 400
+    challenge = challenges.get(data['challenge_id'])
+
+    if not challenge:
+        return jsonify({'error': 'Challenge not found'}), 404
+
+    analysis = challenge.get('analysis', {})
+    if analysis.get('status') != 'done':
+        return jsonify({'error': 'Solution not ready', 'status': analysis.get('status')}), 409
+
+    line = analysis['line']
+    matched = 0
+    while matched < len(moves) and matched < len(line) and moves[matched] == line[matched]:
+        matched += 1
+
+    return jsonify({
+        'correct': matched == len(moves),
+        'matched': matched,
+        'complete': matched == len(line),
+        'next_move': line[matched] if matched < len(line) else None,
+        'eval': analysis['eval'],
+        'difficulty': analysis['difficulty']
+    }), 200
+
 
 @app.route('/move', methods=['POST'])
 def make_move():
@@ -192,9 +501,21 @@ def make_move():
           properties:
             move:
               type: string
+            respond:
+              type: string
+              description: Difficulty level of an AI reply made in the same request
+            ponder:
+              type: boolean
+              description: Keep searching the expected next position after the AI reply
+            include:
+              type: array
+              items:
+                type: string
+                enum: [captured_pieces, legal_moves]
+              description: Extra data about the resulting position to return
     responses:
       200:
-        description: The move is accepted and the game state is updated
+        description: The move (and the AI reply) is accepted and the game state is updated
         schema:
           type: object
           properties:
@@ -206,11 +527,32 @@ def make_move():
               type: boolean
             turn:
               type: string
+            ai_move:
+              type: string
+              description: The AI reply in UCI format, with its from and to squares
+            ai_error:
+              type: string
+              description: Why the AI could not reply, the human move still stands
+            captured_pieces:
+              type: object
+            legal_moves:
+              type: object
+              description: Target squares keyed by the square of each movable piece
       400:
-        description: Invalid move
+        description: Invalid move or difficulty level
     """
     global board
-    move_uci = request.json.get('move')  # The move in UCI format (e.g., "e2e4")
+    data = request.json
+    move_uci = data.get('move')  # The move in UCI format (e.g., "e2e4")
+    include = data.get('include', [])
+
+    # Move and respond: the AI's reply comes back with the move in one round trip
+    respond = data.get('respond')
+    settings = None
+    if respond is not None:
+        settings = difficulties.get(respond)
+        if settings is None:
+            return jsonify({'error': 'Invalid difficulty level'}), 400
 
     try:
         move = chess.Move.from_uci(move_uci)  # Parse the UCI move
@@ -221,6 +563,21 @@ def make_move():
             return jsonify({'error': 'Illegal move'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 400
+
+    reply = {}
+    if settings is not None and not board.is_game_over():
+        try:
+            ai_move = choose_ai_move(respond, settings, data.get('ponder', False))
+            board.push(ai_move)
+            reply = {
+                'ai_move': ai_move.uci(),
+                'from': chess.square_name(ai_move.from_square),
+                'to': chess.square_name(ai_move.to_square)
+            }
+        except Overloaded as e:
+            reply = {'ai_error': str(e), 'retry_after': e.retry_after}
+        except Exception as e:
+            reply = {'ai_error': str(e)}
     
         # Determine check_square position in case of checkmate
     check_square = None
@@ -228,15 +585,25 @@ def make_move():
         check_square = chess.square_name(board.king(board.turn))  # Set check_square to the king's position
         print(f"Checkmate detected. Check square: {check_square}")
     # Return the updated board state
-    return jsonify({
+    response = {
         'fen': board.fen(),  # Updated board position in FEN format
         'is_checkmate': board.is_checkmate(),
         'is_stalemate': board.is_stalemate(),
         'turn': 'white' if board.turn == chess.WHITE else 'black',
         'is_check': board.is_check(),
         'check_square': check_square,
-        'material_balance': material_balance(board)
-    })
+        'material_balance': board.material_balance(),
+        **reply
+    }
+    if 'captured_pieces' in include:
+        response['captured_pieces'] = board.captured_pieces()
+    if 'legal_moves' in include:
+        response['legal_moves'] = legal_move_map(board)
+    if wants_msgpack():
+        response['board'] = pack_chess_fen(response.pop('fen'))
+        if 'legal_moves' in include:
+            response['legal_moves'] = pack_legal_moves(board)
+    return jsonify(response)
 
 @app.route('/undo_move', methods=['POST'])
 def undo_move():
@@ -286,7 +653,7 @@ def make_move_white():
         'is_stalemate': board.is_stalemate(),
         'turn': 'white',
         'is_check': board.is_check(),
-        'material_balance': material_balance(board)
+        'material_balance': board.material_balance()
     })
 
 @app.route('/set_fen', methods=['POST'])
@@ -307,7 +674,7 @@ def set_fen():
         'is_stalemate': board.is_stalemate(),
         'turn': 'white' if board.turn == chess.WHITE else 'black',
         'is_check': board.is_check(),
-        'material_balance': material_balance(board)
+        'material_balance': board.material_balance()
     })
 
 @app.route('/simulate_move', methods=['POST'])
@@ -381,13 +748,14 @@ def get_game_state():
         'is_checkmate': board.is_checkmate(),
         'is_stalemate': board.is_stalemate(),
         'turn': 'white' if board.turn == chess.WHITE else 'black',
-        'material_balance': material_balance(board)
+        'material_balance': board.material_balance()
     })
 
 @app.route('/ai_move', methods=['POST'])
 def ai_move():
     """
     AI move endpoint which takes skill level and depth as parameters.
+    With "ponder": true the engine goes on searching the expected next position.
     """
     global board, move_history
     data = request.get_json()
@@ -396,38 +764,121 @@ def ai_move():
     if level not in difficulties:
         return jsonify({'error': 'Invalid difficulty level'}), 400
     
-    depth = difficulties[level].get('Depth', 3)
-    move_overhead = difficulties[level].get('Move Overhead', 100)
-    skill_level = difficulties[level].get('Skill Level', 0)
-    uci_limit_strength = difficulties[level].get('UCI_LimitStrength', False)
-    uci_elo = difficulties[level].get('UCI_Elo', 0)
-
     try:
-        with chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH) as engine:
-            # Configure Stockfish with provided skill level
-            engine.configure({"Skill Level": skill_level})
-            engine.configure({"Move Overhead": move_overhead})
-            engine.configure({"UCI_LimitStrength": uci_limit_strength})
-            engine.configure({"UCI_Elo": uci_elo})
-            
-            # Generate the move with specified depth
-            limit = chess.engine.Limit(depth=depth)
-            ai_move = engine.play(board, limit)
-            board.push(ai_move.move)
+        move = choose_ai_move(level, difficulties[level], data.get('ponder', False))
+        board.push(move)
 
-            return jsonify({
-                'fen': board.fen(),
-                'ai_move': ai_move.move.uci(),
-                'is_checkmate': board.is_checkmate(),
-                'is_stalemate': board.is_stalemate(),
-                'turn': 'white' if board.turn == chess.WHITE else 'black',
-                'from': chess.square_name(ai_move.move.from_square),
-                'to': chess.square_name(ai_move.move.to_square),
-                'material_balance': material_balance(board),
-            })
+        return jsonify({
+            'fen': board.fen(),
+            'ai_move': move.uci(),
+            'is_checkmate': board.is_checkmate(),
+            'is_stalemate': board.is_stalemate(),
+            'turn': 'white' if board.turn == chess.WHITE else 'black',
+            'from': chess.square_name(move.from_square),
+            'to': chess.square_name(move.to_square),
+            'material_balance': board.material_balance(),
+        })
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def choose_ai_move(level, settings, ponder=False):
+    """ The engine's move on the single player board with a difficulty's settings """
+    target = settings.get('Target Latency')
+    if not target:
+        return search_ai_move(level, settings, None, ponder)
+    started = time.perf_counter()
+    try:
+        return search_ai_move(level, settings, target, ponder)
+    finally:
+        time_manager.record_latency(('chess', level), time.perf_counter() - started)
+
+def search_ai_move(level, settings, target, ponder=False):
+    # A target latency takes the place of the default depth
+    depth = settings.get('Depth', None if target else 3)
+    move_overhead = settings.get('Move Overhead', 100)
+    skill_level = settings.get('Skill Level', 0)
+    uci_limit_strength = settings.get('UCI_LimitStrength', False)
+    uci_elo = settings.get('UCI_Elo', 0)
+
+    engine_choice = settings.get('Engine')
+    shallow = depth is not None and depth <= BUILTIN_ENGINE_MAX_DEPTH
+    use_builtin = engine_choice == 'builtin' or (engine_choice != 'stockfish' and shallow)
+
+    if use_builtin or not (engine_service or stockfish_available()):
+        time_limit = BUILTIN_ENGINE_TIME if shallow else BUILTIN_ENGINE_FALLBACK_TIME
+        if target:
+            time_limit = time_manager.budget(('chess', level), target, engine='builtin').time
+        with admission.slot('ai_move'):
+            return builtin_engine_move(board, depth or 64, time_limit, skill_level)
+
+    # Configure Stockfish with provided skill level
+    options = {
+        "Skill Level": skill_level,
+        "Move Overhead": move_overhead,
+        "UCI_LimitStrength": uci_limit_strength,
+        "UCI_Elo": uci_elo
+    }
+    search_board = board.copy()
+    search = (depth, tuple(sorted(options.items())))
+    get_budget = lambda: time_manager.budget(('chess', level), target, settings.get('Max Nodes'), 'stockfish') if target else None
+    budget = get_budget()
+    limit, deadline = stockfish_limit(depth, budget)
+
+    # A ponder on this position answers at once, or as soon as it is done
+    result = ponders.take('chess', search, search_board.fen(), deadline)
+    if result is None:
+        result = engine_searches.do(('ai_move', search_board.fen()) + search,
+                                    lambda: admitted('ai_move', lambda: stockfish_move(search_board, limit, deadline, options, skill_level)))
+    move, expected = result
+
+    # Pondering needs an engine of this process, with the engine service there is none to spare
+    if ponder and expected is not None and engine_service is None:
+        search_board.push(move)
+        limit, _ = stockfish_limit(depth, get_budget())
+        ponders.start('chess', search, search_board, expected, limit, options, SEARCH_DEADLINE_GRACE)
+    return move
+
+def stockfish_limit(depth, budget):
+    """ Search limit and hard deadline of an AI move at the given depth or budget """
+    if budget is None:
+        return chess.engine.Limit(depth=depth), AI_MOVE_DEADLINE
+    return chess.engine.Limit(depth=depth, time=budget.time, nodes=budget.nodes), budget.time + SEARCH_DEADLINE_GRACE
+
+def stockfish_move(search_board, limit, deadline, options, skill_level):
+    """ Stockfish's move and the reply it expects (None if unknown), the built-in engine stands in when it fails """
+    def play(engine):
+        result = engine.play(search_board, limit, options=options, info=chess.engine.INFO_BASIC)
+        time_manager.record_search('stockfish', result.info.get('nodes'), result.info.get('time', 0))
+        return result.move, result.ponder
+
+    try:
+        if engine_service is not None:
+            move, expected, info = engine_service.chess_move(search_board, limit, options, deadline)
+            time_manager.record_search('stockfish', info['nodes'], info['time'])
+            return move, expected
+        return stockfish_pool.run(play, deadline)
+    except (EngineUnavailable, EngineTimeout) as e:
+        print(f"Warning: Stockfish failed ({e}), using the built-in engine")
+        time_limit = BUILTIN_ENGINE_FALLBACK_TIME if limit.time is None else limit.time
+        return builtin_engine_move(search_board, limit.depth or 64, time_limit, skill_level), None
+
+def hint_move(search_board):
+    best_move = None
+    if engine_service is not None or stockfish_available():
+        limit = chess.engine.Limit(time=0.1)  # or use depth
+        try:
+            if engine_service is not None:
+                best_move = engine_service.chess_hint(search_board, limit.time, limit.time + SEARCH_DEADLINE_GRACE)
+            else:
+                best_move = stockfish_pool.run(lambda engine: engine.play(search_board, limit).move, 0.1 + SEARCH_DEADLINE_GRACE)
+        except (EngineUnavailable, EngineTimeout) as e:
+            print(f"Warning: Stockfish failed ({e}), using the built-in engine")
+    if best_move is None:
+        best_move = builtin_engine_move(search_board, 8, 0.1)
+    return best_move.uci()
+
 @app.route('/hint', methods=['POST'])
 def get_hint():
     """
@@ -447,17 +898,30 @@ def get_hint():
               example: "Best move suggestion."
       500:
         description: Error processing the hint request.
+      503:
+        description: Too many engine requests, retry after the Retry-After header's seconds
     """
     global board
 
+    # Positions on a challenge's solution line are answered from the stored analysis
+    solution_move = current_solution_index().get(position_key(board))
+    if solution_move is not None:
+        return jsonify({
+            'move': solution_move,
+            'message': 'Best move suggestion.'
+        })
+
     try:
-        with chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH) as engine:
-            result = engine.play(board, chess.engine.Limit(time=0.1))  # or use depth
-            best_move = result.move.uci()
-            return jsonify({
-                'move': best_move,
-                'message': 'Best move suggestion.'
-            })
+        # Everyone asking for a hint on the same position shares one search
+        search_board = board.copy()
+        best_move = engine_searches.do(('hint', position_key(search_board)), lambda: admitted('hint', lambda: hint_move(search_board)))
+
+        return jsonify({
+            'move': best_move,
+            'message': 'Best move suggestion.'
+        })
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -509,17 +973,16 @@ def legal_moves():
         'legal_moves': legal_moves
     })
 
-# source: https://github.com/niklasf/python-chess/discussions/864
-def material_balance(board):
-    white = board.occupied_co[chess.WHITE]
-    black = board.occupied_co[chess.BLACK]
-    return (
-        chess.popcount(white & board.pawns) - chess.popcount(black & board.pawns) +
-        3 * (chess.popcount(white & board.knights) - chess.popcount(black & board.knights)) +
-        3 * (chess.popcount(white & board.bishops) - chess.popcount(black & board.bishops)) +
-        5 * (chess.popcount(white & board.rooks) - chess.popcount(black & board.rooks)) +
-        9 * (chess.popcount(white & board.queens) - chess.popcount(black & board.queens))
-    )
+def legal_move_map(board):
+    """ Target squares of every movable piece of the side to move, keyed by its square """
+    moves = {}
+    for move in board.legal_moves:
+        targets = moves.setdefault(chess.square_name(move.from_square), [])
+        target = chess.square_name(move.to_square)
+        # The four promotions of a pawn share one target square
+        if target not in targets:
+            targets.append(target)
+    return moves
 
 @app.route('/captured_pieces', methods=['GET'])
 def get_captured_pieces():
@@ -560,39 +1023,297 @@ def get_captured_pieces():
                   type: integer
     """
     global board
-    starting_pieces = Counter({
-        chess.PAWN: 8,
-        chess.KNIGHT: 2,
-        chess.BISHOP: 2,
-        chess.ROOK: 2,
-        chess.QUEEN: 1,
-        chess.KING: 1
-    })
+    # Kept up to date on every move by the board itself
+    return jsonify(board.captured_pieces())
+
+# Live analysis
+
+ANALYSIS_ENGINES = int(os.environ.get('ANALYSIS_ENGINES', 2))  # games analysed at the same time
+ANALYSIS_IDLE_TIMEOUT = float(os.environ.get('ANALYSIS_IDLE_TIMEOUT', 120))  # seconds an unused engine is kept
+ANALYSIS_MAX_TIME = float(os.environ.get('ANALYSIS_MAX_TIME', 30))  # longest analysis in seconds
+ANALYSIS_MAX_MULTIPV = 5
+
+def start_analysis_engine():
+    if stockfish_available():
+        try:
+            return start_stockfish()
+        except Exception as e:
+            print(f"Warning: Stockfish failed to start ({e}), analysing with the built-in engine")
+    return BuiltinEngine()
+
+def stop_analysis_engine(engine):
+    if not isinstance(engine, BuiltinEngine):
+        stop_stockfish(engine)
+
+analysis_engines = AnalysisEngines(start_analysis_engine, stop_analysis_engine, ANALYSIS_ENGINES, ANALYSIS_IDLE_TIMEOUT)
+
+def analysed_board(game_id):
+    """ Copy of the multiplayer game's board, or of the single player board; None for an unknown game """
+    if game_id is not None:
+        game = games.get(game_id)
+        return None if game is None else game.board.copy()
+    if store.shared:
+        # Read only, the stream must not hold the session lock
+        state = store.get('session', 'chess')
+        if state is not None:
+            session_board = chess.Board(state['root_fen'])
+            for uci in state['moves']:
+                session_board.push(chess.Move.from_uci(uci))
+            return session_board
+    return board.copy()
+
+@app.route('/analysis', methods=['GET'])
+def live_analysis():
+    """
+    Analyse the current position, streaming the engine's lines as server-sent events while the search deepens
+    ---
+    parameters:
+      - name: game_id
+        in: query
+        type: string
+        required: false
+        description: Multiplayer game to analyse, the single player game when omitted
+      - name: multipv
+        in: query
+        type: integer
+        required: false
+        description: Number of lines, 1 to 5 (default 3)
+      - name: time
+        in: query
+        type: number
+        required: false
+        description: Seconds to analyse, at most ANALYSIS_MAX_TIME
+      - name: depth
+        in: query
+        type: integer
+        required: false
+        description: Depth to stop at
+    responses:
+      200:
+        description: >
+          text/event-stream of 'info' events (depth, multipv, score in centipawns for white, mate, pv in UCI)
+          closed by an 'end' event with the reason (done, position_changed, superseded) or an 'error' event.
+          The analysis stops when the client disconnects or the position changes.
+      400:
+        description: Invalid game or the game is over
+      503:
+        description: Every analysis engine is busy
+    """
+    game_id = request.args.get('game_id')
+    multipv = min(max(request.args.get('multipv', 3, type=int), 1), ANALYSIS_MAX_MULTIPV)
+    analysis_time = min(request.args.get('time', ANALYSIS_MAX_TIME, type=float), ANALYSIS_MAX_TIME)
+    depth = request.args.get('depth', type=int)
 
-    # Count remaining pieces on the board, grouped by type
-    remaining_white = Counter(piece.piece_type for piece in board.piece_map().values() if piece.color == chess.WHITE)
-    remaining_black = Counter(piece.piece_type for piece in board.piece_map().values() if piece.color == chess.BLACK)
+    search_board = analysed_board(game_id)
+    if search_board is None:
+        return jsonify({'error': 'Game ID not found'}), 400
+    if search_board.is_game_over():
+        return jsonify({'error': 'Game is over'}), 400
+    key = position_key(search_board)
 
-    # Calculate captured pieces
-    captured_white = starting_pieces - remaining_black
-    captured_black = starting_pieces - remaining_white
+    def position_changed():
+        current = analysed_board(game_id)
+        return current is None or position_key(current) != key
 
-    # Format the output as a dictionary
-    def format_captured(captured):
-        return {
-            'p': captured[chess.PAWN],
-            'n': captured[chess.KNIGHT],
-            'b': captured[chess.BISHOP],
-            'r': captured[chess.ROOK],
-            'q': captured[chess.QUEEN]
-        }
+    # Taking the session stops an analysis still running for the game, freeing its slot
+    try:
+        session, generation = analysis_engines.acquire(game_id or 'single player')
+    except EngineUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    try:
+        started = admission.acquire('analysis')
+    except Overloaded:
+        analysis_engines.release(session)
+        raise
+
+    events = analyse(analysis_engines, session, generation, search_board, multipv,
+                     chess.engine.Limit(time=analysis_time, depth=depth), position_changed)
+
+    def stream():
+        for event, data in events:
+            yield ': keep-alive\n\n' if event is None else f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+    def closed():
+        # Stops the search if the client left before the end
+        events.close()
+        analysis_engines.release(session)
+        admission.release('analysis', started)
+
+    response = Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(closed)
+    return response
+
+# Game review
+
+REVIEW_WORKERS = int(os.environ.get('REVIEW_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+REVIEW_TIME = float(os.environ.get('REVIEW_TIME', 0.2))  # seconds per position
+review_pool = None
+review_pool_lock = threading.Lock()
+
+def get_review_pool():
+    """ Create the review worker pool on first use """
+    global review_pool
+    with review_pool_lock:
+        if review_pool is None:
+            review_pool = ReviewPool(STOCKFISH_PATH, REVIEW_WORKERS, REVIEW_TIME)
+        return review_pool
+
+@app.route('/review', methods=['POST'])
+def review_game():
+    """
+    Review a finished game, streaming one JSON line per ply as it is evaluated
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: false
+        schema:
+          type: object
+          properties:
+            game_id:
+              type: string
+              description: Multiplayer game to review
+            fen:
+              type: string
+              description: Starting position when reviewing a list of moves
+            moves:
+              type: array
+              items:
+                type: string
+              description: Moves in UCI format, defaults to the single player game
+    responses:
+      200:
+        description: Newline delimited JSON, one object per ply (ply, move, san, color, eval, best_move, loss, classification)
+      400:
+        description: Invalid game
+      429:
+        description: Too many reviews queued, retry after the Retry-After header's seconds
+    """
+    data = request.get_json(silent=True) or {}
+    game_id = data.get('game_id')
+
+    if game_id is not None:
+        game = games.get(game_id) or archived_game(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
+        root_fen = game.root()
+        moves = game.uci_moves()
+    elif 'moves' in data:
+        root_fen = data.get('fen', chess.STARTING_FEN)
+        moves = data['moves']
+    else:
+        root_fen = board.root().fen()
+        moves = [move.uci() for move in board.move_stack]
+
+    # Validate the whole game up front, the stream can't report a 400 anymore
+    try:
+        check_board = chess.Board(root_fen)
+        for uci in moves:
+            move = chess.Move.from_uci(uci)
+            if move not in check_board.legal_moves:
+                return jsonify({'error': f'Illegal move {uci}'}), 400
+            check_board.push(move)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
+    # The slot is held until the stream is done
+    started = admission.acquire('review')
+    try:
+        results = get_review_pool().review(root_fen, moves)
+    except Exception:
+        admission.release('review', started)
+        raise
+    response = Response((json.dumps(result) + '\n' for result in results), mimetype='application/x-ndjson')
+    response.call_on_close(lambda: admission.release('review', started))
+    return response
+
+games = StoreMapping(store, 'games', GameRecord.to_dict, GameRecord.from_dict)
+
+# Multiplayer games idle for longer than this are dehydrated to their packed moves
+GAME_DEHYDRATE_AFTER = float(os.environ.get('GAME_DEHYDRATE_AFTER', 300))  # seconds
+GAME_SWEEP_INTERVAL = 30  # seconds
+last_game_sweep = time.monotonic()
+
+# Finished games are moved out of the store into an append-only compressed
+# archive (see game_archive.py) a while after they ended, so the lobby and the
+# sweeps only walk live games. Their final state stays available from there.
+GAME_ARCHIVE_DIR = os.environ.get('GAME_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+GAME_ARCHIVE_AFTER = float(os.environ.get('GAME_ARCHIVE_AFTER', 120))  # seconds after the end
+game_archive = GameArchive(GAME_ARCHIVE_DIR)
+
+def game_result(game):
+    """ (result, termination) of a finished game, e.g. ('1-0', 'checkmate') or ('1/2-1/2', 'time') """
+    if game.clock is not None and game.clock.flagged:
+        if clock_state(game)['result'] == 'draw':
+            return '1/2-1/2', 'time'
+        return '0-1' if game.clock.flagged == 'white' else '1-0', 'time'
+    outcome = game.board.outcome()
+    if outcome is None:
+        return '*', 'unterminated'
+    return outcome.result(), outcome.termination.name.lower()
+
+def archive_record(game_id, game):
+    result, termination = game_result(game)
+    finished_at = datetime.datetime.fromtimestamp(game.finished_at, datetime.timezone.utc)
     return {
-        'white': format_captured(captured_white),
-        'black': format_captured(captured_black)
+        'game_id': game_id,
+        'finished_at': finished_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'result': result,
+        'termination': termination,
+        'plies': len(game.moves),
+        'game': game.to_dict()
     }
 
-games = {}
+def archive_finished_games():
+    """ Move the games that ended more than GAME_ARCHIVE_AFTER ago to the archive, returns how many """
+    cutoff = time.time() - GAME_ARCHIVE_AFTER
+    # Games that ended before their end was recorded count as long finished
+    finished = [game_id for game_id, game in games.items() if game.is_game_over and (game.finished_at or 0) < cutoff]
+    archived = 0
+    for game_id in finished:
+        with games.locked(game_id):
+            game = games.get(game_id)
+            if game is None:
+                continue  # archived by another worker
+            if game.finished_at is None:
+                game.finished_at = time.time()
+            try:
+                game_archive.append(game_id, archive_record(game_id, game), game.finished_at)
+            except OSError as e:
+                print(f"Warning: could not archive finished games ({e})")
+                break
+            del games[game_id]
+            watch_flag(game_id, None)
+            archived += 1
+    return archived
+
+def archived_game(game_id):
+    """ The GameRecord of an archived game, None when it is not archived """
+    record = game_archive.get(game_id) if game_id else None
+    return None if record is None else GameRecord.from_dict(record['game'])
+
+def dehydrate_idle_games():
+    """ Drop the cached boards of idle games, returns how many were dehydrated """
+    if store.shared:
+        return 0  # a shared store only keeps dehydrated games
+    now = time.monotonic()
+    dehydrated = 0
+    for game in list(games.values()):
+        if not game.is_dehydrated and game.idle_for(now) > GAME_DEHYDRATE_AFTER:
+            game.dehydrate()
+            dehydrated += 1
+    return dehydrated
+
+@app.before_request
+def sweep_idle_games():
+    global last_game_sweep
+    now = time.monotonic()
+    if now - last_game_sweep > GAME_SWEEP_INTERVAL:
+        last_game_sweep = now
+        dehydrate_idle_games()
+        archive_finished_games()
+        evict_idle_checkers_games()
+        analysis_engines.close_idle()
 
 def get_local_ip():
     hostname = socket.gethostname()
@@ -605,18 +1326,100 @@ def get_ip():
     local_ip = get_local_ip()
     return jsonify({'ip': local_ip})
 
-def create_new_game():
-    """ Helper function to create a new chess board """
-    return {
-        'board': chess.Board(),
-        'players': {
-            'white': None,
-            'black': None
-        },
-        'move_history': [],
-        'game_name': 'Untitled Game',
-        'theme': 'regular'        
-    }
+# Multiplayer games created with a time control have server side clocks. One
+# timer wheel watches the flags of all running clocks (see timer_wheel.py), a
+# game whose side to move ran out of time is over without anyone polling it.
+CLOCK_TICK = float(os.environ.get('CLOCK_TICK', 0.1))  # seconds
+clock_wheel = TimerWheel(CLOCK_TICK, 'clock-wheel')
+clock_timers = {}  # game id -> flag timer of its running clock in this process
+
+def watch_flag(game_id, clock):
+    """ (Re)arm the flag timer of a game after its clock changed """
+    timer = clock_timers.pop(game_id, None)
+    if timer is not None:
+        clock_wheel.cancel(timer)
+    deadline = clock.deadline() if clock is not None else None
+    if deadline is not None:
+        clock_timers[game_id] = clock_wheel.schedule((deadline - now_ms()) / 1000, lambda: flag_fall(game_id))
+
+def flag_fall(game_id):
+    with games.locked(game_id):
+        game = games.get(game_id)
+        if game is None or game.clock is None or game.clock.running is None:
+            return
+        if game.clock.check_flag() is None:
+            # Another worker pressed the clock in the meantime
+            watch_flag(game_id, game.clock)
+            return
+        clock_timers.pop(game_id, None)
+        game.finish()
+        games[game_id] = game
+
+def clock_state(game):
+    """ The clock of a game for the responses, with the result once a flag fell """
+    if game.clock is None:
+        return None
+    state = game.clock.state()
+    if game.clock.flagged:
+        winner = 'black' if game.clock.flagged == 'white' else 'white'
+        # Running out of time against a lone king (or too little to mate with) is a draw
+        can_mate = not game.board.has_insufficient_material(chess.WHITE if winner == 'white' else chess.BLACK)
+        state['result'] = f'{winner} wins on time' if can_mate else 'draw'
+    return state
+
+# Players may queue moves while the opponent thinks, they are played the moment
+# the opponent's move lands instead of after the next poll
+PREMOVE_LIMIT = 8  # queued moves per player
+
+def play_move(game, move):
+    """ Push a legal move of the side to move and run the clock """
+    game.push(move)  # also records the move for the history
+    if game.board.is_checkmate():
+        game.is_complete = True
+    clock = game.clock
+    if clock is not None and clock.running is not None:
+        if game.is_game_over:
+            clock.stop()
+        else:
+            clock.press()
+
+def apply_premoves(game):
+    """
+    Play the queued moves of the side to move, turn after turn, as long as
+    there are any. Returns the moves played and the ones cancelled: an illegal
+    premove drops the rest of that player's queue, which was planned on top of it.
+    """
+    applied = []
+    cancelled = []
+    while not game.is_game_over:
+        queued = game.premoves['white' if game.board.turn == chess.WHITE else 'black']
+        if not queued:
+            break
+        move = chess.Move.from_uci(queued.pop(0))
+        if move not in game.board.legal_moves:
+            cancelled += [move.uci()] + queued
+            queued.clear()
+            continue
+        play_move(game, move)
+        applied.append(move.uci())
+    if game.is_game_over:
+        for queued in game.premoves.values():
+            cancelled += queued
+            queued.clear()
+    return applied, cancelled
+
+def requesting_color(game, requested=None):
+    """ The color the requesting player plays, the waiting side when they play both """
+    colors = [color for color, player in game.players.items() if player == request.remote_addr]
+    if requested is not None:
+        return requested if requested in colors else None
+    if len(colors) == 2:
+        return 'black' if game.board.turn == chess.WHITE else 'white'
+    return colors[0] if colors else None
+
+def create_new_game(game_name='Untitled Game', theme='regular'):
+    """ Helper function to create a new multiplayer game record """
+    return GameRecord(game_name=game_name, theme=theme)
 
 @app.route('/multiplayer/create', methods=['POST'])
 def create_game():
@@ -635,23 +1438,39 @@ def create_game():
               type: string
             message:
               type: string
+      400:
+        description: Invalid time control
     """
     data = request.get_json()
     game_name = data.get('game_name', 'Untitled Game')
     theme = data.get('theme', 'regular')
 
+    # Optional time control, {"base": seconds, "increment": seconds per move}
+    time_control = data.get('time_control')
+    clock = None
+    if time_control is not None:
+        try:
+            base = float(time_control['base'])
+            increment = float(time_control.get('increment', 0))
+        except (TypeError, KeyError, ValueError, AttributeError):
+            return jsonify({'error': 'Invalid time control'}), 400
+        if base <= 0 or increment < 0:
+            return jsonify({'error': 'Invalid time control'}), 400
+        clock = GameClock(int(base * 1000), int(increment * 1000))
+
     game_id = str(uuid.uuid4())[:8] # Generate a unique game ID
-    games[game_id] = create_new_game()  # Create a new game instance
-    games[game_id]['game_name'] = game_name # Set the game name
-    games[game_id]['theme'] = theme # Set the theme
+    game = create_new_game(game_name, theme)  # Create a new game instance
+    game.clock = clock
+    games[game_id] = game
 
     return jsonify({
         'message': 'Game created',
         'game_id': game_id,
-        'fen': games[game_id]['board'].fen(),
+        'fen': game.board.fen(),
         'turn': 'white',
         'game_name': game_name,
-        'theme': theme
+        'theme': theme,
+        'clock': clock_state(game)
     })
 
 @app.route('/multiplayer/join', methods=['POST'])
@@ -700,20 +1519,31 @@ def join_game():
     game_id = data.get('game_id')
     player_color = data.get('player')
 
-    if game_id not in games:
-        return jsonify({'error': 'Game ID not found'}), 400
     if player_color not in ['white', 'black']:
         return jsonify({'error': 'Invalid player color'}), 400
-    if games[game_id]['players'][player_color]:
-        return jsonify({'error': f'{player_color} is already taken'}), 400
 
-    # Assign the player to the chosen color (using IP as player identity)
-    games[game_id]['players'][player_color] = request.remote_addr
+    with games.locked(game_id):
+        game = games.get(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
+        if game.players[player_color]:
+            return jsonify({'error': f'{player_color} is already taken'}), 400
+
+        # Assign the player to the chosen color (using IP as player identity)
+        game.set_player(player_color, request.remote_addr)
+        # The clock starts once both seats are taken
+        clock = game.clock
+        if clock is not None and clock.running is None and not clock.flagged and not game.is_game_over \
+                and game.white and game.black:
+            clock.start('white' if game.board.turn == chess.WHITE else 'black')
+            watch_flag(game_id, clock)
+        games[game_id] = game
 
     return jsonify({
         'message': f'You joined as {player_color}',
         'game_id': game_id,
-        'players': games[game_id]['players']
+        'players': game.players,
+        'clock': clock_state(game)
     })
 
 @app.route('/multiplayer/move', methods=['POST'])
@@ -725,38 +1555,48 @@ def move_multiplayer():
     if not game_id or not move_uci:
         return jsonify({'error': 'game_id and move are required'}), 400
 
-    if game_id not in games:
-        return jsonify({'error': 'Game ID not found'}), 400
-
-    # Get the game and board from the global games dictionary
-    game = games[game_id]
-    board = game['board']
-    current_turn = 'white' if board.turn == chess.WHITE else 'black'
-
-    player_ip = request.remote_addr
-    if game['players'][current_turn] != player_ip:
-        return jsonify({'error': 'It is not your turn'}), 400
-
-    try:
-        move = chess.Move.from_uci(move_uci)
-        if move in board.legal_moves:
-            board.push(move)
-            player_color = current_turn.capitalize()  # "White" or "Black"
-            from_square = chess.square_name(move.from_square)
-            to_square = chess.square_name(move.to_square)
-            game['move_history'].append(f"{player_color}: {from_square} to {to_square}")
+    # Moves of one game are serialized, also across worker processes
+    with games.locked(game_id):
+        # Get the game and board from the global games dictionary
+        game = games.get(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
+        board = game.board
+        current_turn = 'white' if board.turn == chess.WHITE else 'black'
+
+        player_ip = request.remote_addr
+        if game.players[current_turn] != player_ip:
+            return jsonify({'error': 'It is not your turn'}), 400
+
+        # A move after the flag fell does not count, even when the timer has not fired yet
+        clock = game.clock
+        if clock is not None and (clock.flagged or clock.check_flag()):
+            game.finish()
+            games[game_id] = game
+            watch_flag(game_id, None)
+            return jsonify({'error': 'Time is up', 'clock': clock_state(game)}), 400
+
+        try:
+            move = chess.Move.from_uci(move_uci)
+            if move in board.legal_moves:
+                play_move(game, move)
+            else:
+                return jsonify({'error': 'Illegal move'}), 400
+            
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
 
-        else:
-            return jsonify({'error': 'Illegal move'}), 400
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        # The opponent's premoves answer in the same step
+        applied, cancelled = apply_premoves(game)
+        if clock is not None:
+            watch_flag(game_id, clock)
 
-    # Determine check_square position in case of checkmate
-    check_square = None
-    if board.is_checkmate():
-        check_square = chess.square_name(board.king(board.turn))
-        game['is_complete'] = True 
+        # Determine check_square position in case of checkmate
+        check_square = None
+        if board.is_checkmate():
+            check_square = chess.square_name(board.king(board.turn))
+            game.is_complete = True
+        games[game_id] = game
 
     return jsonify({
         'fen': board.fen(),
@@ -765,7 +1605,108 @@ def move_multiplayer():
         'turn': 'white' if board.turn == chess.WHITE else 'black',
         'is_check': board.is_check(),
         'check_square': check_square,
-        'message': 'Game over' if board.is_checkmate() or board.is_stalemate() else ''
+        'message': 'Game over' if board.is_checkmate() or board.is_stalemate() else '',
+        'clock': clock_state(game),
+        'premoves': {'applied': applied, 'cancelled': cancelled}
+    })
+
+
+@app.route('/multiplayer/premove', methods=['POST'])
+def premove_multiplayer():
+    """
+    Queue moves to be played the moment the opponent has moved
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          required:
+            - game_id
+          properties:
+            game_id:
+              type: string
+            moves:
+              type: array
+              items:
+                type: string
+              description: Moves in UCI format, added to the end of the queue
+            clear:
+              type: boolean
+              description: Drop the queued moves first
+            player:
+              type: string
+              description: The color queueing, needed only when one player plays both sides
+    responses:
+      200:
+        description: The queue of the player; queued moves are played right away when it is already their turn
+        schema:
+          type: object
+          properties:
+            premoves:
+              type: array
+              items:
+                type: string
+            applied:
+              type: array
+              items:
+                type: string
+            cancelled:
+              type: array
+              items:
+                type: string
+            fen:
+              type: string
+      400:
+        description: Invalid game, player or move, or too many premoves
+    """
+    data = request.get_json()
+    game_id = data.get('game_id')
+    moves = data.get('moves', [])
+    if not game_id or not isinstance(moves, list):
+        return jsonify({'error': 'game_id and a list of moves are required'}), 400
+    try:
+        moves = [chess.Move.from_uci(uci).uci() for uci in moves]
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid move'}), 400
+
+    with games.locked(game_id):
+        game = games.get(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
+        color = requesting_color(game, data.get('player'))
+        if color is None:
+            return jsonify({'error': 'You are not playing this game'}), 400
+        if game.is_game_over:
+            return jsonify({'error': 'Game over'}), 400
+
+        queued = game.premoves[color]
+        if data.get('clear'):
+            queued.clear()
+        if len(queued) + len(moves) > PREMOVE_LIMIT:
+            return jsonify({'error': f'At most {PREMOVE_LIMIT} premoves can be queued'}), 400
+        queued += moves
+
+        # The opponent may have moved already, then the queue starts right away
+        clock = game.clock
+        if clock is not None and not clock.flagged and clock.check_flag():
+            game.finish()
+        applied, cancelled = apply_premoves(game)
+        if applied and clock is not None:
+            watch_flag(game_id, clock)
+        games[game_id] = game
+        board = game.board
+
+    return jsonify({
+        'premoves': game.premoves[color],
+        'applied': applied,
+        'cancelled': cancelled,
+        'fen': board.fen(),
+        'turn': 'white' if board.turn == chess.WHITE else 'black',
+        'is_checkmate': board.is_checkmate(),
+        'is_stalemate': board.is_stalemate(),
+        'clock': clock_state(game)
     })
 
 
@@ -803,16 +1744,41 @@ def get_game_state_multiplayer():
                 black:
                   type: string
                   description: The player who joined as black
+            clock:
+              type: object
+              description: Milliseconds left for white and black, the running side, the increment, the flagged side and the result on time; null without a time control
+            archived:
+              type: boolean
+              description: Whether the game is finished and was moved to the archive
       400:
         description: Invalid game ID
     """
     game_id = request.args.get('game_id')
 
-    if game_id not in games:
+    game = games.get(game_id)
+    archived = game is None
+    if archived:
+        # Finished games are moved to the archive, their final state is kept there
+        game = archived_game(game_id)
+    if game is None:
         return jsonify({'error': 'Game ID not found'}), 400
+    clock = game.clock
+    if clock is not None and clock.running is not None and clock.time_left(clock.running) == 0:
+        # The flag fell and no timer of this process has recorded it yet
+        flag_fall(game_id)
+        current = games.get(game_id)
+        if current is None:
+            # The sweep may have archived it in the meantime
+            current = archived_game(game_id)
+            archived = current is not None
+        if current is None:
+            # Both players left in the meantime, answer with the game as read, flagged
+            clock.check_flag()
+            game.finish()
+        else:
+            game = current
 
-    game = games[game_id]
-    board = game['board']
+    board = game.board
 
     check_square = None
     if board.is_checkmate():
@@ -820,18 +1786,28 @@ def get_game_state_multiplayer():
         if checkers:
             check_square = chess.square_name(checkers.pop())
 
-    return jsonify({
-        'fen': board.fen(),
+    state = {
         'is_checkmate': board.is_checkmate(),
         'is_stalemate': board.is_stalemate(),
         'turn': 'white' if board.turn == chess.WHITE else 'black',
         'is_check': board.is_check(),
         'check_square': check_square,
-        'players': game['players'],
-        'move_history': game['move_history'],
-        'game_name': game.get('game_name', 'Untitled Game'),
-        'theme': game.get('theme', 'regular')
-    })
+        'players': game.players,
+        'game_name': game.game_name,
+        'theme': game.theme,
+        'clock': clock_state(game),
+        # Only the requesting player's own premoves, the opponent does not see them
+        'premoves': game.premoves.get(requesting_color(game)) or [],
+        'archived': archived
+    }
+    # Polled all the time, MessagePack clients get the packed board and moves
+    if wants_msgpack():
+        state['board'] = pack_chess_fen(board.fen())
+        state['moves'] = pack_moves(game.moves)
+    else:
+        state['fen'] = board.fen()
+        state['move_history'] = game.move_history
+    return jsonify(state)
 
 @app.route('/multiplayer/legal_moves_multi', methods=['POST'])
 def legal_moves_multi():
@@ -868,13 +1844,12 @@ def legal_moves_multi():
     if not game_id or not position:
       return jsonify({'error': 'Missing game_id or position'}), 400
 
-    # Check if the game ID exists
-    if game_id not in games:
+    # Check if the game ID exists and get the game and board
+    game = games.get(game_id)
+    if game is None:
       return jsonify({'error': 'Game ID not found'}), 400
 
-    # Get the game and board
-    game = games[game_id]
-    board = game['board']
+    board = game.board
 
     # Convert the position to a square ("e2" -> chess.E2)
     try:
@@ -897,13 +1872,17 @@ def list_games():
     active_games = []
 
     for game_id, game in games.items():
-        if not game['board'].is_game_over():  # Only show active games
+        if not game.is_game_over:  # Only show active games, without rebuilding their boards
             active_games.append({
                 'game_id': game_id,
-                'players': game['players'],
-                'status': 'waiting' if None in game['players'].values() else 'in-progress',
-                'game_name': game.get('game_name', 'Untitled Game'),
-                'theme': game.get('theme', 'regular')
+                'players': game.players,
+                'status': 'waiting' if None in game.players.values() else 'in-progress',
+                'game_name': game.game_name,
+                'theme': game.theme,
+                'time_control': None if game.clock is None else {
+                    'base': game.clock.base / 1000,
+                    'increment': game.clock.increment / 1000
+                }
             })
     return jsonify(active_games)
 
@@ -919,19 +1898,145 @@ def leave_game():
     if not game_id or not player_color:
         return jsonify({'error': 'game_id and player are required'}), 400
 
-    if game_id not in games:
-        return jsonify({'error': 'Game ID not found'}), 400
+    with games.locked(game_id):
+        game = games.get(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
 
-    # Set the player as disconnected
-    games[game_id]['players'][player_color] = None
+        # Set the player as disconnected
+        game.set_player(player_color, None)
+        if player_color in game.premoves:
+            game.premoves[player_color] = []
 
-    # Check if both players have disconnected, then delete the game
-    if not games[game_id]['players']['white'] and not games[game_id]['players']['black']:
-        del games[game_id]
-        return jsonify({'message': 'Game deleted due to both players leaving'}), 200
+        # Check if both players have disconnected, then delete the game
+        if not game.white and not game.black:
+            del games[game_id]
+            watch_flag(game_id, None)
+            return jsonify({'message': 'Game deleted due to both players leaving'}), 200
+        games[game_id] = game
 
     return jsonify({'message': f'{player_color} has left the game', 'game_id': game_id})
 
+def archive_day(name):
+    """ The YYYY-MM-DD day of a query argument, None when it is not given """
+    value = request.args.get(name)
+    return None if value is None else datetime.date.fromisoformat(value).isoformat()
+
+def archive_summary(record):
+    game = record['game']
+    return {
+        'game_id': record['game_id'],
+        'finished_at': record['finished_at'],
+        'result': record['result'],
+        'termination': record['termination'],
+        'plies': record['plies'],
+        'players': {'white': game['white'], 'black': game['black']},
+        'game_name': game['game_name'],
+        'theme': game['theme']
+    }
+
+@app.route('/multiplayer/archive', methods=['GET'])
+def list_archived_games():
+    """
+    Finished multiplayer games, streamed one JSON line per game in the order they were archived
+    ---
+    parameters:
+      - name: from
+        in: query
+        type: string
+        required: false
+        description: First day (YYYY-MM-DD, UTC) the games finished on
+      - name: to
+        in: query
+        type: string
+        required: false
+        description: Last day (YYYY-MM-DD, UTC) the games finished on
+    responses:
+      200:
+        description: Newline delimited JSON, one object per game (game_id, finished_at, result, termination, plies, players, game_name, theme)
+      400:
+        description: Invalid day
+    """
+    try:
+        start, end = archive_day('from'), archive_day('to')
+    except ValueError:
+        return jsonify({'error': 'Invalid day, expected YYYY-MM-DD'}), 400
+    records = game_archive.scan(start, end)
+    return Response((json.dumps(archive_summary(record)) + '\n' for record in records), mimetype='application/x-ndjson')
+
+@app.route('/multiplayer/archive/stats', methods=['GET'])
+def archived_game_stats():
+    """
+    Results and terminations of the finished multiplayer games of a range of days
+    ---
+    parameters:
+      - name: from
+        in: query
+        type: string
+        required: false
+        description: First day (YYYY-MM-DD, UTC)
+      - name: to
+        in: query
+        type: string
+        required: false
+        description: Last day (YYYY-MM-DD, UTC)
+    responses:
+      200:
+        description: Number of games, counts per result and termination and the average length in plies
+      400:
+        description: Invalid day
+    """
+    try:
+        start, end = archive_day('from'), archive_day('to')
+    except ValueError:
+        return jsonify({'error': 'Invalid day, expected YYYY-MM-DD'}), 400
+    count = 0
+    plies = 0
+    results = {}
+    terminations = {}
+    for record in game_archive.scan(start, end):
+        count += 1
+        plies += record['plies']
+        results[record['result']] = results.get(record['result'], 0) + 1
+        terminations[record['termination']] = terminations.get(record['termination'], 0) + 1
+    return jsonify({
+        'from': start,
+        'to': end,
+        'games': count,
+        'results': results,
+        'terminations': terminations,
+        'average_plies': round(plies / count, 1) if count else None
+    })
+
+@app.route('/multiplayer/archive/<game_id>', methods=['GET'])
+def get_archived_game(game_id):
+    """
+    A finished multiplayer game from the archive, with its moves
+    ---
+    parameters:
+      - name: game_id
+        in: path
+        type: string
+        required: true
+    responses:
+      200:
+        description: The summary of the game plus its starting position, moves in UCI format, move history and final clock
+      404:
+        description: The game is not archived
+    """
+    record = game_archive.get(game_id)
+    if record is None:
+        return jsonify({'error': 'Game not found in the archive'}), 404
+    game = GameRecord.from_dict(record['game'])
+    return jsonify({
+        **archive_summary(record),
+        'root_fen': game.root(),
+        'moves': game.uci_moves(),
+        'move_history': game.move_history,
+        'fen': game.board.fen(),
+        'clock': clock_state(game)
+    })
+
 @app.route('/themes', methods=['GET'])
 def list_themes():
   """
@@ -1019,8 +2124,11 @@ def edit_difficulty():
     if level not in difficulties:
         return jsonify({'error': 'Difficulty not found'}), 404
 
-    difficulties[level].update(new_settings)
-    return jsonify({'message': f'Difficulty {level} updated', 'new_settings': difficulties[level]}), 200
+    with difficulties.locked(level):
+        settings = difficulties[level]
+        settings.update(new_settings)
+        difficulties[level] = settings
+    return jsonify({'message': f'Difficulty {level} updated', 'new_settings': settings}), 200
 
 @app.route('/difficulty/delete', methods=['POST'])
 def delete_difficulty():
@@ -1035,10 +2143,6 @@ def delete_difficulty():
 
 # Checkers API Endpoints
 
-# Initialize a global checkers board object
-checkersBoard = Board(variant="frysk", fen="startpos")
-engine = None
-
 def generate_square_num_to_position_map():
     """
     Generates a mapping of square numbers (1-50) to board positions.
@@ -1058,46 +2162,274 @@ def generate_square_num_to_position_map():
 
     return mapping
 
+# The mappings never change, build them once
+SQUARE_NUM_TO_POSITION = generate_square_num_to_position_map()
+POSITION_TO_SQUARE_NUM = {v: k for k, v in SQUARE_NUM_TO_POSITION.items()}
+
 # Generate a mapping of square numbers to board positions for FE
 def convert_pdn_to_notation(pdn_move):
     """
     Converts a PDN move ("34x28") to board notation ("h4 x e2").
     """
-    square_num_to_position_map = generate_square_num_to_position_map()
     parts = re.split(r'[-x]', pdn_move)
     is_capture = 'x' in pdn_move
-    converted_parts = [square_num_to_position_map[int(part)] for part in parts]
+    converted_parts = [SQUARE_NUM_TO_POSITION[int(part)] for part in parts]
     return f" {'x' if is_capture else '-'} ".join(converted_parts)
 
 def generate_position_to_square_num_map():
     """
     Generates a mapping of board positions to square numbers (reverse of above).
     """
-    square_num_to_position_map = generate_square_num_to_position_map()
-    return {v: k for k, v in square_num_to_position_map.items()}
+    return dict(POSITION_TO_SQUARE_NUM)
+
+class CheckersGame:
+    """
+    One checkers game. The board map sent to the FE is kept up to date move by
+    move instead of re-parsing the FEN. Every change bumps the version, the last
+    deltas are kept so a client that missed some can catch up without the full map.
+
+    Shared stores keep the starting position and the moves (see to_dict). The
+    board, with the move history pydraughts' draw rules need, is replayed from
+    them when a request first uses it; polling the state does not.
+    """
+
+    def __init__(self, board, variant):
+        self.created = time.time()
+        self.last_access = time.time()
+        self.version = 0
+        self.deltas = deque(maxlen=64)  # (version, delta)
+        self.reset(board, variant)
+
+    def reset(self, board, variant):
+        """ Replace the board and rebuild the board map, after a new game or custom setup """
+        self._board = board
+        self.variant = variant
+        self.initial_fen = board.initial_fen
+        # [board move, captures] of every move, enough to replay it without move generation
+        self.moves = [[move.board_move, move.captures or [None]] for move in board.move_stack]
+        self.over = None  # is_over() of a game loaded from a shared store, before its board is replayed
+        self.board_map = parse_checkers_fen(board.fen)
+        self.version += 1
+        self.deltas.clear()
+
+    def push(self, move):
+        """
+        Push a move to the board and update the board map,
+        returns the changed squares (None for an emptied square).
+        """
+        steps = move.steps_move
+        origin = SQUARE_NUM_TO_POSITION[steps[0]]
+        target = SQUARE_NUM_TO_POSITION[steps[-1]]
+        piece = self.board_map.get(origin)
+
+        self.board.push(move)
+        self.moves.append([move.board_move, move.captures or [None]])
+
+        # A man ending its move on the far row is promoted
+        if piece == 'r' and steps[-1] <= 5:
+            piece = 'R'
+        elif piece == 'b' and steps[-1] >= 46:
+            piece = 'B'
+
+        delta = {origin: None}
+        for square in move.captures or []:
+            if square:
+                delta[SQUARE_NUM_TO_POSITION[square]] = None
+        delta[target] = piece
+
+        for position, value in delta.items():
+            if value is None:
+                self.board_map.pop(position, None)
+            else:
+                self.board_map[position] = value
+
+        self.version += 1
+        self.deltas.append((self.version, delta))
+        return delta
+
+    def delta_since(self, since):
+        """ Merged changes after the given version, None when they are no longer kept """
+        oldest = self.deltas[0][0] if self.deltas else self.version + 1
+        if since is None or not oldest - 1 <= since <= self.version:
+            return None
+        delta = {}
+        for version, changes in self.deltas:
+            if version > since:
+                delta.update(changes)
+        return delta
+
+    @property
+    def board(self):
+        if self._board is None:
+            self._board = self.replay()
+        return self._board
+
+    def replay(self):
+        board = Board(variant=self.variant, fen=self.initial_fen)
+        for board_move, captures in self.moves:
+            board.push(Move(board_move=board_move, possible_moves=[board_move], possible_captures=[captures],
+                            variant=board.variant))
+        return board
+
+    @property
+    def fen(self):
+        return self._board.fen if self._board is not None else self._fen
+
+    def is_over(self):
+        if self._board is None and self.over is not None:
+            return self.over
+        return self.board.is_over()
+
+    def state(self):
+        fen = self.fen
+        return {
+            'fen': fen,
+            'turn': 'white' if fen[0] == 'W' else 'black',
+            'variant': self.variant,
+            'version': self.version
+        }
+
+    def to_dict(self):
+        """ JSON compatible form for shared state stores, the board is kept as its moves """
+        return {
+            'variant': self.variant,
+            'initial_fen': self.initial_fen,
+            'moves': self.moves,
+            'fen': self.fen,
+            'over': self.is_over(),
+            'version': self.version,
+            'board_map': self.board_map,
+            'deltas': list(self.deltas),
+            'created': self.created,
+            'last_access': self.last_access
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        game = cls.__new__(cls)
+        game.variant = data['variant']
+        game.initial_fen = data.get('initial_fen', data['fen'])
+        game.moves = data.get('moves', [])
+        game._fen = data['fen']
+        game.over = data.get('over')
+        game._board = None
+        game.version = data['version']
+        game.board_map = data['board_map']
+        game.deltas = deque((tuple(entry) for entry in data['deltas']), maxlen=64)
+        game.created = data['created']
+        game.last_access = data['last_access']
+        return game
+
+# Checkers games by game id. Requests without a game id use the default game,
+# which is never evicted. Changes to a game are made under checkers_games.locked(game_id).
+DEFAULT_CHECKERS_GAME = 'default'
+CHECKERS_GAME_IDLE_TIMEOUT = float(os.environ.get('CHECKERS_GAME_IDLE_TIMEOUT', 1800))  # seconds
+checkers_games = StoreMapping(store, 'checkers', CheckersGame.to_dict, CheckersGame.from_dict)
+# Reads don't write a game back to a shared store, so when it was last read is
+# kept under its own key, written at most every CHECKERS_ACCESS_INTERVAL
+CHECKERS_ACCESS_INTERVAL = 60  # seconds
+checkers_access = StoreMapping(store, 'checkers_access')
+
+def create_checkers_board(variant, piece_count=None, king_count=0, fen=None):
+    if fen is not None:
+        return Board(variant=variant, fen=fen)
+    if variant == 'frysk':
+        return Board(variant="frysk", fen="startpos")
+    fen = generate_custom_fen(piece_count, king_count, variant="standard")
+    return Board(variant="standard", fen=fen)
+
+def checkers_game_id(game_id):
+    return game_id or DEFAULT_CHECKERS_GAME
+
+def get_checkers_game(game_id):
+    """ The game with the given id, None when it does not exist """
+    game = checkers_games.get(game_id)
+    if game is not None:
+        now = time.time()
+        if store.shared and now - game.last_access > CHECKERS_ACCESS_INTERVAL:
+            if now - checkers_access.get(game_id, 0) > CHECKERS_ACCESS_INTERVAL:
+                checkers_access[game_id] = now
+        game.last_access = now
+    return game
+
+def checkers_last_access(game_id, game):
+    """ When the game was last used, by a read or a change """
+    if not store.shared:
+        return game.last_access
+    return max(game.last_access, checkers_access.get(game_id, 0))
+
+def evict_idle_checkers_games():
+    """ Remove the checkers games nobody touched for a while, returns how many were removed """
+    now = time.time()
+    evicted = 0
+    for game_id, game in checkers_games.items():
+        if game_id == DEFAULT_CHECKERS_GAME or now - checkers_last_access(game_id, game) <= CHECKERS_GAME_IDLE_TIMEOUT:
+            continue
+        with checkers_games.locked(game_id):
+            game = checkers_games.get(game_id)
+            if game is not None and now - checkers_last_access(game_id, game) > CHECKERS_GAME_IDLE_TIMEOUT:
+                del checkers_games[game_id]
+                checkers_access.pop(game_id, None)
+                evicted += 1
+    return evicted
+
+
+@app.route('/checkers/create', methods=['POST'])
+def checkers_create_game():
+    """
+    Create a new checkers game with its own id
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: false
+        schema:
+          type: object
+          properties:
+            variant:
+              type: string
+              description: standard or frysk
+            piece_count:
+              type: integer
+            king_count:
+              type: integer
+            fen:
+              type: string
+              description: Custom starting position, overrides the piece counts
+    responses:
+      200:
+        description: The new game, pass its game_id to the other checkers endpoints
+    """
+    data = request.get_json(silent=True) or {}
+    variant = data.get('variant', 'standard')
+    checkers_board = create_checkers_board(variant, data.get('piece_count', 20), data.get('king_count', 0), data.get('fen'))
+
+    game_id = str(uuid.uuid4())[:8]
+    game = CheckersGame(checkers_board, variant)
+    checkers_games[game_id] = game
 
+    state = game.state()
+    state.update({'game_id': game_id, 'board_map': game.board_map})
+    return jsonify(state)
 
 @app.route('/checkers/checkers_new_game', methods=['POST'])
 def checkers_new_game():
-    global checkersBoard
     data = request.get_json()
     variant = data.get('variant', 'standard')     # Default to 'standard'
     piece_count = data.get('piece_count', None)   # Number of pieces per side
     king_count = data.get('king_count', 0)        # Number of kings per side
 
-    if variant == 'frysk':
-      checkersBoard = Board(variant="frysk", fen="startpos")
-    else:
-      fen = generate_custom_fen(piece_count, king_count, variant="standard")
-      checkersBoard = Board(variant="standard", fen=fen)
-
-    board_map = parse_checkers_fen(checkersBoard.fen)
+    game_id = checkers_game_id(data.get('game_id'))
+    with checkers_games.locked(game_id):
+        game = get_checkers_game(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
 
-    return jsonify({
-        'fen': checkersBoard.fen,
-        'turn': 'white' if checkersBoard.turn == WHITE else 'black',
-        'board_map': board_map
-    })
+        game.reset(create_checkers_board(variant, piece_count, king_count), variant)
+        checkers_games[game_id] = game
+        state = game.state()
+        state['board_map'] = game.board_map
+    return jsonify(state)
 
 
 def generate_custom_fen(piece_count, king_count=0, variant="standard"):
@@ -1166,7 +2498,7 @@ def parse_checkers_fen(fen):
     parts = fen.split(':')
     piecePositions = parts[1:]  # Skip the first part, which usually is 'W' or 'B'
 
-    squareNumToPositionMap = generate_square_num_to_position_map()
+    squareNumToPositionMap = SQUARE_NUM_TO_POSITION
 
     for piecePos in piecePositions:
         if len(piecePos) == 0:
@@ -1197,47 +2529,139 @@ def parse_checkers_fen(fen):
 
     return board_map
 
-def initialize_engine():
+scan_supervisor = EngineSupervisor('scan', initialize_engine, stop_scan)
+
+# The default checkers game, used by requests without a game id
+checkers_games.setdefault(DEFAULT_CHECKERS_GAME, CheckersGame(Board(variant="frysk", fen="startpos"), 'frysk'))
+
+# The Scan engine is started in a background thread on the first request (or
+# when run as a script), so importing the module and forking workers stays cheap.
+# Until it is ready the built-in draughts engine answers.
+engine_warmup_ms = None
+engine_warmup_thread = None
+engine_warmup_lock = threading.Lock()
+
+def warm_up_engine():
+    global engine_warmup_ms
+    start = time.perf_counter()
+    if engine_service is not None:
+        try:
+            engine_service.ping()
+        except (EngineUnavailable, EngineTimeout) as e:
+            print(f"Warning: {e}, the built-in engines answer until it is up")
+    else:
+        scan_supervisor.warm_up()
+    engine_warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+
+def start_engine_warmup():
+    """ Start the engine warm-up thread once """
+    global engine_warmup_thread
+    with engine_warmup_lock:
+        if engine_warmup_thread is None:
+            engine_warmup_thread = threading.Thread(target=warm_up_engine, daemon=True)
+            engine_warmup_thread.start()
+
+@app.before_request
+def ensure_engine_warmup():
+    if engine_warmup_thread is None:
+        start_engine_warmup()
+
+# Checkers AI levels. "Time" caps the search, "Target Latency" (ms) and "Max Nodes"
+# let the time manager pick shorter limits. Without a level Scan thinks 10 s as it
+# always did. Levels up to BUILTIN_ENGINE_MAX_DEPTH, and every level when
+# Scan is missing, are played by the built-in draughts engine.
+checkers_difficulties = {
+    "beginner": {"Depth": 2, "Time": 0.05},
+    "intermediate": {"Depth": 6, "Time": 0.5},
+    "expert": {"Time": 3, "Target Latency": 3000},
+}
+CHECKERS_DEFAULT_DIFFICULTY = {"Time": 10}
+builtin_draughts_engine = DraughtsEngine()
+builtin_draughts_engine_lock = threading.Lock()
+
+def builtin_draughts_move(board, time_limit, depth=64, max_nodes=None):
+    """ Search a checkers move with the in-process engine """
+    with builtin_draughts_engine_lock:
+        started = time.perf_counter()
+        move = builtin_draughts_engine.play(board, time_limit, max_nodes, depth)
+        time_manager.record_search('draughts', builtin_draughts_engine.nodes, time.perf_counter() - started)
+        return move
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
     """
-    Initialize the Scan engine if all necessary files exist in the backend directory.
+    Liveness check, answers as soon as the process serves requests
     """
-    # All scan.exe, scan.ini and data folder should be in backend file to work!
-    backend_dir = os.path.dirname(os.path.abspath(__file__))  # Get the backend directory
-    scan_exe = os.path.join(backend_dir, "scan.exe")
-    scan_ini = os.path.join(backend_dir, "scan.ini")
-    data_dir = os.path.join(backend_dir, "data")
-
-    # Check if all required files and directories exist
-    if not os.path.exists(scan_exe):
-        print("Warning: scan.exe not found in the backend directory. Skipping engine initialization.")
-        return None
-    
-    if not os.path.exists(scan_ini):
-        print("Warning: scan.ini not found in the backend directory. Skipping engine initialization.")
-        return None
-    
-    if not os.path.exists(data_dir):
-        print("Warning: data directory not found in the backend directory. Skipping engine initialization.")
-        return None
+    return jsonify({'status': 'ok'}), 200
 
-    try:
-        os.chdir(backend_dir)  # Set working directory to backend folder
-        engine = HubEngine([r"scan.exe", "hub"])
-        engine.init()
-        return engine
-    
-    except Exception as e:
-        print(f"Error initializing Scan engine: {e}")
-        return None
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness check with the engine warm-up state and cold start timings
+    ---
+    responses:
+      200:
+        description: Engine warm-up finished (the engine may still be unavailable)
+      503:
+        description: Engines are still warming up
+    """
+    ready = engine_warmup_ms is not None
+    return jsonify({
+        'ready': ready,
+        'engines': {
+            'scan': scan_supervisor.state if ready else 'starting',
+            'stockfish': 'available' if stockfish_available() else 'unavailable',
+            'builtin': 'ready',
+            'service': ENGINE_SERVICE
+        },
+        'import_ms': IMPORT_MS,
+        'engine_warmup_ms': engine_warmup_ms,
+        'uptime_s': round(time.perf_counter() - STARTUP_BEGIN, 1)
+    }), 200 if ready else 503
 
-# Initialize the engine globally
-engine = initialize_engine()
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Runtime counters of the engines and their cores, the coalesced searches, the search budgets, pondering, the live analyses, the admission queue, the game clocks, the game archive and the open games
+    """
+    return jsonify({
+        'engines': {
+            'stockfish': stockfish_pool.stats(),
+            'scan': scan_supervisor.stats(),
+            'service': engine_service.stats() if engine_service is not None else None
+        },
+        'cores': core_scheduler.stats(),
+        'coalescing': engine_searches.stats(),
+        'time_manager': time_manager.stats(),
+        'ponder': ponders.stats(),
+        'analysis': analysis_engines.stats(),
+        'admission': admission.stats(),
+        'clocks': clock_wheel.stats(),
+        'archive': game_archive.stats(),
+        'games': {
+            'multiplayer': len(games),
+            # A shared store only keeps dehydrated games
+            'dehydrated': len(games) if store.shared else sum(1 for game in games.values() if game.is_dehydrated),
+            'checkers': len(checkers_games)
+        }
+    }), 200
 
 @app.route('/checkers/checkers_ai_move', methods=['POST'])
 def checkers_ai_move():
     """
     Calculate the AI move for the current state of the board.
     --- 
+    parameters:
+      - name: level
+        in: body
+        type: string
+        required: false
+        description: Checkers difficulty level (beginner, intermediate, expert)
+      - name: game_id
+        in: body
+        type: string
+        required: false
+        description: Checkers game from /checkers/create, the default game when omitted
     responses:
       200:
         description: AI move calculated successfully
@@ -1252,30 +2676,89 @@ def checkers_ai_move():
               type: string
             is_over:
               type: boolean
+      400:
+        description: Invalid difficulty level or game, or the game is over
       500:
         description: Error during AI calculation
+      503:
+        description: Too many engine requests, retry after the Retry-After header's seconds
     """
-    global checkersBoard
+    data = request.get_json(silent=True) or {}
+    level = data.get('level')
 
-    try:
-        limit = Limit(time=10)
-        result = engine.play(checkersBoard, limit, ponder=False)
-        ai_move = result.move
-        checkersBoard.push(ai_move)
+    if level is not None and level not in checkers_difficulties:
+        return jsonify({'error': 'Invalid difficulty level'}), 400
 
-        # Convert AI move to board notation
-        ai_move = convert_pdn_to_notation(ai_move.pdn_move)
+    settings = checkers_difficulties.get(level, CHECKERS_DEFAULT_DIFFICULTY)
+    depth = settings.get('Depth', 64)
+    time_limit = settings.get('Time', 10)
+    target = settings.get('Target Latency')
+    budget_key = ('checkers', level or 'default')
+    started = time.perf_counter()
+
+    game_id = checkers_game_id(data.get('game_id'))
+    with checkers_games.locked(game_id):
+        game = get_checkers_game(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
+
+        if game.board.is_over():
+            return jsonify({'error': 'Game is over', 'is_over': True}), 400
+
+        try:
+            checkers_board = game.board
+            ai_move = None
+            # After a crash the supervisor is in backoff and restarts Scan on the next search
+            use_scan = engine_service is not None or scan_supervisor.state in ('ready', 'backoff')
+            if use_scan and depth > BUILTIN_ENGINE_MAX_DEPTH:
+                if target:
+                    time_limit = min(time_limit, time_manager.budget(budget_key, target, engine='scan').time)
+                limit = Limit(time=time_limit)
+                search_board = checkers_board.copy()
+                key = ('checkers_ai_move', game.variant, checkers_board.fen, time_limit)
+                if engine_service is not None:
+                    search = lambda: engine_service.checkers_move(search_board, time_limit, time_limit + SEARCH_DEADLINE_GRACE)
+                else:
+                    search = lambda: scan_supervisor.run(
+                        lambda scan: scan.play(search_board, limit, ponder=False).move, time_limit + SEARCH_DEADLINE_GRACE)
+                try:
+                    ai_move = engine_searches.do(key, lambda: admitted('checkers_ai_move', search))
+                except (EngineUnavailable, EngineTimeout) as e:
+                    print(f"Warning: Scan failed ({e}), using the built-in engine")
+                    time_limit = BUILTIN_ENGINE_FALLBACK_TIME
+
+            if ai_move is None:
+                if level is None:
+                    time_limit = BUILTIN_ENGINE_FALLBACK_TIME
+                max_nodes = None
+                if target:
+                    budget = time_manager.budget(budget_key, target, settings.get('Max Nodes'), 'draughts')
+                    time_limit = min(time_limit, budget.time)
+                    max_nodes = budget.nodes
+                with admission.slot('checkers_ai_move'):
+                    ai_move = builtin_draughts_move(checkers_board, time_limit, depth, max_nodes)
+            delta = game.push(ai_move)
+            checkers_games[game_id] = game
+            if target:
+                time_manager.record_latency(budget_key, time.perf_counter() - started)
+
+            # Convert AI move to board notation
+            ai_move = convert_pdn_to_notation(ai_move.pdn_move)
 
-        return jsonify({
-            'fen': checkersBoard.fen,
-            'ai_move': ai_move,
-            'turn': 'white' if checkersBoard.turn == WHITE else 'black',
-            'is_over': checkersBoard.is_over()
-        })
+            return jsonify({
+                'fen': checkers_board.fen,
+                'ai_move': ai_move,
+                'turn': 'white' if checkers_board.turn == WHITE else 'black',
+                'is_over': checkers_board.is_over(),
+                'delta': delta,
+                'version': game.version
+            })
     
-    except Exception as e:
-        print("Error in AI move:", e)
-        return jsonify({'error': str(e)}), 500
+        except Overloaded:
+            raise
+        except Exception as e:
+            print("Error in AI move:", e)
+            return jsonify({'error': str(e)}), 500
 
 @app.route('/checkers/checkers_move', methods=['POST'])
 def checkers_make_move():
@@ -1294,6 +2777,9 @@ def checkers_make_move():
             move:
               type: string
               example: "34-30"
+            game_id:
+              type: string
+              description: Checkers game from /checkers/create, the default game when omitted
     responses:
       200:
         description: Move applied successfully
@@ -1309,34 +2795,42 @@ def checkers_make_move():
       400:
         description: Invalid move
     """
-    global checkersBoard
     move_pdn = request.json.get('move')
+    game_id = checkers_game_id(request.json.get('game_id'))
 
-    # Convert all legal moves to readable board notation ("h4 x e2")
-    legal_moves_pdn = [convert_pdn_to_notation(move.pdn_move) for move in checkersBoard.legal_moves()]
+    with checkers_games.locked(game_id):
+        game = get_checkers_game(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
+        checkers_board = game.board
 
-    if move_pdn not in legal_moves_pdn:
-        return jsonify({'error': 'Illegal move'}), 400
+        # Convert all legal moves to readable board notation ("h4 x e2")
+        legal_moves_pdn = {}
+        for move in checkers_board.legal_moves():
+            legal_moves_pdn.setdefault(convert_pdn_to_notation(move.pdn_move), move)
 
-    # Find and apply the matching move
-    for move in checkersBoard.legal_moves():
-        if convert_pdn_to_notation(move.pdn_move) == move_pdn:  # Match readable notation
-            checkersBoard.push(move)
-            break
+        if move_pdn not in legal_moves_pdn:
+            return jsonify({'error': 'Illegal move'}), 400
 
-    # Convert remaining legal moves for potential captures to board notation
-    next_legal_moves = [convert_pdn_to_notation(move.pdn_move) for move in checkersBoard.legal_moves()]
-    continue_capture = any('x' in move for move in next_legal_moves)
+        # Apply the matching move
+        delta = game.push(legal_moves_pdn[move_pdn])
+        checkers_games[game_id] = game
 
-    return jsonify({
-        'fen': checkersBoard.fen,
-        'is_over': checkersBoard.is_over(),
-        'turn': 'white' if checkersBoard.turn == WHITE else 'black',
-        'is_capture': 'x' in move_pdn,
-        'continue_capture': continue_capture,
-        'legal_moves': next_legal_moves if continue_capture else [],
-        'ai_available': engine is not None
-    })
+        # Convert remaining legal moves for potential captures to board notation
+        next_legal_moves = [convert_pdn_to_notation(move.pdn_move) for move in checkers_board.legal_moves()]
+        continue_capture = any('x' in move for move in next_legal_moves)
+
+        return jsonify({
+            'fen': checkers_board.fen,
+            'is_over': checkers_board.is_over(),
+            'turn': 'white' if checkers_board.turn == WHITE else 'black',
+            'is_capture': 'x' in move_pdn,
+            'continue_capture': continue_capture,
+            'legal_moves': next_legal_moves if continue_capture else [],
+            'ai_available': True,
+            'delta': delta,
+            'version': game.version
+        })
 
 
 @app.route('/checkers/checkers_state', methods=['GET'])
@@ -1344,6 +2838,17 @@ def checkers_get_game_state():
     """
     Get the current game state.
     ---
+    parameters:
+      - name: since
+        in: query
+        type: integer
+        required: false
+        description: Board map version the client has, only the changes after it are returned when possible
+      - name: game_id
+        in: query
+        type: string
+        required: false
+        description: Checkers game from /checkers/create, the default game when omitted
     responses:
       200:
         description: The current game state
@@ -1356,15 +2861,30 @@ def checkers_get_game_state():
               type: boolean
             turn:
               type: string
-    """
-    global checkersBoard
-    board_map = parse_checkers_fen(checkersBoard.fen)
-    return jsonify({
-        'fen': checkersBoard.fen,
-        'is_over': checkersBoard.is_over(),
-        'turn': 'white' if checkersBoard.turn == WHITE else 'black',
-        'board_map': board_map
-    })
+            variant:
+              type: string
+            version:
+              type: integer
+    """
+    game_id = checkers_game_id(request.args.get('game_id'))
+    with checkers_games.locked(game_id):
+        game = get_checkers_game(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
+
+        state = game.state()
+        state['is_over'] = game.is_over()
+
+        # Only the changes the client has not seen yet, when they are still kept
+        delta = game.delta_since(request.args.get('since', type=int))
+        if delta is not None:
+            state['delta'] = delta
+        elif wants_msgpack():
+            state['board_map'] = pack_checkers_map(game.board_map, POSITION_TO_SQUARE_NUM)
+        else:
+            state['board_map'] = dict(game.board_map)
+
+    return jsonify(state)
 
 
 @app.route('/checkers/checkers_legal_moves', methods=['POST'])
@@ -1383,7 +2903,6 @@ def checkers_get_legal_moves():
               items:
                 type: string
     """
-    global checkersBoard
     try:
         position = request.json.get("position")
 
@@ -1391,15 +2910,20 @@ def checkers_get_legal_moves():
             return jsonify({'error': 'Position is required'}), 400
 
         # Convert position to square number
-        position_to_square_num_map = generate_position_to_square_num_map()
-        square_num = position_to_square_num_map.get(position)
+        square_num = POSITION_TO_SQUARE_NUM.get(position)
         if square_num is None:
             return jsonify({'error': 'Invalid position'}), 400
 
         # Filter and convert legal moves for the given position
+        game_id = checkers_game_id(request.json.get('game_id'))
+        with checkers_games.locked(game_id):
+            game = get_checkers_game(game_id)
+            if game is None:
+                return jsonify({'error': 'Game ID not found'}), 400
+            moves = game.board.legal_moves()
         legal_moves = [
             convert_pdn_to_notation(move.pdn_move)
-            for move in checkersBoard.legal_moves()
+            for move in moves
             if int(move.pdn_move.split('x')[0] if 'x' in move.pdn_move else move.pdn_move.split('-')[0]) == square_num
         ]
 
@@ -1425,17 +2949,22 @@ def checkers_get_playable_pieces():
               items:
                 type: string
     """
-    global checkersBoard
     try:
+        game_id = checkers_game_id(request.args.get('game_id'))
+        with checkers_games.locked(game_id):
+            game = get_checkers_game(game_id)
+            if game is None:
+                return jsonify({'error': 'Game ID not found'}), 400
+            moves = game.board.legal_moves()
+
         # Get starting squares of all legal moves
         playable_squares = {
             int(move.pdn_move.split('x')[0] if 'x' in move.pdn_move else move.pdn_move.split('-')[0])
-            for move in checkersBoard.legal_moves()
+            for move in moves
         }
 
         # Convert to board notation
-        square_num_to_position_map = generate_square_num_to_position_map()
-        playable_positions = [square_num_to_position_map[square] for square in playable_squares]
+        playable_positions = [SQUARE_NUM_TO_POSITION[square] for square in playable_squares]
 
         return jsonify({'playable_pieces': playable_positions}), 200
     
@@ -1445,20 +2974,21 @@ def checkers_get_playable_pieces():
     
 @app.route('/checkers/checkers_custom_setup', methods=['POST'])
 def checkers_custom_setup():
-    global checkersBoard
     data = request.get_json()
     fen = data.get('fen', 'W::B')  # default empty board if none provided
     variant = data.get('variant', 'standard')
 
-    checkersBoard = Board(variant=variant, fen=fen)
-    board_map = parse_checkers_fen(checkersBoard.fen)
+    game_id = checkers_game_id(data.get('game_id'))
+    with checkers_games.locked(game_id):
+        game = get_checkers_game(game_id)
+        if game is None:
+            return jsonify({'error': 'Game ID not found'}), 400
 
-    return jsonify({
-        'message': 'Custom setup applied',
-        'fen': checkersBoard.fen,
-        'turn': 'white' if checkersBoard.turn == WHITE else 'black',
-        'board_map': board_map
-    })
+        game.reset(create_checkers_board(variant, fen=fen), variant)
+        checkers_games[game_id] = game
+        state = game.state()
+        state.update({'message': 'Custom setup applied', 'board_map': game.board_map})
+    return jsonify(state)
 
 @app.route('/checkers/generate_fen_from_setup', methods=['POST'])
 def generate_fen_from_setup():
@@ -1519,6 +3049,123 @@ def generate_fen_from_setup():
 
     return jsonify({'fen': fen})
 
+# Slow request capture
+
+# Set SLOW_REQUEST_LOG to a file path to record every request slower than
+# SLOW_REQUEST_THRESHOLD_MS together with the game state it started from.
+# The log can be re-run offline with replay.py.
+SLOW_REQUEST_LOG = os.environ.get('SLOW_REQUEST_LOG')
+SLOW_REQUEST_THRESHOLD_MS = float(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+slow_request_log = SlowRequestLog(SLOW_REQUEST_LOG, SLOW_REQUEST_THRESHOLD_MS) if SLOW_REQUEST_LOG else None
+
+def snapshot_game_state(game_id=None):
+    """
+    Capture the server side game state a request runs against, in a form that
+    can be restored into a fresh app instance.
+    """
+    state = {
+        'chess': {
+            'root_fen': board.root().fen(),
+            'moves': [move.uci() for move in board.move_stack]
+        },
+        'move_history': list(move_history),
+    }
+
+    checkers_id = game_id if game_id in checkers_games else DEFAULT_CHECKERS_GAME
+    checkers_game = checkers_games.get(checkers_id)
+    if checkers_game is not None:
+        state['checkers'] = {
+            'game_id': checkers_id,
+            'variant': checkers_game.variant,
+            'initial_fen': checkers_game.board.initial_fen,
+            'moves': [move.pdn_move for move in checkers_game.board.move_stack]
+        }
+
+    game = games.get(game_id) if game_id else None
+    if game is not None:
+        state['game'] = {
+            'game_id': game_id,
+            'root_fen': game.root(),
+            'moves': game.uci_moves(),
+            'players': game.players,
+            'game_name': game.game_name,
+            'theme': game.theme
+        }
+
+    return state
+
+def restore_game_state(state):
+    """
+    Restore a state captured by snapshot_game_state.
+    """
+    global board, move_history
+
+    board = TrackedBoard(state['chess']['root_fen'])
+    for uci in state['chess']['moves']:
+        board.push(chess.Move.from_uci(uci))
+    move_history = list(state['move_history'])
+
+    if 'checkers' in state:
+        checkers = state['checkers']
+        checkers_board = Board(variant=checkers['variant'], fen=checkers['initial_fen'])
+        for pdn in checkers['moves']:
+            move = next(m for m in checkers_board.legal_moves() if m.pdn_move == pdn)
+            checkers_board.push(move)
+        variant = 'frysk' if checkers['variant'].startswith('frysk') else checkers['variant']
+        checkers_games[checkers.get('game_id', DEFAULT_CHECKERS_GAME)] = CheckersGame(checkers_board, variant)
+
+    if 'game' in state:
+        saved = state['game']
+        game = GameRecord(saved['root_fen'], saved['game_name'], saved['theme'])
+        for uci in saved['moves']:
+            game.push(chess.Move.from_uci(uci))
+        for color, player in saved['players'].items():
+            game.set_player(color, player)
+        games[saved['game_id']] = game
+
+def request_game_id():
+    """ Find the multiplayer game id a request refers to, if any """
+    game_id = request.args.get('game_id')
+    if game_id is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            game_id = data.get('game_id')
+    return game_id
+
+@app.before_request
+def capture_request_start():
+    if slow_request_log is None:
+        return
+    g.request_start = time.perf_counter()
+    g.request_state = snapshot_game_state(request_game_id())
+
+@app.after_request
+def capture_slow_request(response):
+    if slow_request_log is None or 'request_start' not in g:
+        return response
+
+    duration_ms = (time.perf_counter() - g.request_start) * 1000
+    if slow_request_log.should_record(duration_ms):
+        try:
+            slow_request_log.record(
+                request.method,
+                request.path,
+                request.query_string.decode('utf-8'),
+                request.get_data(as_text=True),
+                request.content_type,
+                response.status_code,
+                duration_ms,
+                g.request_state
+            )
+        except Exception as e:
+            print(f"Warning: could not record slow request: {e}")
+    return response
+
+IMPORT_MS = round((time.perf_counter() - STARTUP_BEGIN) * 1000, 1)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server, production deployments use serve.py
+    print(f"Backend imported in {IMPORT_MS} ms")
+    start_engine_warmup()
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('BACKEND_DEBUG') == '1', threaded=True)
 
@@ -0,0 +1,90 @@
+"""
+Offline analysis of saved challenges: principal solution line, evaluation
+and a 1-10 difficulty rating.
+
+The difficulty grows with the search depth at which the engine settles on the
+final best move, and quiet solutions (no capture or check) rate harder than
+forcing ones.
+"""
+import os
+import shutil
+
+import chess
+import chess.engine
+
+from chess_ai import BuiltinEngine, MATE_SCORE
+
+SOLUTION_PLIES = 8
+BUILTIN_MAX_DEPTH = 6
+
+
+def difficulty_rating(board, best_move, discovery_depth):
+    rating = 1 + discovery_depth * 1.5
+    if best_move is not None and not board.is_capture(best_move) and not board.gives_check(best_move):
+        rating += 2
+    return int(max(1, min(10, round(rating))))
+
+
+def analyse_with_stockfish(board, stockfish_path, time_limit):
+    """ Returns (line, score for white, discovery depth) """
+    best_move = None
+    discovery_depth = 1
+    info = {}
+    with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
+        with engine.analysis(board, chess.engine.Limit(time=time_limit)) as analysis:
+            for info in analysis:
+                pv = info.get('pv')
+                if pv and pv[0] != best_move:
+                    best_move = pv[0]
+                    discovery_depth = info.get('depth', discovery_depth)
+            info = analysis.info
+
+    line = info.get('pv', [])[:SOLUTION_PLIES]
+    score = info['score'].white().score(mate_score=MATE_SCORE) if 'score' in info else 0
+    return line, score, discovery_depth
+
+
+def analyse_with_builtin(board, time_limit):
+    """ Returns (line, score for white, discovery depth) """
+    engine = BuiltinEngine()
+    best_move = None
+    discovery_depth = 1
+    score = 0
+    for depth in range(1, BUILTIN_MAX_DEPTH + 1):
+        move, score = engine.analyse(board, depth, time_limit / BUILTIN_MAX_DEPTH)
+        if move != best_move:
+            best_move = move
+            discovery_depth = depth
+    score = score if board.turn == chess.WHITE else -score
+
+    # Follow the engine's own replies to build the line
+    line = []
+    line_board = board.copy()
+    move = best_move
+    while move is not None and len(line) < SOLUTION_PLIES:
+        line.append(move)
+        line_board.push(move)
+        move, _ = engine.analyse(line_board, 4, 0.05)
+    return line, score, discovery_depth
+
+
+def analyse_challenge(fen, stockfish_path, time_limit=1.0):
+    """
+    Analyse a challenge position, returns a dict stored with the challenge.
+    """
+    board = chess.Board(fen)
+    if board.is_game_over():
+        return {'fen': fen, 'status': 'done', 'line': [], 'eval': 0, 'difficulty': 1}
+
+    if os.path.isfile(stockfish_path) or shutil.which(stockfish_path):
+        line, score, discovery_depth = analyse_with_stockfish(board, stockfish_path, time_limit)
+    else:
+        line, score, discovery_depth = analyse_with_builtin(board, time_limit)
+
+    return {
+        'fen': fen,
+        'status': 'done',
+        'line': [move.uci() for move in line],
+        'eval': score,
+        'difficulty': difficulty_rating(board, line[0] if line else None, discovery_depth)
+    }
@@ -0,0 +1,381 @@
+"""
+Built-in draughts engine used when the Scan engine is not available.
+
+pydraughts move generation is far too slow to search with, so the tree is
+searched on a small mailbox representation of the 50 playable squares with
+precomputed rays. The root moves still come from pydraughts, which keeps the
+played move legal under the full variant rules even where the internal move
+generator simplifies them (the Frisian limit on consecutive king moves).
+
+Supports the 'standard' (international) and 'frysk' variants.
+"""
+import time
+
+WHITE_MAN, WHITE_KING, BLACK_MAN, BLACK_KING = 1, 2, -1, -2
+WHITE_SIDE, BLACK_SIDE = 1, -1
+
+WIN_SCORE = 100000
+MAN_VALUE = 100
+KING_VALUE = 300
+MAX_QUIESCENCE_DEPTH = 12
+FIRST_PASS_QUIESCENCE_DEPTH = 2  # the opponent's forced captures and the recapture, no further
+TT_MAX_ENTRIES = 200000
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def square_to_row_col(square):
+    """ Square numbers are 1-50, row 0 is black's back rank """
+    index = square - 1
+    row = index // 5
+    col = 2 * (index % 5) + (1 if row % 2 == 0 else 0)
+    return row, col
+
+
+ROW_COL = [square_to_row_col(square) for square in range(1, 51)]
+INDEX_AT = {row_col: index for index, row_col in enumerate(ROW_COL)}
+
+
+def build_rays(steps):
+    rays = []
+    for row, col in ROW_COL:
+        square_rays = []
+        for dr, dc in steps:
+            ray = []
+            r, c = row + dr, col + dc
+            while (r, c) in INDEX_AT:
+                ray.append(INDEX_AT[(r, c)])
+                r, c = r + dr, c + dc
+            square_rays.append((dr, ray))
+        rays.append(square_rays)
+    return rays
+
+
+DIAGONAL_RAYS = build_rays([(-1, -1), (-1, 1), (1, -1), (1, 1)])
+# Frisian draughts also captures along ranks and files (two columns / rows per step)
+ORTHOGONAL_RAYS = build_rays([(0, -2), (0, 2), (-2, 0), (2, 0)])
+
+
+class Position:
+    """
+    Mutable draughts position. cells holds one signed piece code per playable
+    square (index = square number - 1), side is WHITE_SIDE or BLACK_SIDE.
+    """
+
+    def __init__(self, cells, side, variant='standard'):
+        self.cells = cells
+        self.side = side
+        self.variant = variant
+        self.capture_rays = [DIAGONAL_RAYS[i] + ORTHOGONAL_RAYS[i] for i in range(50)] if variant == 'frysk' else DIAGONAL_RAYS
+        self.king_capture_value = 1.5 if variant == 'frysk' else 1
+
+    @classmethod
+    def from_fen(cls, fen, variant='standard'):
+        """ Build a position from a FEN like W:W31,32,K33:B1,2 """
+        cells = [0] * 50
+        parts = fen.split(':')
+        side = WHITE_SIDE if parts[0].upper().startswith('W') else BLACK_SIDE
+        for part in parts[1:]:
+            if not part:
+                continue
+            color = part[0]
+            for token in part[1:].split(','):
+                token = token.strip()
+                if not token:
+                    continue
+                is_king = token.startswith('K')
+                square = int(token.lstrip('K'))
+                if color == 'W':
+                    cells[square - 1] = WHITE_KING if is_king else WHITE_MAN
+                else:
+                    cells[square - 1] = BLACK_KING if is_king else BLACK_MAN
+        return cls(cells, side, variant)
+
+    def key(self):
+        return (tuple(self.cells), self.side)
+
+    def generate_moves(self):
+        """
+        Return the legal moves as (from, to, captured) tuples of square
+        indices, applying the capture-maximum rule.
+        """
+        captures = self.generate_captures()
+        if captures:
+            return captures
+
+        moves = []
+        cells = self.cells
+        side = self.side
+        forward = -1 if side == WHITE_SIDE else 1
+        for index in range(50):
+            piece = cells[index]
+            if piece * side <= 0:
+                continue
+            if piece == side:
+                # Man, one step diagonally forward
+                for dr, ray in DIAGONAL_RAYS[index]:
+                    if dr == forward and ray and cells[ray[0]] == 0:
+                        moves.append((index, ray[0], ()))
+            else:
+                # Flying king
+                for dr, ray in DIAGONAL_RAYS[index]:
+                    for target in ray:
+                        if cells[target] != 0:
+                            break
+                        moves.append((index, target, ()))
+        return moves
+
+    def generate_captures(self):
+        cells = self.cells
+        side = self.side
+        sequences = {}
+        for index in range(50):
+            piece = cells[index]
+            if piece * side <= 0:
+                continue
+            # Lift the piece while searching, so it can pass over its own starting square
+            cells[index] = 0
+            self.capture_sequences(index, index, piece, [], sequences)
+            cells[index] = piece
+
+        if not sequences:
+            return []
+        best = max(sequences.values())
+        return [move for move, value in sequences.items() if value == best]
+
+    def capture_sequences(self, origin, square, piece, captured, sequences):
+        cells = self.cells
+        side = self.side
+        found = False
+
+        for dr, ray in self.capture_rays[square]:
+            if abs(piece) == 1:
+                # A man jumps an adjacent enemy onto the square right behind it
+                if len(ray) < 2:
+                    continue
+                victim, landings = ray[0], ray[1:2]
+                if cells[victim] * side >= 0 or victim in captured or cells[landings[0]] != 0:
+                    continue
+            else:
+                # A king may jump from a distance and land on any empty square behind the victim
+                victim = None
+                position_in_ray = 0
+                for position_in_ray, target in enumerate(ray):
+                    if cells[target] != 0:
+                        victim = target
+                        break
+                if victim is None or cells[victim] * side >= 0 or victim in captured:
+                    continue
+                landings = []
+                for target in ray[position_in_ray + 1:]:
+                    if cells[target] != 0:
+                        break
+                    landings.append(target)
+                if not landings:
+                    continue
+
+            captured.append(victim)
+            for landing in landings:
+                found = True
+                self.capture_sequences(origin, landing, piece, captured, sequences)
+            captured.pop()
+
+        if not found and captured:
+            move = (origin, square, tuple(sorted(captured)))
+            if move not in sequences:
+                value = sum(self.king_capture_value if abs(cells[c]) == 2 else 1 for c in captured)
+                # Frisian: on equal value the capture has to be made with a king
+                sequences[move] = (value, abs(piece) == 2 and self.variant == 'frysk')
+
+    def push(self, move):
+        """ Apply a move, returns the data needed by pop """
+        origin, target, captured = move
+        cells = self.cells
+        piece = cells[origin]
+        removed = [cells[c] for c in captured]
+
+        cells[origin] = 0
+        for c in captured:
+            cells[c] = 0
+        if piece == WHITE_MAN and ROW_COL[target][0] == 0:
+            cells[target] = WHITE_KING
+        elif piece == BLACK_MAN and ROW_COL[target][0] == 9:
+            cells[target] = BLACK_KING
+        else:
+            cells[target] = piece
+        self.side = -self.side
+        return piece, removed
+
+    def pop(self, move, undo):
+        origin, target, captured = move
+        piece, removed = undo
+        cells = self.cells
+        cells[target] = 0
+        cells[origin] = piece
+        for c, value in zip(captured, removed):
+            cells[c] = value
+        self.side = -self.side
+
+    def evaluate(self):
+        """ Static evaluation from the side to move's point of view """
+        score = 0
+        for index, piece in enumerate(self.cells):
+            if piece == 0:
+                continue
+            row, col = ROW_COL[index]
+            if piece == WHITE_MAN:
+                score += MAN_VALUE + (9 - row) * 3 + (4 if 2 <= col <= 7 else 0)
+            elif piece == BLACK_MAN:
+                score -= MAN_VALUE + row * 3 + (4 if 2 <= col <= 7 else 0)
+            elif piece == WHITE_KING:
+                score += KING_VALUE
+            else:
+                score -= KING_VALUE
+        return score * self.side
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class DraughtsEngine:
+    """
+    Alpha-beta draughts searcher with iterative deepening, a transposition
+    table, forced-capture extension and a time / node budget.
+    """
+
+    def __init__(self):
+        self.tt = {}
+        self.nodes = 0
+        self.deadline = None
+        self.max_nodes = None
+        self.first_pass = False
+        self.quiescence_depth = MAX_QUIESCENCE_DEPTH
+
+    def play(self, board, time_limit=0.5, max_nodes=None, depth=64):
+        """
+        Choose a move for a pydraughts board, returns a pydraughts Move, None
+        when the game is over.
+        """
+        # Forced moves are played without a search, which must not report the last search's nodes
+        self.nodes = 0
+        legal_moves = board.legal_moves()
+        if not legal_moves:
+            return None
+        if len(legal_moves) == 1:
+            return legal_moves[0]
+
+        variant = 'frysk' if board.variant.startswith('frysk') else 'standard'
+        position = Position.from_fen(board.fen, variant)
+        root_moves = [(move, self.internal_move(move)) for move in legal_moves]
+
+        self.deadline = time.perf_counter() + time_limit if time_limit else None
+        self.max_nodes = max_nodes
+        if len(self.tt) > TT_MAX_ENTRIES:
+            self.tt.clear()
+
+        # A depth 1 pass with a short capture extension is never cut off by
+        # the budget, so even a tiny one plays a searched move
+        self.first_pass = True
+        self.quiescence_depth = FIRST_PASS_QUIESCENCE_DEPTH
+        try:
+            best, score = self.search_root(position, 1, root_moves)
+        finally:
+            self.first_pass = False
+            self.quiescence_depth = MAX_QUIESCENCE_DEPTH
+        root_moves.remove(best)
+        root_moves.insert(0, best)
+
+        for current_depth in range(1, depth + 1):
+            try:
+                best, score = self.search_root(position, current_depth, root_moves)
+            except SearchTimeout:
+                break
+            root_moves.remove(best)
+            root_moves.insert(0, best)
+            if abs(score) >= WIN_SCORE - 1000:
+                break
+        return best[0]
+
+    def internal_move(self, move):
+        steps = move.steps_move
+        captured = tuple(sorted(square - 1 for square in (move.captures or []) if square))
+        return (steps[0] - 1, steps[-1] - 1, captured)
+
+    def search_root(self, position, depth, root_moves):
+        alpha = -WIN_SCORE - 1
+        best = root_moves[0]
+        for root_move in root_moves:
+            move = root_move[1]
+            undo = position.push(move)
+            score = -self.negamax(position, depth - 1, -WIN_SCORE - 1, -alpha, 1)
+            position.pop(move, undo)
+            if score > alpha:
+                alpha = score
+                best = root_move
+        return best, alpha
+
+    def check_budget(self):
+        self.nodes += 1
+        if self.first_pass:
+            return
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise SearchTimeout()
+        if self.deadline is not None and self.nodes & 127 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    def negamax(self, position, depth, alpha, beta, ply):
+        self.check_budget()
+
+        moves = position.generate_moves()
+        if not moves:
+            # Side to move has no pieces or is blocked: it loses
+            return -WIN_SCORE + ply
+
+        # Never stop the search in the middle of forced captures
+        is_capture = bool(moves[0][2])
+        if depth <= 0 and (not is_capture or -depth >= self.quiescence_depth):
+            return position.evaluate()
+
+        key = position.key()
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, tt_move = entry
+            if entry_depth >= depth:
+                if entry_flag == EXACT:
+                    return entry_score
+                if entry_flag == LOWER and entry_score >= beta:
+                    return entry_score
+                if entry_flag == UPPER and entry_score <= alpha:
+                    return entry_score
+            if tt_move in moves:
+                moves.remove(tt_move)
+                moves.insert(0, tt_move)
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        for move in moves:
+            undo = position.push(move)
+            score = -self.negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            position.pop(move, undo)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if not self.first_pass:
+            # The first pass's truncated capture sequences must not stand in for full ones
+            self.tt[key] = (depth, best_score, flag, best_move)
+        return best_score
@@ -0,0 +1,350 @@
+"""
+Small in-process chess engine used for the low difficulty levels and as a
+fallback when Stockfish is not available.
+
+Negamax alpha-beta with iterative deepening, a transposition table, quiescence
+search on captures, MVV-LVA / killer move ordering and a material + piece-square
+table evaluation, all on top of python-chess bitboards.
+"""
+import random
+import time
+
+import chess
+
+MATE_SCORE = 100000
+MAX_QUIESCENCE_DEPTH = 6
+FIRST_PASS_QUIESCENCE_DEPTH = 1  # the opponent's replies that capture, no further
+TT_MAX_ENTRIES = 200000
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
+
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 320,
+    chess.BISHOP: 330,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0
+}
+
+# Piece-square tables from white's point of view, written with rank 8 on top
+# (simplified evaluation function by Tomasz Michniewski)
+PST = {
+    chess.PAWN: [
+         0,  0,  0,  0,  0,  0,  0,  0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+         5,  5, 10, 25, 25, 10,  5,  5,
+         0,  0,  0, 20, 20,  0,  0,  0,
+         5, -5,-10,  0,  0,-10, -5,  5,
+         5, 10, 10,-20,-20, 10, 10,  5,
+         0,  0,  0,  0,  0,  0,  0,  0
+    ],
+    chess.KNIGHT: [
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50
+    ],
+    chess.BISHOP: [
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20
+    ],
+    chess.ROOK: [
+         0,  0,  0,  0,  0,  0,  0,  0,
+         5, 10, 10, 10, 10, 10, 10,  5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+         0,  0,  0,  5,  5,  0,  0,  0
+    ],
+    chess.QUEEN: [
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+         -5,  0,  5,  5,  5,  5,  0, -5,
+          0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20
+    ],
+    chess.KING: [
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+         20, 20,  0,  0,  0,  0, 20, 20,
+         20, 30, 10,  0,  0, 10, 30, 20
+    ]
+}
+
+# Material + position value of a piece on a square, indexed [color][piece_type][square]
+SQUARE_VALUES = {
+    chess.WHITE: {pt: [PIECE_VALUES[pt] + table[chess.square_mirror(sq)] for sq in chess.SQUARES] for pt, table in PST.items()},
+    chess.BLACK: {pt: [PIECE_VALUES[pt] + table[sq] for sq in chess.SQUARES] for pt, table in PST.items()}
+}
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def evaluate(board):
+    """ Static evaluation in centipawns from the side to move's point of view """
+    score = 0
+    occupied_white = board.occupied_co[chess.WHITE]
+    for piece_type, mask in (
+        (chess.PAWN, board.pawns),
+        (chess.KNIGHT, board.knights),
+        (chess.BISHOP, board.bishops),
+        (chess.ROOK, board.rooks),
+        (chess.QUEEN, board.queens),
+        (chess.KING, board.kings)
+    ):
+        white_values = SQUARE_VALUES[chess.WHITE][piece_type]
+        black_values = SQUARE_VALUES[chess.BLACK][piece_type]
+        for square in chess.scan_forward(mask & occupied_white):
+            score += white_values[square]
+        for square in chess.scan_forward(mask & ~occupied_white):
+            score -= black_values[square]
+    return score if board.turn == chess.WHITE else -score
+
+
+class BuiltinEngine:
+    """
+    In-process alpha-beta searcher. One instance keeps its transposition table
+    between searches, so successive moves of the same game are cheap.
+    """
+
+    def __init__(self):
+        self.tt = {}
+        self.nodes = 0
+        self.deadline = None
+        self.first_pass = False
+        self.quiescence_depth = MAX_QUIESCENCE_DEPTH
+        self.killers = []
+
+    def play(self, board, depth=3, time_limit=0.05, skill_level=20):
+        """
+        Search the position and return the chosen chess.Move.
+        Skill level 0-20 mirrors Stockfish's option: below 20 a random move
+        within a score margin of the best one is played.
+        """
+        best_move, _, root_scores = self.search(board, depth, time_limit, skill_level < 20)
+        if skill_level < 20 and root_scores:
+            return self.pick_weakened(root_scores, skill_level)
+        return best_move
+
+    def analyse(self, board, depth=8, time_limit=0.1):
+        """
+        Return (best move, score in centipawns from the side to move's point of view).
+        The move is None when the game is over.
+        """
+        best_move, score, _ = self.search(board, depth, time_limit)
+        return best_move, score
+
+    def stop(self):
+        """ Make a running search return at its next time check, safe from another thread """
+        self.deadline = 0
+
+    def search(self, board, depth, time_limit, exact_root_scores=False):
+        board = board.copy(stack=8)
+        self.nodes = 0
+        self.deadline = time.perf_counter() + time_limit if time_limit else None
+        self.killers = [[None, None] for _ in range(64)]
+        if len(self.tt) > TT_MAX_ENTRIES:
+            self.tt.clear()
+
+        root_moves = list(board.legal_moves)
+        if not root_moves:
+            return None, (-MATE_SCORE if board.is_check() else 0), {}
+
+        # A depth 1 pass with a short quiescence is never cut off by the
+        # deadline, so even a tiny budget plays a searched move and weakened
+        # play has a score for every move to pick from
+        self.first_pass = True
+        self.quiescence_depth = FIRST_PASS_QUIESCENCE_DEPTH
+        try:
+            best_move, root_scores = self.search_root(board, 1, root_moves, exact_root_scores)
+        finally:
+            self.first_pass = False
+            self.quiescence_depth = MAX_QUIESCENCE_DEPTH
+        best_score = root_scores[best_move]
+        root_moves.remove(best_move)
+        root_moves.insert(0, best_move)
+
+        for current_depth in range(1, max(depth, 1) + 1):
+            if len(root_moves) == 1:
+                break
+            try:
+                best_move, root_scores = self.search_root(board, current_depth, root_moves, exact_root_scores)
+            except SearchTimeout:
+                break
+            best_score = root_scores[best_move]
+            # Search the best move first on the next iteration
+            root_moves.remove(best_move)
+            root_moves.insert(0, best_move)
+
+        return best_move, best_score, root_scores
+
+    def pick_weakened(self, root_scores, skill_level):
+        best_score = max(root_scores.values())
+        margin = (20 - skill_level) * 15
+        candidates = [move for move, score in root_scores.items() if score >= best_score - margin]
+        return random.choice(candidates)
+
+    def search_root(self, board, depth, root_moves, exact_scores):
+        alpha = -MATE_SCORE - 1
+        beta = MATE_SCORE + 1
+        best_move = root_moves[0]
+        scores = {}
+
+        for move in root_moves:
+            board.push(move)
+            if board.is_checkmate():
+                # The quiescence search of a depth 1 iteration does not see mates
+                score = MATE_SCORE - 1
+            else:
+                # Weakened play needs a real score for every root move, not just a bound
+                window_alpha = -MATE_SCORE - 1 if exact_scores else alpha
+                score = -self.negamax(board, depth - 1, -beta, -window_alpha, 1)
+            board.pop()
+            scores[move] = score
+            if score > alpha:
+                alpha = score
+                best_move = move
+
+        if not self.first_pass:
+            # The first pass's shallow scores must not stand in for full depth 1 ones
+            self.tt[board._transposition_key()] = (depth, alpha, EXACT, best_move)
+        return best_move, scores
+
+    def check_time(self):
+        self.nodes += 1
+        if (self.deadline is not None and not self.first_pass and self.nodes & 15 == 0
+                and time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+    def negamax(self, board, depth, alpha, beta, ply):
+        self.check_time()
+
+        if board.halfmove_clock >= 100 or (board.halfmove_clock >= 4 and board.is_repetition(2)):
+            return 0
+
+        key = board._transposition_key()
+        entry = self.tt.get(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, tt_move = entry
+            if entry_depth >= depth:
+                if entry_flag == EXACT:
+                    return entry_score
+                if entry_flag == LOWER and entry_score >= beta:
+                    return entry_score
+                if entry_flag == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        if depth <= 0:
+            return self.quiescence(board, alpha, beta, 0)
+
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = None
+        has_moves = False
+
+        for move in self.ordered_moves(board, tt_move, ply):
+            has_moves = True
+            board.push(move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.pop()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not board.is_capture(move) and ply < len(self.killers):
+                    killers = self.killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                break
+
+        if not has_moves:
+            # Checkmate (prefer the shortest mate) or stalemate
+            return -MATE_SCORE + ply if board.is_check() else 0
+
+        if best_score <= original_alpha:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt[key] = (depth, best_score, flag, best_move)
+        return best_score
+
+    def quiescence(self, board, alpha, beta, qdepth):
+        self.check_time()
+
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or qdepth >= self.quiescence_depth:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        for move in self.ordered_captures(board):
+            board.push(move)
+            score = -self.quiescence(board, -beta, -alpha, qdepth + 1)
+            board.pop()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def capture_order(self, board, move):
+        # Most valuable victim, least valuable attacker
+        victim = board.piece_type_at(move.to_square) or chess.PAWN  # en passant
+        attacker = board.piece_type_at(move.from_square)
+        return PIECE_VALUES[victim] * 10 - PIECE_VALUES[attacker] + (PIECE_VALUES[move.promotion] if move.promotion else 0)
+
+    def ordered_captures(self, board):
+        captures = list(board.generate_legal_captures())
+        captures.sort(key=lambda move: self.capture_order(board, move), reverse=True)
+        return captures
+
+    def ordered_moves(self, board, tt_move, ply):
+        killers = self.killers[ply] if ply < len(self.killers) else (None, None)
+
+        def order(move):
+            if move == tt_move:
+                return 1000000
+            if board.is_capture(move):
+                return 100000 + self.capture_order(board, move)
+            if move.promotion:
+                return 90000 + PIECE_VALUES[move.promotion]
+            if move == killers[0]:
+                return 80000
+            if move == killers[1]:
+                return 70000
+            return 0
+
+        moves = list(board.legal_moves)
+        moves.sort(key=order, reverse=True)
+        return moves
@@ -0,0 +1,43 @@
+"""
+Response compression.
+
+Compresses buffered JSON, MessagePack and text responses for clients that
+accept gzip.
+Streamed responses (the NDJSON review) are left alone, compressing them would
+hold every line back until the buffer fills.
+"""
+import gzip
+
+from flask import request
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-msgpack', 'text/', 'application/javascript', 'image/svg+xml')
+
+
+def accepts_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+
+def install_gzip(app, min_size=1024, level=6):
+    """ Register an after_request hook gzipping responses of at least min_size bytes """
+
+    @app.after_request
+    def gzip_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not accepts_gzip():
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    return gzip_response
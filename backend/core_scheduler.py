@@ -0,0 +1,99 @@
+"""
+CPU threads and hash memory for the pooled engines.
+
+Every search asks for its share before it starts, and the engine is
+reconfigured (Threads, Hash) between searches when its share changed. A lone
+search gets all the cores, concurrent ones split them; the threads already
+handed out are never given twice, so the engines together stay within the
+cores (each search still gets at least one thread).
+
+Hash works the same way against a memory budget, but an engine keeps its
+table while it fits: resizing clears it, so it only shrinks when the budget
+is needed by the other engines and only grows when it is well under its share.
+Sizes are powers of two, as engines round them anyway.
+"""
+import threading
+from contextlib import contextmanager
+
+MIN_HASH_MB = 16
+
+
+def floor_power_of_two(value):
+    return 1 << (max(1, int(value)).bit_length() - 1)
+
+
+class Grant:
+    __slots__ = ('threads', 'hash_mb')
+
+    def __init__(self, threads, hash_mb):
+        self.threads = threads
+        self.hash_mb = hash_mb
+
+
+class CoreScheduler:
+
+    def __init__(self, cores, hash_mb):
+        self.cores = cores
+        self.hash_budget = hash_mb
+        self.lock = threading.Lock()
+        self.active = 0
+        self.threads_in_use = 0
+        self.hash = {}     # engine name -> hash size it was granted
+        self.applied = {}  # engine name -> (engine, threads, hash) last sent to it
+        self.searches = 0
+        self.reconfigurations = 0
+
+    def grant(self, name):
+        """ Threads and hash of the next search on the named engine """
+        with self.lock:
+            self.active += 1
+            self.searches += 1
+            free = self.cores - self.threads_in_use
+            threads = max(1, min(self.cores // self.active, free))
+            self.threads_in_use += threads
+
+            current = self.hash.get(name)
+            others = sum(size for engine, size in self.hash.items() if engine != name)
+            share = self.hash_budget // self.active
+            allowed = min(share, self.hash_budget - others)
+            if current is None or current > self.hash_budget - others or current < share // 4:
+                self.hash[name] = floor_power_of_two(max(MIN_HASH_MB, allowed))
+            return Grant(threads, self.hash[name])
+
+    def release(self, grant):
+        with self.lock:
+            self.active -= 1
+            self.threads_in_use -= grant.threads
+
+    def configure(self, name, engine, grant):
+        """ Send the grant to the engine when it differs from what it runs with """
+        applied = self.applied.get(name)
+        if applied is not None and applied[0] is engine and applied[1:] == (grant.threads, grant.hash_mb):
+            return
+        options = {option: value for option, value in (('Threads', grant.threads), ('Hash', grant.hash_mb))
+                   if option in engine.options}
+        engine.configure(options)
+        with self.lock:
+            self.applied[name] = (engine, grant.threads, grant.hash_mb)
+            self.reconfigurations += 1
+
+    @contextmanager
+    def resources(self, name, engine):
+        grant = self.grant(name)
+        try:
+            self.configure(name, engine, grant)
+            yield grant
+        finally:
+            self.release(grant)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'cores': self.cores,
+                'hash_budget_mb': self.hash_budget,
+                'active': self.active,
+                'threads_in_use': self.threads_in_use,
+                'hash_mb': dict(self.hash),
+                'searches': self.searches,
+                'reconfigurations': self.reconfigurations
+            }
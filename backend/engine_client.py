@@ -0,0 +1,163 @@
+"""
+Client of the engine service (see engine_service.py).
+
+Keeps a few open connections to the service and runs one request at a time on
+each. Failures are raised as the local engine errors (EngineUnavailable,
+EngineTimeout), so callers fall back to the built-in engines as they do when
+a local engine fails. A request on a connection the service has closed in
+the meantime (a restart) is retried once on a new one.
+"""
+import itertools
+import json
+import queue
+import socket
+import threading
+
+import chess
+import chess.engine
+
+from engine_supervisor import EngineUnavailable, EngineTimeout
+
+CONNECT_TIMEOUT = 2.0  # seconds
+REPLY_GRACE = 1.0      # seconds on top of the deadline the service enforces, for the transport
+
+
+class Connection:
+    __slots__ = ('sock', 'reader')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class EngineClient:
+
+    def __init__(self, address, max_idle=8):
+        self.address = address
+        self.max_idle = max_idle
+        self.idle = queue.LifoQueue()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.reconnects = 0
+
+    def connect(self):
+        kind, _, where = self.address.partition(':')
+        try:
+            if kind == 'unix':
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(CONNECT_TIMEOUT)
+                sock.connect(where)
+            elif kind == 'tcp':
+                host, _, port = where.rpartition(':')
+                sock = socket.create_connection((host or '127.0.0.1', int(port)), CONNECT_TIMEOUT)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            else:
+                raise EngineUnavailable(f'unknown engine service address {self.address}')
+        except OSError as e:
+            raise EngineUnavailable(f'engine service unreachable: {e}')
+        return Connection(sock)
+
+    def exchange(self, connection, request, timeout):
+        """ The answer line to the request, None when the service closed the connection """
+        connection.sock.settimeout(timeout)
+        connection.sock.sendall(json.dumps(request).encode() + b'\n')
+        return connection.reader.readline() or None
+
+    def call(self, op, timeout, **params):
+        with self.lock:
+            self.requests += 1
+        request = {'id': next(self.ids), 'op': op, **params}
+        try:
+            connection, reused = self.idle.get_nowait(), True
+        except queue.Empty:
+            connection, reused = self.connect(), False
+
+        try:
+            try:
+                line = self.exchange(connection, request, timeout)
+            except (BrokenPipeError, ConnectionResetError):
+                line = None
+            if line is None and reused:
+                # The service restarted since the connection was last used
+                connection.close()
+                with self.lock:
+                    self.reconnects += 1
+                connection = self.connect()
+                line = self.exchange(connection, request, timeout)
+            if line is None:
+                raise EngineUnavailable('engine service closed the connection')
+        except socket.timeout:
+            connection.close()
+            self.failed()
+            raise EngineTimeout(f'no answer from the engine service within {timeout:.1f} s')
+        except OSError as e:
+            connection.close()
+            self.failed()
+            raise EngineUnavailable(f'engine service failed: {e}')
+        except EngineUnavailable:
+            connection.close()
+            self.failed()
+            raise
+
+        if self.idle.qsize() < self.max_idle:
+            self.idle.put(connection)
+        else:
+            connection.close()
+
+        answer = json.loads(line)
+        if 'error' in answer:
+            self.failed()
+            kind = answer.get('kind')
+            if kind == 'timeout':
+                raise EngineTimeout(answer['error'])
+            if kind == 'unavailable':
+                raise EngineUnavailable(answer['error'])
+            # Rejected options or limits, as a local engine would report them
+            raise chess.engine.EngineError(answer['error'])
+        return answer['result']
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+
+    def chess_move(self, board, limit, options, deadline):
+        """ (move, expected reply or None, search info) of a Stockfish search """
+        result = self.call('chess_move', deadline + REPLY_GRACE, fen=board.fen(), depth=limit.depth, time=limit.time,
+                           nodes=limit.nodes, options=options, deadline=deadline)
+        ponder = chess.Move.from_uci(result['ponder']) if result['ponder'] else None
+        return chess.Move.from_uci(result['move']), ponder, {'nodes': result['nodes'], 'time': result['time'] or 0}
+
+    def chess_hint(self, board, time_limit, deadline):
+        return chess.Move.from_uci(self.call('chess_hint', deadline + REPLY_GRACE, fen=board.fen(), time=time_limit,
+                                             deadline=deadline)['move'])
+
+    def checkers_move(self, board, time_limit, deadline):
+        """ The move of a Scan search, one of board's legal moves """
+        pdn = self.call('checkers_move', deadline + REPLY_GRACE, variant=board.variant, fen=board.fen,
+                        time=time_limit, deadline=deadline)['move']
+        for move in board.legal_moves():
+            if move.pdn_move == pdn:
+                return move
+        raise EngineUnavailable(f'engine service answered an illegal move {pdn}')
+
+    def ping(self):
+        return self.call('ping', CONNECT_TIMEOUT) == 'pong'
+
+    def stats(self):
+        with self.lock:
+            return {
+                'address': self.address,
+                'requests': self.requests,
+                'failures': self.failures,
+                'reconnects': self.reconnects,
+                'idle_connections': self.idle.qsize()
+            }
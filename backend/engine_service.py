@@ -0,0 +1,202 @@
+"""
+Engine service: one set of Stockfish and Scan processes shared by all web
+workers, on this host or on others.
+
+Without it every web worker starts its own engines, each with its own hash
+tables and network weights. Run the service once and point the workers at it
+with ENGINE_SERVICE=unix:/path/to/socket or ENGINE_SERVICE=tcp:host:port; their
+AI moves, hints and checkers moves are then searched here (see
+engine_client.py). Pondering, live analysis and reviews keep their own engines.
+
+The protocol is one JSON object per line in both directions. A request has an
+"id", an "op" and the op's parameters; the answer repeats the id with either
+a "result" or an "error" and its "kind" (unavailable, timeout or invalid).
+Requests on one connection are answered in order.
+
+  ping            -> "pong"
+  chess_move      fen, depth, time, nodes, options, deadline -> {move, ponder, nodes, time}
+  chess_hint      fen, time, deadline -> {move}
+  checkers_move   variant, fen, time, deadline -> {move} (PDN notation)
+  stats           -> counters of the engines
+
+The deadline (seconds) covers the wait for a free engine and the search, the
+client waits for it plus the transport (engine_client.REPLY_GRACE). A search
+never outlives the client waiting for it.
+
+Usage: python engine_service.py [--listen unix:PATH | tcp:HOST:PORT] [--stockfish N] [--scan N]
+                                [--threads N] [--hash MB]
+"""
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+
+import chess
+import chess.engine
+from draughts import Board
+from draughts.engine import Limit
+
+from core_scheduler import CoreScheduler
+from engine_supervisor import EnginePool, EngineUnavailable, EngineTimeout
+from engines import start_stockfish, stop_stockfish, is_fatal_stockfish_error, initialize_engine, stop_scan
+
+DEFAULT_ADDRESS = 'unix:/tmp/fit-chess-engines.sock'
+SEARCH_DEADLINE_GRACE = 2.0  # seconds on top of a time limited search
+
+
+class InvalidRequest(Exception):
+    pass
+
+
+class EngineService:
+
+    def __init__(self, stockfish_engines, scan_engines, threads, hash_mb):
+        self.scheduler = CoreScheduler(threads, hash_mb)
+        self.stockfish = EnginePool('stockfish', stockfish_engines, start_stockfish, stop_stockfish,
+                                    is_fatal_stockfish_error, self.scheduler)
+        self.scan = EnginePool('scan', scan_engines, initialize_engine, stop_scan)
+        self.requests = 0
+        self.failures = 0
+
+    def chess_move(self, fen, depth=None, time=None, nodes=None, options=None, deadline=10):
+        board = chess.Board(fen)
+        limit = chess.engine.Limit(depth=depth, time=time, nodes=nodes)
+
+        def play(engine):
+            result = engine.play(board, limit, options=options or {}, info=chess.engine.INFO_BASIC)
+            return {
+                'move': result.move.uci(),
+                'ponder': result.ponder.uci() if result.ponder else None,
+                'nodes': result.info.get('nodes'),
+                'time': result.info.get('time')
+            }
+
+        return self.stockfish.run(play, deadline)
+
+    def chess_hint(self, fen, time=0.1, deadline=None):
+        board = chess.Board(fen)
+        limit = chess.engine.Limit(time=time)
+        return self.stockfish.run(lambda engine: {'move': engine.play(board, limit).move.uci()},
+                                  deadline or time + SEARCH_DEADLINE_GRACE)
+
+    def checkers_move(self, variant, fen, time, deadline=None):
+        board = Board(variant=variant, fen=fen)
+        limit = Limit(time=time)
+        return self.scan.run(lambda scan: {'move': scan.play(board, limit, ponder=False).move.pdn_move},
+                             deadline or time + SEARCH_DEADLINE_GRACE)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'stockfish': self.stockfish.stats(),
+            'scan': self.scan.stats(),
+            'cores': self.scheduler.stats()
+        }
+
+    def handle(self, request):
+        """ The answer to one request """
+        self.requests += 1
+        answer = {'id': request.get('id')}
+        params = {key: value for key, value in request.items() if key not in ('id', 'op')}
+        try:
+            op = request.get('op')
+            if op == 'ping':
+                answer['result'] = 'pong'
+            elif op == 'stats':
+                answer['result'] = self.stats()
+            elif op in ('chess_move', 'chess_hint', 'checkers_move'):
+                answer['result'] = getattr(self, op)(**params)
+            else:
+                raise InvalidRequest(f'unknown op {op!r}')
+        except EngineTimeout as e:
+            answer.update(error=str(e), kind='timeout')
+        except EngineUnavailable as e:
+            answer.update(error=str(e), kind='unavailable')
+        except (InvalidRequest, TypeError, ValueError, chess.engine.EngineError) as e:
+            answer.update(error=str(e), kind='invalid')
+        if 'error' in answer:
+            self.failures += 1
+        return answer
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                answer = {'id': None, 'error': 'invalid JSON', 'kind': 'invalid'}
+            else:
+                answer = self.server.service.handle(request)
+            try:
+                self.wfile.write(json.dumps(answer).encode() + b'\n')
+                self.wfile.flush()
+            except OSError:
+                return  # the client gave up on the answer and closed the connection
+
+
+class TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(address, service):
+    kind, _, where = address.partition(':')
+    if kind == 'unix':
+        if os.path.exists(where):
+            os.unlink(where)  # left over by a previous run
+
+        class UnixServer(socketserver.ThreadingUnixStreamServer):
+            daemon_threads = True
+
+        server = UnixServer(where, RequestHandler)
+    elif kind == 'tcp':
+        host, _, port = where.rpartition(':')
+        server = TCPServer((host or '127.0.0.1', int(port)), RequestHandler)
+    else:
+        raise ValueError(f'Unknown engine service address {address}')
+    server.service = service
+    return server
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Engine service shared by the web workers')
+    parser.add_argument('--listen', default=os.environ.get('ENGINE_SERVICE', DEFAULT_ADDRESS),
+                        help='unix:PATH or tcp:HOST:PORT')
+    parser.add_argument('--stockfish', type=int, default=int(os.environ.get('STOCKFISH_POOL_SIZE', max(1, cores // 2))),
+                        help='Stockfish processes')
+    parser.add_argument('--scan', type=int, default=1, help='Scan processes')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('ENGINE_THREADS', cores)),
+                        help='threads shared by the Stockfish searches')
+    parser.add_argument('--hash', type=int, default=int(os.environ.get('ENGINE_HASH_MB', 256)),
+                        help='hash budget of the Stockfish processes in MB')
+    args = parser.parse_args()
+
+    service = EngineService(args.stockfish, args.scan, args.threads, args.hash)
+    try:
+        server = make_server(args.listen, service)
+    except (OSError, ValueError) as e:
+        print(f'Could not listen on {args.listen}: {e}')
+        sys.exit(1)
+    # SIGTERM stops the service like Ctrl+C, the engines are stopped at exit
+    signal.signal(signal.SIGTERM, interrupt)
+    print(f'Engine service listening on {args.listen}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
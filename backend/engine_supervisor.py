@@ -0,0 +1,249 @@
+"""
+Supervision of long-running engine processes (Stockfish, Scan).
+
+Every search runs with a hard deadline. An engine that crashes, errors out or
+misses its deadline is killed and started again on the next use, with an
+exponential backoff between failed starts, so a single bad position can't
+wedge the engine for every later request.
+"""
+import atexit
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+BACKOFF_BASE = 0.5   # seconds before the first restart attempt after a failure
+BACKOFF_MAX = 30.0
+
+
+# Every supervisor ever created, stopped at interpreter exit
+supervisors = []
+supervisors_lock = threading.Lock()
+
+
+def stop_all():
+    with supervisors_lock:
+        for supervisor in supervisors:
+            supervisor.close()
+
+
+# The python-chess engine threads are not daemons and would block the exit
+# otherwise, so stop the engines before those threads are joined (the same
+# hook concurrent.futures uses for its workers)
+if hasattr(threading, '_register_atexit'):
+    threading._register_atexit(stop_all)
+else:
+    atexit.register(stop_all)
+
+
+class EngineUnavailable(Exception):
+    pass
+
+
+class EngineTimeout(Exception):
+    pass
+
+
+class EngineSupervisor:
+    """
+    Owns one engine process. start() must return a ready engine (or None when
+    the engine is not installed), stop(engine) must kill it without blocking.
+    is_fatal(error) tells whether a search error means the engine is broken.
+    """
+
+    def __init__(self, name, start, stop, is_fatal=None):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.is_fatal = is_fatal or (lambda error: True)
+        self.engine = None
+        self.state = 'idle'  # idle, ready, backoff, unavailable
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'engine-{name}')
+        self.next_start = 0.0
+        self.consecutive_failures = 0
+        self.starts = 0
+        self.restarts = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.searches = 0
+        self.last_error = None
+        with supervisors_lock:
+            supervisors.append(self)
+
+    def is_ready(self):
+        return self.engine is not None
+
+    def ensure_started(self):
+        """ Start the engine if needed, call with the lock held """
+        if self.engine is not None:
+            return self.engine
+        if self.state == 'unavailable':
+            raise EngineUnavailable(f'{self.name} is not installed')
+        if time.monotonic() < self.next_start:
+            raise EngineUnavailable(f'{self.name} is restarting')
+
+        try:
+            engine = self.start()
+        except Exception as e:
+            self.record_failure(f'start failed: {e}')
+            raise EngineUnavailable(self.last_error)
+
+        if engine is None:
+            self.state = 'unavailable'
+            raise EngineUnavailable(f'{self.name} is not installed')
+
+        if self.starts > 0:
+            self.restarts += 1
+        self.starts += 1
+        self.engine = engine
+        self.state = 'ready'
+        return engine
+
+    def warm_up(self):
+        """ Start the engine ahead of the first search, returns True when it is ready """
+        with self.lock:
+            try:
+                self.ensure_started()
+            except EngineUnavailable:
+                return False
+            return True
+
+    def record_failure(self, error):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.consecutive_failures - 1))
+        self.next_start = time.monotonic() + backoff
+        self.state = 'backoff'
+
+    def kill(self, error):
+        """ Kill the engine after a failure, a fresh one is started on the next search """
+        engine = self.engine
+        self.engine = None
+        self.record_failure(error)
+        if engine is not None:
+            try:
+                self.stop(engine)
+            except Exception as e:
+                print(f"Warning: could not stop {self.name}: {e}")
+        # The worker thread may still be stuck inside the dead engine, don't reuse it
+        self.executor.shutdown(wait=False)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'engine-{self.name}')
+
+    def run(self, search, deadline):
+        """
+        Run search(engine) with a hard deadline in seconds and return its result.
+        Raises EngineUnavailable (also when the engine died mid-search), EngineTimeout
+        or the search's own error when it is not fatal. The deadline also covers
+        the wait for a running search of another caller.
+        """
+        end = time.monotonic() + deadline
+        if not self.lock.acquire(timeout=deadline):
+            raise EngineUnavailable(f'{self.name} is busy with another search')
+        try:
+            engine = self.ensure_started()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise EngineTimeout(f'{self.name} was not free within the {deadline:.1f} s deadline')
+            self.searches += 1
+            future = self.executor.submit(search, engine)
+            try:
+                result = future.result(timeout=remaining)
+            except FutureTimeout:
+                self.timeouts += 1
+                self.kill(f'search exceeded the {deadline:.1f} s deadline')
+                raise EngineTimeout(self.last_error)
+            except Exception as e:
+                if not self.is_fatal(e):
+                    raise
+                self.kill(f'search failed: {e}')
+                raise EngineUnavailable(self.last_error) from e
+            self.consecutive_failures = 0
+            return result
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """ Stop the engine for good """
+        engine = self.engine
+        self.engine = None
+        self.state = 'unavailable'
+        if engine is not None:
+            try:
+                self.stop(engine)
+            except Exception as e:
+                print(f"Warning: could not stop {self.name}: {e}")
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'starts': self.starts,
+            'restarts': self.restarts,
+            'searches': self.searches,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+
+class EnginePool:
+    """
+    A fixed set of supervised engines of one kind. run() borrows a free
+    engine, so concurrent searches use separate processes. With a scheduler
+    (see core_scheduler.py) every search first gets its threads and hash.
+    """
+
+    def __init__(self, name, size, start, stop, is_fatal=None, scheduler=None):
+        self.name = name
+        self.scheduler = scheduler
+        self.supervisors = [EngineSupervisor(f'{name}-{i}', start, stop, is_fatal) for i in range(size)]
+        self.free = queue.Queue()
+        for supervisor in self.supervisors:
+            self.free.put(supervisor)
+        self.on_busy = None  # called when a search has to wait, background work can give its engine back
+
+    def run(self, search, deadline):
+        """ Run search(engine) on a free engine; deadline covers the wait for one and the search """
+        end = time.monotonic() + deadline
+        try:
+            supervisor = self.free.get_nowait()
+        except queue.Empty:
+            if self.on_busy is not None:
+                self.on_busy()
+            try:
+                supervisor = self.free.get(timeout=deadline)
+            except queue.Empty:
+                raise EngineUnavailable(f'all {self.name} engines are busy')
+        try:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise EngineTimeout(f'no {self.name} engine was free within the {deadline:.1f} s deadline')
+            return self.run_on(supervisor, search, remaining)
+        finally:
+            self.free.put(supervisor)
+
+    def run_on(self, supervisor, search, deadline):
+        """ Run search(engine) on one of the pool's engines, borrowed by the caller """
+        if self.scheduler is None:
+            return supervisor.run(search, deadline)
+
+        def scheduled(engine):
+            with self.scheduler.resources(supervisor.name, engine):
+                return search(engine)
+
+        return supervisor.run(scheduled, deadline)
+
+    def try_borrow(self):
+        """ A free engine's supervisor for background work, None when all are busy; hand it back with give_back() """
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            return None
+
+    def give_back(self, supervisor):
+        self.free.put(supervisor)
+
+    def stats(self):
+        return {supervisor.name: supervisor.stats() for supervisor in self.supervisors}
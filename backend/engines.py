@@ -0,0 +1,72 @@
+"""
+Starting and stopping the engine processes, shared by the web app and the
+engine service (see engine_service.py).
+"""
+import os
+import shutil
+import signal
+
+import chess.engine
+from draughts.engine import HubEngine
+
+STOCKFISH_PATH = os.environ.get('STOCKFISH_PATH', "C:\\stockfish\\stockfish-windows-x86-64-avx2.exe")
+
+
+def stockfish_available():
+    return os.path.isfile(STOCKFISH_PATH) or shutil.which(STOCKFISH_PATH) is not None
+
+
+def start_stockfish():
+    return chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
+
+
+def stop_stockfish(engine):
+    # close() waits for a polite exit that a wedged engine never makes
+    try:
+        os.kill(engine.transport.get_pid(), signal.SIGKILL)
+    except (OSError, AttributeError):
+        pass
+    engine.close()
+
+
+def is_fatal_stockfish_error(error):
+    # Rejected options or limits are not the engine's fault, anything else is
+    return isinstance(error, chess.engine.EngineTerminatedError) or not isinstance(error, chess.engine.EngineError)
+
+
+def initialize_engine():
+    """
+    Initialize the Scan engine if all necessary files exist in the backend directory.
+    """
+    # All scan.exe, scan.ini and data folder should be in backend file to work!
+    backend_dir = os.path.dirname(os.path.abspath(__file__))  # Get the backend directory
+    scan_exe = os.path.join(backend_dir, "scan.exe")
+    scan_ini = os.path.join(backend_dir, "scan.ini")
+    data_dir = os.path.join(backend_dir, "data")
+
+    # Check if all required files and directories exist
+    if not os.path.exists(scan_exe):
+        print("Warning: scan.exe not found in the backend directory. Skipping engine initialization.")
+        return None
+    
+    if not os.path.exists(scan_ini):
+        print("Warning: scan.ini not found in the backend directory. Skipping engine initialization.")
+        return None
+    
+    if not os.path.exists(data_dir):
+        print("Warning: data directory not found in the backend directory. Skipping engine initialization.")
+        return None
+
+    try:
+        # Scan reads scan.ini and data from its working directory
+        engine = HubEngine([scan_exe, "hub"], cwd=backend_dir)
+        engine.init()
+        return engine
+    
+    except Exception as e:
+        print(f"Error initializing Scan engine: {e}")
+        raise
+
+
+def stop_scan(engine):
+    engine.kill_process()
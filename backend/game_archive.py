@@ -0,0 +1,161 @@
+"""
+Append-only archive of finished multiplayer games.
+
+Finished games are moved out of the game store into segment files, one per
+day of finishing, with a new segment started when one grows past
+SEGMENT_MAX_BYTES:
+
+  games-2026-10-19-0.seg
+
+A segment is a sequence of frames: a header (payload length, game id length),
+the game id and the archived record as zlib compressed JSON. The compressor is
+primed with the keys every record repeats (ZDICT), which takes a large share
+off these small records. A frame is written with a single append, so several
+worker processes can archive into the same files.
+
+The game id index (segment and offset of every game) is built from the frame
+headers when the archive is opened, without decompressing anything, and
+picks up the frames appended since (also by other processes) when a lookup
+misses. Range scans read the segments of the requested days in order and
+decompress one game at a time.
+"""
+import datetime
+import json
+import os
+import re
+import struct
+import threading
+import zlib
+
+HEADER = struct.Struct('>IH')  # payload length, game id length
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+SEGMENT_NAME = re.compile(r'^games-(\d{4}-\d{2}-\d{2})-(\d+)\.seg$')
+
+# Primes the compression of every record. Segments can only be read with the
+# dictionary they were written with, never change it.
+ZDICT = (b'{"game_id": "", "finished_at": "", "result": "1-0", "termination": "checkmate", "game": '
+         b'{"root_fen": null, "moves": [], "white": "", "black": "", "game_name": "Untitled Game", '
+         b'"theme": "regular", "is_complete": true, "is_game_over": true, "clock": {"base": , "increment": , '
+         b'"remaining": {"white": , "black": }, "running": null, "turn_started": , "flagged": null}, '
+         b'"premoves": {"white": [], "black": []}, "finished_at": }} 0-1 1/2-1/2 stalemate time '
+         b'insufficient_material seventyfive_moves fivefold_repetition 127.0.0.1')
+
+
+def compress(record):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY, ZDICT)
+    return compressor.compress(json.dumps(record).encode()) + compressor.flush()
+
+
+def decompress(payload):
+    return json.loads(zlib.decompressobj(zdict=ZDICT).decompress(payload))
+
+
+def segment_order(name):
+    day, number = SEGMENT_NAME.match(name).groups()
+    return day, int(number)
+
+
+class GameArchive:
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.index = {}    # game id -> (segment, offset of its frame)
+        self.scanned = {}  # segment -> bytes of it indexed so far
+        self.refresh()
+
+    def path(self, segment):
+        return os.path.join(self.directory, segment)
+
+    def segments(self, start=None, end=None):
+        """ Segment names in order, of the days from start to end (YYYY-MM-DD, both included) """
+        names = sorted((name for name in os.listdir(self.directory) if SEGMENT_NAME.match(name)), key=segment_order)
+        return [name for name in names
+                if (start is None or segment_order(name)[0] >= start) and (end is None or segment_order(name)[0] <= end)]
+
+    def refresh(self):
+        """ Index the frames appended since the last refresh """
+        with self.lock:
+            for segment in self.segments():
+                offset = self.scanned.get(segment, 0)
+                if os.path.getsize(self.path(segment)) == offset:
+                    continue
+                with open(self.path(segment), 'rb') as file:
+                    file.seek(offset)
+                    while True:
+                        header = file.read(HEADER.size)
+                        if len(header) < HEADER.size:
+                            break
+                        length, id_length = HEADER.unpack(header)
+                        game_id = file.read(id_length)
+                        frame_end = offset + HEADER.size + id_length + length
+                        # A frame still being written is indexed next time
+                        if len(game_id) < id_length or os.fstat(file.fileno()).st_size < frame_end:
+                            break
+                        self.index[game_id.decode()] = (segment, offset)
+                        file.seek(frame_end)
+                        offset = frame_end
+                self.scanned[segment] = offset
+
+    def append(self, game_id, record, finished_at):
+        """ Archive the record of a game finished at finished_at (seconds since the epoch) """
+        day = datetime.datetime.fromtimestamp(finished_at, datetime.timezone.utc).strftime('%Y-%m-%d')
+        key = game_id.encode()
+        payload = compress(record)
+        frame = HEADER.pack(len(payload), len(key)) + key + payload
+
+        with self.lock:
+            todays = self.segments(day, day)
+            number = segment_order(todays[-1])[1] if todays else 0
+            segment = f'games-{day}-{number}.seg'
+            if os.path.exists(self.path(segment)) and os.path.getsize(self.path(segment)) + len(frame) > SEGMENT_MAX_BYTES:
+                segment = f'games-{day}-{number + 1}.seg'
+            # One unbuffered write, appends of other processes can't interleave with it
+            fd = os.open(self.path(segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, frame)
+            finally:
+                os.close(fd)
+        self.refresh()
+
+    def read(self, segment, offset):
+        with open(self.path(segment), 'rb') as file:
+            file.seek(offset)
+            length, id_length = HEADER.unpack(file.read(HEADER.size))
+            file.seek(id_length, os.SEEK_CUR)
+            return decompress(file.read(length))
+
+    def get(self, game_id):
+        """ The archived record of a game, None when it is not archived """
+        location = self.index.get(game_id)
+        if location is None:
+            self.refresh()  # another process may have archived it
+            location = self.index.get(game_id)
+        return None if location is None else self.read(*location)
+
+    def __contains__(self, game_id):
+        return self.index.get(game_id) is not None
+
+    def scan(self, start=None, end=None):
+        """ Records of the games finished from day start to day end, oldest segment first """
+        for segment in self.segments(start, end):
+            with open(self.path(segment), 'rb') as file:
+                while True:
+                    header = file.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        break
+                    length, id_length = HEADER.unpack(header)
+                    file.seek(id_length, os.SEEK_CUR)
+                    payload = file.read(length)
+                    if len(payload) < length:
+                        break
+                    yield decompress(payload)
+
+    def stats(self):
+        segments = self.segments()
+        return {
+            'games': len(self.index),
+            'segments': len(segments),
+            'bytes': sum(os.path.getsize(self.path(segment)) for segment in segments)
+        }
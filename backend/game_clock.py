@@ -0,0 +1,89 @@
+"""
+Chess clock of a multiplayer game: base time plus an increment per move.
+
+The clock only stores the remaining time of both sides and the wall clock
+time the running side's turn started, so it can be saved in a shared state
+store and read by any worker; the running side's time is worked out when it
+is read. Times are in milliseconds.
+"""
+import time
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class GameClock:
+    __slots__ = ('base', 'increment', 'remaining', 'running', 'turn_started', 'flagged')
+
+    def __init__(self, base, increment):
+        self.base = base
+        self.increment = increment
+        self.remaining = {'white': base, 'black': base}
+        self.running = None       # the side whose time runs, None before the start and after the end
+        self.turn_started = None  # wall clock ms when the running side's turn began
+        self.flagged = None       # the side that ran out of time
+
+    def time_left(self, color, now=None):
+        left = self.remaining[color]
+        if color == self.running:
+            left -= (now or now_ms()) - self.turn_started
+        return max(0, left)
+
+    def deadline(self):
+        """ Wall clock ms the running side's flag falls at, None when stopped """
+        if self.running is None:
+            return None
+        return self.turn_started + self.remaining[self.running]
+
+    def start(self, color, now=None):
+        self.running = color
+        self.turn_started = now or now_ms()
+
+    def press(self, now=None):
+        """ The running side moved: charge its time, add the increment and start the other side """
+        now = now or now_ms()
+        color = self.running
+        self.remaining[color] = self.time_left(color, now) + self.increment
+        self.start('black' if color == 'white' else 'white', now)
+
+    def stop(self, now=None):
+        if self.running is not None:
+            self.remaining[self.running] = self.time_left(self.running, now)
+            self.running = None
+
+    def check_flag(self, now=None):
+        """ Flag the running side when its time is up, returns the flagged side """
+        if self.running is not None and self.time_left(self.running, now) <= 0:
+            self.flagged = self.running
+            self.stop(now)
+        return self.flagged
+
+    def state(self, now=None):
+        now = now or now_ms()
+        return {
+            'white': self.time_left('white', now),
+            'black': self.time_left('black', now),
+            'running': self.running,
+            'increment': self.increment,
+            'flagged': self.flagged
+        }
+
+    def to_dict(self):
+        return {
+            'base': self.base,
+            'increment': self.increment,
+            'remaining': dict(self.remaining),
+            'running': self.running,
+            'turn_started': self.turn_started,
+            'flagged': self.flagged
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        clock = cls(data['base'], data['increment'])
+        clock.remaining = dict(data['remaining'])
+        clock.running = data['running']
+        clock.turn_started = data['turn_started']
+        clock.flagged = data['flagged']
+        return clock
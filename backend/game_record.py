@@ -0,0 +1,143 @@
+"""
+Compact record of a multiplayer chess game.
+
+The moves are kept as a packed array of 16 bit integers, which is the source
+of truth. The chess.Board with its move stack is only a cache: idle games are
+dehydrated down to the array and their metadata, and the board is replayed
+from it on the next access. The same compact form is what shared state stores
+keep (see to_dict).
+"""
+import time
+from array import array
+
+import chess
+
+from game_clock import GameClock
+
+
+def encode_move(move):
+    """ from square (6 bits) | to square (6 bits) | promotion piece type (3 bits) """
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code):
+    return chess.Move(code & 63, code >> 6 & 63, code >> 12 or None)
+
+
+class GameRecord:
+    __slots__ = ('root_fen', 'moves', 'white', 'black', 'game_name', 'theme',
+                 'is_complete', 'is_game_over', 'finished_at', 'clock', 'premoves', 'last_access', '_board')
+
+    def __init__(self, root_fen=None, game_name='Untitled Game', theme='regular'):
+        # None stands for the standard starting position
+        self.root_fen = None if root_fen == chess.STARTING_FEN else root_fen
+        self.moves = array('H')
+        self.white = None
+        self.black = None
+        self.game_name = game_name
+        self.theme = theme
+        self.is_complete = False
+        self.is_game_over = False
+        self.finished_at = None  # wall clock seconds the game ended at
+        self.clock = None  # GameClock of games with a time control
+        self.premoves = {'white': [], 'black': []}  # UCI moves queued by each player
+        self.last_access = time.monotonic()
+        self._board = None
+
+    @property
+    def board(self):
+        """
+        The live board, rebuilt from the packed moves when the game was
+        dehydrated. Moves must be made through push() to keep both in sync.
+        """
+        self.last_access = time.monotonic()
+        if self._board is None:
+            self._board = self.replay()
+        return self._board
+
+    def replay(self):
+        board = chess.Board(self.root_fen or chess.STARTING_FEN)
+        for code in self.moves:
+            board.push(decode_move(code))
+        return board
+
+    def push(self, move):
+        board = self.board
+        board.push(move)
+        self.moves.append(encode_move(move))
+        self.is_game_over = board.is_game_over()
+        if self.is_game_over and self.finished_at is None:
+            self.finished_at = time.time()
+
+    def finish(self):
+        """ End the game before the board does, e.g. when a flag fell """
+        self.is_complete = True
+        self.is_game_over = True
+        if self.finished_at is None:
+            self.finished_at = time.time()
+
+    @property
+    def is_dehydrated(self):
+        return self._board is None
+
+    def dehydrate(self):
+        self._board = None
+
+    def idle_for(self, now=None):
+        return (now or time.monotonic()) - self.last_access
+
+    @property
+    def players(self):
+        return {'white': self.white, 'black': self.black}
+
+    def set_player(self, color, player):
+        if color == 'white':
+            self.white = player
+        else:
+            self.black = player
+
+    def root(self):
+        return self.root_fen or chess.STARTING_FEN
+
+    def uci_moves(self):
+        return [decode_move(code).uci() for code in self.moves]
+
+    def to_dict(self):
+        """ JSON compatible form for shared state stores, the board is not included """
+        return {
+            'root_fen': self.root_fen,
+            'moves': self.moves.tolist(),
+            'white': self.white,
+            'black': self.black,
+            'game_name': self.game_name,
+            'theme': self.theme,
+            'is_complete': self.is_complete,
+            'is_game_over': self.is_game_over,
+            'finished_at': self.finished_at,
+            'clock': self.clock.to_dict() if self.clock else None,
+            'premoves': self.premoves
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(data['root_fen'], data['game_name'], data['theme'])
+        record.moves = array('H', data['moves'])
+        record.white = data['white']
+        record.black = data['black']
+        record.is_complete = data['is_complete']
+        record.is_game_over = data['is_game_over']
+        record.finished_at = data.get('finished_at')
+        record.clock = GameClock.from_dict(data['clock']) if data.get('clock') else None
+        record.premoves = data.get('premoves') or {'white': [], 'black': []}
+        return record
+
+    @property
+    def move_history(self):
+        """ Moves formatted as "White: e2 to e4", built on demand """
+        white_to_move = self.root().split()[1] == 'w'
+        history = []
+        for code in self.moves:
+            color = 'White' if white_to_move else 'Black'
+            history.append(f"{color}: {chess.square_name(code & 63)} to {chess.square_name(code >> 6 & 63)}")
+            white_to_move = not white_to_move
+        return history
@@ -0,0 +1,42 @@
+import threading
+
+from flask import Flask
+
+# URL prefixes served by flasgger
+DOC_PREFIXES = ('/apidocs', '/apispec', '/flasgger_static')
+
+
+class LazySwagger:
+    """
+    WSGI middleware that builds the Swagger UI and spec on the first request
+    to the docs instead of at import time.
+
+    Flask does not allow adding routes once it has served a request, so the
+    docs live in a small separate app that mirrors the routes of the main one.
+    Importing flasgger (and jsonschema with it) is deferred as well.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+        self.docs_app = None
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(DOC_PREFIXES):
+            return self.get_docs_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def get_docs_app(self):
+        with self.lock:
+            if self.docs_app is None:
+                from flasgger import Swagger
+
+                docs_app = Flask(self.app.import_name)
+                for rule in self.app.url_map.iter_rules():
+                    if rule.endpoint == 'static':
+                        continue
+                    docs_app.add_url_rule(rule.rule, rule.endpoint, self.app.view_functions[rule.endpoint], methods=rule.methods)
+                Swagger(docs_app)
+                self.docs_app = docs_app
+            return self.docs_app
@@ -0,0 +1,231 @@
+"""
+Live analysis streamed to the client as it deepens.
+
+Every game being analysed gets its own engine, kept between requests: the
+next position of the same game is searched with the hash table the previous
+search filled (python-chess only sends ucinewgame when the game changes).
+Starting an analysis of a game stops the one still running for it. Engines of
+games nobody analysed for a while are closed.
+
+Without Stockfish the built-in engine stands in, reporting one line per
+completed depth.
+"""
+import queue
+import threading
+import time
+
+import chess
+import chess.engine
+
+from chess_ai import BuiltinEngine, MATE_SCORE
+from engine_supervisor import EngineUnavailable, supervisors, supervisors_lock
+
+END = object()
+
+
+class AnalysisSession:
+    __slots__ = ('key', 'engine', 'lock', 'generation', 'last_used')
+
+    def __init__(self, key):
+        self.key = key
+        self.engine = None
+        self.lock = threading.Lock()
+        self.generation = 0  # bumped by every new analysis, the older one stops
+        self.last_used = time.monotonic()
+
+
+class AnalysisEngines:
+    """ One engine per analysed game, at most max_engines at a time """
+
+    def __init__(self, start_engine, stop_engine, max_engines, idle_timeout):
+        self.start_engine = start_engine
+        self.stop_engine = stop_engine
+        self.max_engines = max_engines
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.streams = 0
+        with supervisors_lock:
+            supervisors.append(self)
+
+    def acquire(self, key, wait=5):
+        """
+        The session of the game and the generation of this analysis, taken over
+        from the analysis running for it. Raises EngineUnavailable when every
+        engine is busy with other games.
+        """
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                self.evict(time.monotonic())
+                if len(self.sessions) >= self.max_engines:
+                    raise EngineUnavailable('all analysis engines are busy')
+                session = self.sessions[key] = AnalysisSession(key)
+            session.generation += 1
+            generation = session.generation
+
+        if not session.lock.acquire(timeout=wait):
+            raise EngineUnavailable('the previous analysis of this game did not stop')
+        if session.generation != generation:
+            session.lock.release()
+            raise EngineUnavailable('a newer analysis of this game was started')
+        session.last_used = time.monotonic()
+        try:
+            if session.engine is None:
+                session.engine = self.start_engine()
+        except Exception:
+            session.lock.release()
+            raise
+        with self.lock:
+            self.streams += 1
+        return session, generation
+
+    def release(self, session):
+        session.last_used = time.monotonic()
+        session.lock.release()
+
+    def drop_engine(self, session):
+        """ Close a broken engine, the session starts a new one next time """
+        engine, session.engine = session.engine, None
+        if engine is not None:
+            self.stop_engine(engine)
+
+    def evict(self, now):
+        """ Close idle engines, and the least recently used one when at the limit; call with the lock held """
+        idle = sorted((session for session in self.sessions.values() if not session.lock.locked()),
+                      key=lambda session: session.last_used)
+        for session in idle:
+            if now - session.last_used < self.idle_timeout and len(self.sessions) < self.max_engines:
+                break
+            del self.sessions[session.key]
+            self.drop_engine(session)
+
+    def close_idle(self):
+        with self.lock:
+            self.evict(time.monotonic())
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.generation += 1
+            self.drop_engine(session)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'engines': len(self.sessions),
+                'analysing': sum(1 for session in self.sessions.values() if session.lock.locked()),
+                'streams': self.streams
+            }
+
+
+def stockfish_lines(analysis, output, stopped):
+    """ Forward Stockfish's info lines with a score and a PV to the output queue """
+    for info in analysis:
+        if stopped.is_set():
+            break
+        if 'score' not in info or not info.get('pv'):
+            continue
+        score = info['score'].white()
+        output.put({
+            'depth': info.get('depth'),
+            'seldepth': info.get('seldepth'),
+            'multipv': info.get('multipv', 1),
+            'score': score.score(),
+            'mate': score.mate(),
+            'pv': [move.uci() for move in info['pv']],
+            'nodes': info.get('nodes'),
+            'nps': info.get('nps')
+        })
+
+
+def builtin_lines(engine, board, multipv, limit, output, stopped):
+    """ Deepen the built-in engine's search one depth at a time, reporting each completed depth """
+    deadline = time.monotonic() + (limit.time or 60)
+    sign = 1 if board.turn == chess.WHITE else -1
+    for depth in range(1, (limit.depth or 64) + 1):
+        remaining = deadline - time.monotonic()
+        if stopped.is_set() or remaining <= 0:
+            return
+        best_move, best_score, root_scores = engine.search(board, depth, remaining, multipv > 1)
+        if stopped.is_set() or time.monotonic() >= deadline or best_move is None:
+            return
+        lines = sorted(root_scores.items(), key=lambda item: -item[1])[:multipv] if multipv > 1 else [(best_move, best_score)]
+        for number, (move, score) in enumerate(lines, 1):
+            mate = None
+            if abs(score) >= MATE_SCORE - 100:
+                mate = (MATE_SCORE - abs(score) + 1) // 2 * (1 if sign * score > 0 else -1)
+            output.put({
+                'depth': depth,
+                'multipv': number,
+                'score': None if mate is not None else sign * score,
+                'mate': mate,
+                'pv': [move.uci()]
+            })
+
+
+def analyse(engines, session, generation, board, multipv, limit, position_changed, heartbeat=1.0):
+    """
+    Generator of (event, data) pairs for one analysis, (None, None) on every
+    heartbeat without news. Ends with an 'end' event giving the reason, or an
+    'error' event; closing the generator (client gone) stops the search. The
+    caller releases the session afterwards.
+    """
+    output = queue.Queue()
+    stopped = threading.Event()
+    engine = session.engine
+    running = []
+
+    def search():
+        try:
+            if isinstance(engine, BuiltinEngine):
+                builtin_lines(engine, board, multipv, limit, output, stopped)
+            else:
+                # The session key as the game keeps the hash from the previous position
+                with engine.analysis(board, limit, multipv=multipv, game=session.key) as analysis:
+                    running.append(analysis)
+                    stockfish_lines(analysis, output, stopped)
+        except Exception as e:
+            output.put(e)
+        output.put(END)
+
+    searcher = threading.Thread(target=search, name=f'analysis-{session.key}', daemon=True)
+    searcher.start()
+    last_check = time.monotonic()
+    try:
+        while True:
+            try:
+                item = output.get(timeout=heartbeat)
+            except queue.Empty:
+                item = None
+
+            if item is END:
+                yield 'end', {'reason': 'done'}
+                return
+            if isinstance(item, Exception):
+                print(f"Warning: analysis failed ({item})")
+                engines.drop_engine(session)
+                yield 'error', {'error': str(item)}
+                return
+            if session.generation != generation:
+                yield 'end', {'reason': 'superseded'}
+                return
+            # Looking up the position may mean loading the game, not on every info line
+            if time.monotonic() - last_check >= heartbeat:
+                last_check = time.monotonic()
+                if position_changed():
+                    yield 'end', {'reason': 'position_changed'}
+                    return
+            yield ('info', item) if item is not None else (None, None)
+    finally:
+        stopped.set()
+        if isinstance(engine, BuiltinEngine):
+            engine.stop()
+        for analysis in running:
+            analysis.stop()
+        # Stockfish answers the stop with its best move, a wedged one is replaced
+        searcher.join(timeout=2)
+        if searcher.is_alive():
+            engines.drop_engine(session)
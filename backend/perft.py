@@ -0,0 +1,181 @@
+"""
+Perft and move generation benchmark for chess and draughts.
+
+Counts the leaf nodes of the move tree for a corpus of positions, checks the
+counts against known values and reports nodes per second. Draughts positions
+are run both through pydraughts (what backend.py uses) and through the
+internal generator of the built-in engine (checkers_ai.py).
+
+Usage: python perft.py [--max-depth N] [--fen FEN ...] [--challenges URL] [--layer]
+"""
+import argparse
+import json
+import sys
+import time
+import urllib.request
+
+import chess
+from draughts import Board
+
+from checkers_ai import Position
+
+# name, FEN, known perft counts for depth 1, 2, ...
+CHESS_POSITIONS = [
+    ('start', chess.STARTING_FEN, [20, 400, 8902, 197281]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862]),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238]),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467]),
+    ('middlegame', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379]),
+]
+
+# name, variant, FEN, known perft counts (moves with the same start, end and captured pieces count once)
+DRAUGHTS_POSITIONS = [
+    ('start', 'standard', 'startpos', [9, 81, 658, 4265]),
+    ('frysk start', 'frysk', 'startpos', [9, 81, 657, 5329]),
+    ('king captures', 'standard', 'W:WK1,K50,30,35:BK5,K46,12,14,17,19,22,24,27,29,32,34,37,39', [4, 10, 23, 94]),
+    ('capture chain', 'standard', 'B:W21,22,23,26,27,31,32,33,37,38,42,43:BK3,11,12,13,16,18', [1, 1, 10, 44]),
+    ('frysk chain', 'frysk', 'W:WK46,31,32:B13,14,17,18,19,22,23,24,27,28,29,33,36', [1, 3, 14, 47]),
+    ('frysk kings', 'frysk', 'B:W21,22,27,28,32,33,K48:BK5,K1,12,16,17', [2, 3, 19, 138]),
+]
+
+
+def chess_perft(board, depth):
+    if depth == 1:
+        return board.legal_moves.count()
+    nodes = 0
+    for move in board.legal_moves:
+        board.push(move)
+        nodes += chess_perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def draughts_unique_moves(board):
+    """ pydraughts lists cyclic captures once per direction, keep one of each """
+    moves = {}
+    for move in board.legal_moves():
+        captured = tuple(sorted(square for square in (move.captures or []) if square))
+        moves.setdefault((move.steps_move[0], move.steps_move[-1], captured), move)
+    return list(moves.values())
+
+
+def draughts_perft(board, depth):
+    moves = draughts_unique_moves(board)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.push(move)
+        nodes += draughts_perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def internal_perft(position, depth):
+    moves = position.generate_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = position.push(move)
+        nodes += internal_perft(position, depth - 1)
+        position.pop(move, undo)
+    return nodes
+
+
+def run(label, perft, root, expected, max_depth):
+    """ Run perft to max_depth, print one line per depth, returns False on a wrong count """
+    ok = True
+    for depth in range(1, max_depth + 1):
+        start = time.perf_counter()
+        nodes = perft(root, depth)
+        elapsed = time.perf_counter() - start
+        known = expected[depth - 1] if depth <= len(expected) else None
+        if known is None:
+            status = '-'
+        elif known == nodes:
+            status = 'ok'
+        else:
+            status = f'FAIL (expected {known})'
+            ok = False
+        nps = nodes / elapsed if elapsed > 0 else 0
+        print(f"{label:<40} {depth:>5} {nodes:>10} {elapsed * 1000:>10.1f} {nps:>12.0f}  {status}")
+        sys.stdout.flush()
+    return ok
+
+
+def fetch_challenges(url):
+    """ Fetch challenge FENs from a running server's /get_challenges """
+    with urllib.request.urlopen(url.rstrip('/') + '/get_challenges') as response:
+        challenges = json.load(response)['challenges']
+    return [(f"challenge {c.get('name', challenge_id)}", c['fen']) for challenge_id, c in challenges.items()]
+
+
+def benchmark_layer(chess_fens, draughts_positions, rounds=200):
+    """
+    Time the per-request move generation done by backend.py routes:
+    /legal_moves for every piece of the side to move and the PDN to board
+    notation conversion of /checkers/checkers_move.
+    """
+    from backend import convert_pdn_to_notation
+
+    print(f"\n{'backend layer':<40} {'calls':>5} {'ms/call':>10}")
+    for name, fen in chess_fens:
+        board = chess.Board(fen)
+        squares = list(chess.scan_forward(board.occupied_co[board.turn]))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for square in squares:
+                [chess.square_name(move.to_square) for move in board.legal_moves if move.from_square == square]
+        elapsed = (time.perf_counter() - start) / rounds
+        print(f"{'legal_moves (all pieces) ' + name:<40} {rounds:>5} {elapsed * 1000:>10.3f}")
+
+    for name, variant, fen in draughts_positions:
+        board = Board(variant=variant, fen=fen)
+        calls = max(rounds // 20, 1)
+        start = time.perf_counter()
+        for _ in range(calls):
+            [convert_pdn_to_notation(move.pdn_move) for move in board.legal_moves()]
+        elapsed = (time.perf_counter() - start) / calls
+        print(f"{'checkers legal moves ' + name:<40} {calls:>5} {elapsed * 1000:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perft and move generation benchmark')
+    parser.add_argument('--max-depth', type=int, default=3, help='deepest perft to run for every position')
+    parser.add_argument('--fen', action='append', default=[], help='extra chess FEN to benchmark (no known counts)')
+    parser.add_argument('--challenges', help='base URL of a running server to benchmark its challenge FENs')
+    parser.add_argument('--layer', action='store_true', help='also time the move generation done by backend.py routes')
+    args = parser.parse_args()
+
+    extra_fens = [(f'fen {i + 1}', fen) for i, fen in enumerate(args.fen)]
+    if args.challenges:
+        extra_fens += fetch_challenges(args.challenges)
+
+    ok = True
+    print(f"{'position':<40} {'depth':>5} {'nodes':>10} {'ms':>10} {'nodes/s':>12}")
+
+    for name, fen, expected in CHESS_POSITIONS:
+        ok &= run(f'chess {name}', chess_perft, chess.Board(fen), expected, min(args.max_depth, len(expected)))
+    for name, fen in extra_fens:
+        ok &= run(f'chess {name}', chess_perft, chess.Board(fen), [], args.max_depth)
+
+    for name, variant, fen, expected in DRAUGHTS_POSITIONS:
+        depth = min(args.max_depth, len(expected))
+        ok &= run(f'pydraughts {name}', draughts_perft, Board(variant=variant, fen=fen), expected, depth)
+        board = Board(variant=variant, fen=fen)
+        ok &= run(f'internal {name}', internal_perft, Position.from_fen(board.fen, variant), expected, depth)
+
+    if args.layer:
+        benchmark_layer(
+            [(name, fen) for name, fen, _ in CHESS_POSITIONS] + extra_fens,
+            [(name, variant, fen) for name, variant, fen, _ in DRAUGHTS_POSITIONS]
+        )
+
+    if not ok:
+        print('\nPerft counts do not match!')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Pondering: searching the next position while the human thinks.
+
+After an AI move the engine predicts the human's reply, the second move of its
+principal variation. With pondering on, a pooled engine searches the position
+after that reply in the background, with the limits of the next AI move. When
+the human plays the predicted move the next AI move is the ponder search's
+result (waited for when it is still running); any other position cancels it.
+
+Pondering only uses spare capacity: a ponder starts only when an engine and an
+admission slot are free right away, is cut off after max_time, and every
+ponder nobody waits for is stopped as soon as a foreground request has to wait
+for an engine or a slot (see preempt()).
+"""
+import threading
+import time
+
+
+class Ponder:
+    __slots__ = ('session', 'key', 'base_fen', 'fen', 'claimed', 'cancelled',
+                 'analysis', 'move', 'expected', 'seconds', 'done')
+
+    def __init__(self, session, key, base_fen, fen):
+        self.session = session
+        self.key = key            # the search it stands in for, see PonderManager.take
+        self.base_fen = base_fen  # the position before the predicted reply
+        self.fen = fen            # the position searched
+        self.claimed = False      # an AI move is waiting for the result, not preempted
+        self.cancelled = False
+        self.analysis = None      # the running engine search
+        self.move = None          # best move, None when the search failed or was stopped
+        self.expected = None      # the reply the search predicts in turn
+        self.seconds = 0.0        # how long the search took
+        self.done = threading.Event()
+
+
+class PonderManager:
+    """ At most one ponder per session (a single player game) """
+
+    def __init__(self, pool, admission, route, max_time):
+        self.pool = pool
+        self.admission = admission
+        self.route = route
+        self.max_time = max_time
+        self.lock = threading.Lock()
+        self.ponders = {}
+        self.started = 0
+        self.skipped = 0    # no spare engine or slot
+        self.hits = 0
+        self.misses = 0     # the human played something else
+        self.preempted = 0
+        self.failed = 0
+        self.saved_ms = 0.0  # search time the hits answered without
+
+    def start(self, session, key, board, expected, limit, options, grace):
+        """ Ponder on board after the expected reply, with the limit of the next AI move """
+        self.cancel(session)
+        if expected not in board.legal_moves:
+            return
+        base_fen = board.fen()
+        board = board.copy(stack=False)
+        board.push(expected)
+        if board.is_game_over():
+            return
+
+        started = self.admission.try_acquire(self.route)
+        if started is None:
+            self.skipped += 1
+            return
+        supervisor = self.pool.try_borrow()
+        if supervisor is None:
+            self.admission.release(self.route, started, record=False)
+            self.skipped += 1
+            return
+
+        limit.time = self.max_time if limit.time is None else min(limit.time, self.max_time)
+        ponder = Ponder(session, key, base_fen, board.fen())
+        with self.lock:
+            self.ponders[session] = ponder
+            self.started += 1
+
+        def search(engine):
+            with engine.analysis(board, limit, options=options) as analysis:
+                ponder.analysis = analysis
+                if ponder.cancelled:
+                    analysis.stop()
+                return analysis.wait()
+
+        def run():
+            begin = time.monotonic()
+            try:
+                best = self.pool.run_on(supervisor, search, limit.time + grace)
+                if not ponder.cancelled:
+                    ponder.move, ponder.expected = best.move, best.ponder
+            except Exception as e:
+                print(f"Warning: pondering failed ({e})")
+                self.failed += 1
+            finally:
+                self.pool.give_back(supervisor)
+                self.admission.release(self.route, started, record=False)
+                ponder.seconds = time.monotonic() - begin
+                ponder.done.set()
+
+        threading.Thread(target=run, name=f'ponder-{session}', daemon=True).start()
+
+    def stop(self, ponder):
+        ponder.cancelled = True
+        analysis = ponder.analysis
+        if analysis is not None:
+            analysis.stop()
+
+    def take(self, session, key, fen, timeout):
+        """
+        The ponder of the session when it searched this position for this
+        search, as (move, expected reply), waiting up to timeout seconds for it
+        to finish. None when there is no usable result.
+        """
+        with self.lock:
+            ponder = self.ponders.pop(session, None)
+            if ponder is None:
+                return None
+            hit = ponder.fen == fen and ponder.key == key
+            if hit:
+                ponder.claimed = True
+            else:
+                self.misses += 1
+        if not hit:
+            self.stop(ponder)
+            return None
+        if not ponder.done.wait(timeout):
+            self.stop(ponder)
+            return None
+        if ponder.move is None:
+            return None
+        self.hits += 1
+        self.saved_ms += ponder.seconds * 1000
+        return ponder.move, ponder.expected
+
+    def cancel(self, session):
+        with self.lock:
+            ponder = self.ponders.pop(session, None)
+        if ponder is not None:
+            self.stop(ponder)
+
+    def cancel_unless(self, session, fen):
+        """ Cancel the session's ponder unless the game is still at, or one reply before, its position """
+        with self.lock:
+            ponder = self.ponders.get(session)
+            if ponder is None or fen in (ponder.base_fen, ponder.fen):
+                return
+            del self.ponders[session]
+            self.misses += 1
+        self.stop(ponder)
+
+    def preempt(self):
+        """ Stop the ponders nobody waits for, a foreground search needs their engine or slot """
+        with self.lock:
+            stopped = [ponder for ponder in self.ponders.values() if not ponder.claimed and not ponder.done.is_set()]
+            for ponder in stopped:
+                del self.ponders[ponder.session]
+            self.preempted += len(stopped)
+        for ponder in stopped:
+            self.stop(ponder)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'pondering': sum(1 for ponder in self.ponders.values() if not ponder.done.is_set()),
+                'started': self.started,
+                'skipped': self.skipped,
+                'hits': self.hits,
+                'misses': self.misses,
+                'preempted': self.preempted,
+                'failed': self.failed,
+                'saved_ms': round(self.saved_ms, 1)
+            }
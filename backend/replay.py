@@ -0,0 +1,58 @@
+"""
+Replay a slow request log recorded by the backend (see SLOW_REQUEST_LOG).
+
+Every captured request is re-run against a fresh app instance after restoring
+the game state it originally started from, so pathological positions can be
+reproduced and benchmarked offline.
+
+Usage: python replay.py slow_requests.log.gz [--repeat N] [--path PREFIX]
+"""
+import argparse
+import statistics
+import time
+
+from request_log import read_log
+
+
+def replay_entry(app_module, client, entry, repeat):
+    """ Re-run a single captured request, returns (status, list of timings in ms) """
+    timings = []
+    status = None
+    for _ in range(repeat):
+        app_module.restore_game_state(entry['state'])
+        start = time.perf_counter()
+        response = client.open(
+            entry['path'],
+            method=entry['method'],
+            query_string=entry['query'],
+            data=entry['body'],
+            content_type=entry['content_type']
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+    return status, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a slow request log against a fresh app instance')
+    parser.add_argument('log', help='path to the slow request log')
+    parser.add_argument('--repeat', type=int, default=1, help='how many times to run each request')
+    parser.add_argument('--path', default='', help='only replay requests whose path starts with this prefix')
+    args = parser.parse_args()
+
+    # Imported here so the capture is never switched on for the replay itself
+    import backend
+    backend.slow_request_log = None
+    client = backend.app.test_client()
+
+    print(f"{'path':<36} {'status':>6} {'recorded ms':>12} {'replay ms':>10}")
+    for entry in read_log(args.log):
+        if not entry['path'].startswith(args.path):
+            continue
+        status, timings = replay_entry(backend, client, entry, args.repeat)
+        changed = '' if status == entry['status'] else f" (was {entry['status']})"
+        print(f"{entry['path']:<36} {status:>6} {entry['ms']:>12.1f} {statistics.median(timings):>10.1f}{changed}")
+
+
+if __name__ == '__main__':
+    main()
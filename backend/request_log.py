@@ -0,0 +1,51 @@
+import gzip
+import json
+import threading
+import time
+
+
+class SlowRequestLog:
+    """
+    Append-only log of requests that took longer than a threshold.
+
+    Every record is written as its own gzip member holding one compact JSON line,
+    so the file stays small, survives a crash mid-write and can be read back with
+    a plain gzip.open().
+    """
+
+    def __init__(self, path, threshold_ms=500):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.lock = threading.Lock()
+        self.recorded = 0
+
+    def should_record(self, duration_ms):
+        return duration_ms >= self.threshold_ms
+
+    def record(self, method, path, query_string, body, content_type, status, duration_ms, state):
+        entry = {
+            'ts': round(time.time(), 3),
+            'method': method,
+            'path': path,
+            'query': query_string,
+            'body': body,
+            'content_type': content_type,
+            'status': status,
+            'ms': round(duration_ms, 2),
+            'state': state
+        }
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+
+        with self.lock:
+            with gzip.open(self.path, 'ab') as f:
+                f.write(line.encode('utf-8'))
+            self.recorded += 1
+
+
+def read_log(path):
+    """ Yield all records stored in a slow request log """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
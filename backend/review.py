@@ -0,0 +1,184 @@
+"""
+Post-game review.
+
+The positions of a finished game are spread over a pool of worker threads,
+each owning its own engine (Stockfish when available, the built-in engine
+otherwise). Results are yielded per ply as soon as both the position before
+and after the move are evaluated, and evaluated positions are cached so
+repeated positions and re-reviews cost nothing.
+"""
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import chess
+import chess.engine
+
+from chess_ai import BuiltinEngine, MATE_SCORE
+
+# Centipawn loss thresholds of the mover, checked from the worst down
+CLASSIFICATIONS = [
+    (300, 'blunder'),
+    (100, 'mistake'),
+    (50, 'inaccuracy'),
+    (0, 'good'),
+]
+
+
+def classify(played, best_move, loss):
+    if best_move is not None and played == best_move:
+        return 'best'
+    for threshold, name in CLASSIFICATIONS:
+        if loss >= threshold:
+            return name
+    return 'good'
+
+
+def position_key(board):
+    """ FEN without the move counters, so transpositions share a cache entry """
+    return ' '.join(board.fen().split()[:4])
+
+
+class ReviewPool:
+    """
+    Pool of engine workers with a shared LRU cache of evaluated positions.
+    """
+
+    def __init__(self, stockfish_path, workers, time_limit=0.2, cache_size=20000):
+        self.stockfish_path = stockfish_path
+        self.workers = workers
+        self.time_limit = time_limit
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='review')
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def engine(self):
+        """ The engine owned by the current worker thread """
+        engine = getattr(self.local, 'engine', None)
+        if engine is None:
+            if os.path.isfile(self.stockfish_path) or shutil.which(self.stockfish_path):
+                engine = chess.engine.SimpleEngine.popen_uci(self.stockfish_path)
+            else:
+                engine = BuiltinEngine()
+            self.local.engine = engine
+        return engine
+
+    def cached(self, key):
+        with self.cache_lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return self.cache[key]
+            self.cache_misses += 1
+            return None
+
+    def store(self, key, result):
+        with self.cache_lock:
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def evaluate(self, fen):
+        """
+        Evaluate a position, returns (score for white in centipawns, best move UCI or None).
+        """
+        board = chess.Board(fen)
+        key = position_key(board)
+        result = self.cached(key)
+        if result is not None:
+            return result
+
+        if board.is_game_over():
+            if board.is_checkmate():
+                score = -MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE
+            else:
+                score = 0
+            result = (score, None)
+        else:
+            engine = self.engine()
+            try:
+                if isinstance(engine, BuiltinEngine):
+                    move, score = engine.analyse(board, 20, self.time_limit)
+                    score = score if board.turn == chess.WHITE else -score
+                else:
+                    info = engine.analyse(board, chess.engine.Limit(time=self.time_limit))
+                    score = info['score'].white().score(mate_score=MATE_SCORE)
+                    move = info['pv'][0] if info.get('pv') else None
+            except chess.engine.EngineError:
+                # Drop a broken engine, the next position of this worker starts a new one
+                self.local.engine = None
+                engine.quit()
+                raise
+            result = (score, move.uci() if move else None)
+
+        self.store(key, result)
+        return result
+
+    def review(self, root_fen, moves):
+        """
+        Review a game given its starting FEN and UCI moves, yields one dict per
+        ply in completion order.
+        """
+        board = chess.Board(root_fen)
+        fens = [board.fen()]
+        sans = []
+        for uci in moves:
+            move = chess.Move.from_uci(uci)
+            sans.append(board.san(move))
+            board.push(move)
+            fens.append(board.fen())
+
+        # Repeated positions are only searched once
+        futures = {}
+        for index, fen in enumerate(fens):
+            key = position_key(chess.Board(fen))
+            if key not in futures:
+                futures[key] = (self.executor.submit(self.evaluate, fen), [])
+            futures[key][1].append(index)
+
+        evaluations = {}
+        emitted = set()
+        future_indexes = {future: indexes for future, indexes in futures.values()}
+        for future in as_completed(future_indexes):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            for index in future_indexes[future]:
+                evaluations[index] = result
+
+            # A ply is ready once the positions before and after it are evaluated
+            for index in future_indexes[future]:
+                for ply in (index - 1, index):
+                    if ply < 0 or ply >= len(moves) or ply in emitted:
+                        continue
+                    if ply in evaluations and ply + 1 in evaluations:
+                        emitted.add(ply)
+                        yield self.ply_result(ply, moves[ply], sans[ply], fens[ply], evaluations[ply], evaluations[ply + 1])
+
+    def ply_result(self, ply, move, san, fen, before, after):
+        color = 'white' if fen.split()[1] == 'w' else 'black'
+        result = {'ply': ply + 1, 'move': move, 'san': san, 'color': color}
+        if isinstance(before, Exception) or isinstance(after, Exception):
+            result['error'] = str(before if isinstance(before, Exception) else after)
+            return result
+
+        score_before, best_move = before
+        score_after, _ = after
+        # Centipawn loss from the mover's point of view, mate scores are capped
+        sign = 1 if color == 'white' else -1
+        loss = max(0, sign * (max(min(score_before, 2000), -2000) - max(min(score_after, 2000), -2000)))
+
+        result.update({
+            'eval': score_after,
+            'best_move': best_move,
+            'loss': loss,
+            'classification': classify(move, best_move, loss)
+        })
+        return result
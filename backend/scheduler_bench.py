@@ -0,0 +1,105 @@
+"""
+Throughput of the core scheduler against one thread per engine.
+
+For every concurrency level, that many clients search the test positions to a
+fixed depth at the same time, each on its own pooled Stockfish. The fixed
+policy runs every engine with Threads=1 and the default hash, the scheduled
+one lets core_scheduler.py hand out threads and hash per search. Prints the
+searches completed per second, the nodes per second of all engines together
+and the mean time of a search.
+
+Usage: python scheduler_bench.py [--stockfish PATH] [--depth N] [--concurrency 1,2,4,8]
+                                 [--searches N] [--cores N] [--hash MB]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+import chess
+import chess.engine
+
+from core_scheduler import CoreScheduler
+from engine_supervisor import EnginePool
+
+POSITIONS = [
+    'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8',
+    'r2q1rk1/1b1nbppp/p2ppn2/1p6/3NP3/1BN1BP2/PPPQ2PP/2KR3R w - - 2 11',
+    '2r2rk1/pp1bqppp/2n1pn2/3p4/3P4/2PBPN2/P2N1PPP/R2Q1RK1 w - - 3 12',
+    'r1b2rk1/2q1bppp/p2p1n2/np2p3/3PP3/5N1P/PPBN1PP1/R1BQR1K1 w - - 1 13',
+    '8/5pk1/6p1/3P4/2p2P2/2P3P1/5K2/8 w - - 0 40',
+]
+
+
+def run_clients(pool, concurrency, searches, depth, fixed):
+    """ (wall seconds, seconds of each search, total nodes) of concurrency clients doing searches each """
+    limit = chess.engine.Limit(depth=depth)
+    timings = []
+    nodes = []
+    lock = threading.Lock()
+
+    def search(engine, board):
+        if fixed and 'Threads' in engine.options:
+            engine.configure({'Threads': 1})
+        info = engine.analyse(board, limit, game=object())  # a new game each time, no hash carried over
+        return info.get('nodes', 0)
+
+    def client(number):
+        for i in range(searches):
+            board = chess.Board(POSITIONS[(number + i) % len(POSITIONS)])
+            started = time.perf_counter()
+            searched = pool.run(lambda engine: search(engine, board), 600)
+            with lock:
+                timings.append(time.perf_counter() - started)
+                nodes.append(searched)
+
+    clients = [threading.Thread(target=client, args=(number,)) for number in range(concurrency)]
+    started = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return time.perf_counter() - started, timings, sum(nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Core scheduler vs one thread per engine')
+    parser.add_argument('--stockfish', default=os.environ.get('STOCKFISH_PATH', 'stockfish'), help='Stockfish executable')
+    parser.add_argument('--depth', type=int, default=18, help='depth of every search')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='comma separated numbers of concurrent clients')
+    parser.add_argument('--searches', type=int, default=4, help='searches per client')
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1, help='threads the scheduler hands out')
+    parser.add_argument('--hash', type=int, default=256, help='hash budget of the scheduler in MB')
+    args = parser.parse_args()
+
+    start = lambda: chess.engine.SimpleEngine.popen_uci(args.stockfish)
+    try:
+        start().quit()
+    except (OSError, chess.engine.EngineError) as e:
+        print(f'Could not start {args.stockfish}: {e}')
+        sys.exit(1)
+
+    print(f"{'clients':>7} {'policy':<10} {'searches/s':>10} {'Mnps':>8} {'mean s':>8} {'speedup':>8}")
+    for concurrency in [int(value) for value in args.concurrency.split(',')]:
+        baseline = None
+        for policy in ('fixed', 'scheduled'):
+            scheduler = CoreScheduler(args.cores, args.hash) if policy == 'scheduled' else None
+            pool = EnginePool(f'bench-{policy}-{concurrency}', concurrency, start, lambda engine: engine.quit(),
+                              scheduler=scheduler)
+            for supervisor in pool.supervisors:
+                supervisor.warm_up()
+            try:
+                wall, timings, nodes = run_clients(pool, concurrency, args.searches, args.depth, policy == 'fixed')
+            finally:
+                for supervisor in pool.supervisors:
+                    supervisor.close()
+            rate = len(timings) / wall
+            baseline = baseline or rate
+            print(f"{concurrency:>7} {policy:<10} {rate:>10.2f} {nodes / wall / 1e6:>8.2f} "
+                  f"{statistics.mean(timings):>8.2f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
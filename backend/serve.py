@@ -0,0 +1,154 @@
+"""
+Production server for the backend.
+
+Runs the app under gunicorn (several worker processes, POSIX only), waitress
+(threads, also on Windows) or, when neither is installed, Werkzeug's threaded
+server with the debugger and reloader off. Defaults are derived from the
+number of cores; every option can also be set through the environment.
+
+Several workers need a shared state store (STATE_STORE=sqlite:///state.db),
+with the in-memory store each process would see different games. With
+ENGINE_SERVICE set they also share one set of engines (see engine_service.py).
+
+Usage: python serve.py [--server auto|gunicorn|waitress|werkzeug] [--host HOST] [--port PORT]
+                       [--workers N] [--threads N] [--keep-alive SECONDS]
+"""
+import argparse
+import os
+import sys
+
+CORES = os.cpu_count() or 1
+
+
+def available(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def pick_server(name):
+    if name != 'auto':
+        return name
+    if available('gunicorn') and sys.platform != 'win32':
+        return 'gunicorn'
+    if available('waitress'):
+        return 'waitress'
+    return 'werkzeug'
+
+
+def shared_store():
+    return os.environ.get('STATE_STORE', 'memory') != 'memory'
+
+
+def default_workers(server):
+    # One process per core for the CPU bound parts (built-in engines, move
+    # generation), as long as the processes can share the games
+    if server == 'gunicorn' and shared_store():
+        return CORES
+    return 1
+
+
+def default_threads(workers):
+    # Most requests wait on an engine process, so a few threads per core pay off
+    return max(4, min(32, 4 * CORES // workers))
+
+
+def configure_engines(workers):
+    """
+    Split the cores between the engine processes of all workers, unless set
+    explicitly. Must run before the backend is imported.
+    """
+    engines_per_worker = str(max(1, CORES // (2 * workers)))
+    os.environ.setdefault('STOCKFISH_POOL_SIZE', engines_per_worker)
+    os.environ.setdefault('REVIEW_WORKERS', engines_per_worker)
+
+
+def load_app():
+    import backend
+    backend.start_engine_warmup()
+    return backend.app
+
+
+def run_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                'bind': f'{args.host}:{args.port}',
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread',
+                'keepalive': args.keep_alive,
+                # A request may wait for a whole engine search
+                'timeout': args.timeout,
+                'graceful_timeout': args.timeout,
+                'limit_request_line': 8190,
+                'limit_request_field_size': 8190,
+                # Each worker starts its own engines after the fork
+                'preload_app': False
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return load_app()
+
+    Server().run()
+
+
+def run_waitress(args):
+    import waitress
+    waitress.serve(
+        load_app(),
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        channel_timeout=args.keep_alive,
+        max_request_body_size=int(os.environ.get('MAX_REQUEST_BYTES', 1024 * 1024)),
+        ident='fit-chess'
+    )
+
+
+def run_werkzeug(args):
+    from werkzeug.serving import run_simple
+    # Werkzeug closes every connection, keep-alive needs one of the others
+    print("Warning: neither gunicorn nor waitress is installed, using Werkzeug's server (no keep-alive)")
+    run_simple(args.host, args.port, load_app(), threaded=True, use_reloader=False, use_debugger=False)
+
+
+SERVERS = {'gunicorn': run_gunicorn, 'waitress': run_waitress, 'werkzeug': run_werkzeug}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the backend with a production server')
+    parser.add_argument('--server', choices=['auto'] + list(SERVERS), default=os.environ.get('SERVER', 'auto'))
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKERS', 0)), help='worker processes, 0 for the default')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('THREADS', 0)), help='threads per worker, 0 for the default')
+    parser.add_argument('--keep-alive', type=int, default=int(os.environ.get('KEEP_ALIVE', 5)), help='seconds an idle connection is kept open')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('WORKER_TIMEOUT', 60)), help='seconds before a stuck worker is restarted (gunicorn)')
+    args = parser.parse_args()
+
+    args.server = pick_server(args.server)
+    if args.server == 'gunicorn' and sys.platform == 'win32':
+        parser.error('gunicorn does not run on Windows, use --server waitress')
+    if not args.workers:
+        args.workers = default_workers(args.server)
+    if args.workers > 1 and args.server != 'gunicorn':
+        parser.error(f'{args.server} runs a single process, use --server gunicorn for several workers')
+    if args.workers > 1 and not shared_store():
+        print("Warning: several workers need a shared STATE_STORE, running a single worker")
+        args.workers = 1
+    if not args.threads:
+        args.threads = default_threads(args.workers)
+
+    configure_engines(args.workers)
+    print(f"Serving on {args.host}:{args.port} with {args.server}, {args.workers} worker(s) x {args.threads} thread(s)")
+    SERVERS[args.server](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Coalescing of identical concurrent engine searches.
+
+The first request for a key runs the search, requests for the same key that
+arrive while it is running wait for it and get the same result (or error)
+instead of starting their own search. Only searches of this process are
+coalesced.
+"""
+import threading
+
+
+class Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key, search):
+        """ Run search() unless an identical one is in flight, returns its result """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = search()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+                self.max_waiters = max(self.max_waiters, call.waiters)
+            call.done.set()
+
+    def stats(self):
+        with self.lock:
+            requests = self.leaders + self.coalesced
+            return {
+                'searches': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesce_rate': round(self.coalesced / requests, 3) if requests else 0.0,
+                'in_flight': len(self.calls),
+                'waiting': sum(call.waiters for call in self.calls.values()),
+                'max_waiters': self.max_waiters
+            }
@@ -0,0 +1,262 @@
+"""
+Storage of the game state shared by the request handlers.
+
+MemoryStore keeps everything in the process, like the plain dicts it
+replaces. SqliteStore keeps the state in an SQLite database in WAL mode, so
+several worker processes (or hosts on a shared disk) serve the same games.
+
+Values are stored by namespace and key. locked(namespace, key) serializes the
+read-modify-write of one entry across threads and, for SQLite, across
+processes: code that changes an entry must load it, change it and put it back
+inside the lock. Values of the SQLite store go through JSON, so mutating a
+loaded value does nothing until it is put back.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+LOCK_TIMEOUT = 30.0   # seconds to wait for an entry lock
+LOCK_LEASE = 60.0     # a lock older than this belonged to a dead worker and is taken over
+LOCK_POLL = 0.005
+
+
+class StoreLockTimeout(Exception):
+    pass
+
+
+class KeyLocks:
+    """ One threading lock per (namespace, key), created on demand """
+
+    def __init__(self):
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self.lock:
+            lock = self.locks.get((namespace, key))
+            if lock is None:
+                lock = self.locks[(namespace, key)] = threading.Lock()
+            return lock
+
+    def discard(self, namespace, key):
+        with self.lock:
+            self.locks.pop((namespace, key), None)
+
+
+class MemoryStore:
+    shared = False
+
+    def __init__(self):
+        self.data = {}
+        self.generations = {}
+        self.key_locks = KeyLocks()
+
+    def get(self, namespace, key, default=None):
+        return self.data.get(namespace, {}).get(key, default)
+
+    def put(self, namespace, key, value):
+        self.data.setdefault(namespace, {})[key] = value
+        self.generations[namespace] = self.generations.get(namespace, 0) + 1
+
+    def add(self, namespace, key, value):
+        """ Put the value unless the key exists, returns True when it was added """
+        entries = self.data.setdefault(namespace, {})
+        if key in entries:
+            return False
+        self.put(namespace, key, value)
+        return True
+
+    def delete(self, namespace, key):
+        self.data.get(namespace, {}).pop(key, None)
+        self.generations[namespace] = self.generations.get(namespace, 0) + 1
+        self.key_locks.discard(namespace, key)
+
+    def items(self, namespace):
+        return list(self.data.get(namespace, {}).items())
+
+    def count(self, namespace):
+        return len(self.data.get(namespace, {}))
+
+    def generation(self, namespace):
+        """ A number that changes whenever the namespace changes """
+        return self.generations.get(namespace, 0)
+
+    @contextmanager
+    def locked(self, namespace, key, timeout=LOCK_TIMEOUT):
+        lock = self.key_locks.get(namespace, key)
+        if not lock.acquire(timeout=timeout):
+            raise StoreLockTimeout(f'{namespace}/{key} is locked')
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+class SqliteStore:
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.key_locks = KeyLocks()
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        connection = self.connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))')
+        connection.execute('CREATE TABLE IF NOT EXISTS generations (namespace TEXT PRIMARY KEY, generation INTEGER)')
+        connection.execute('CREATE TABLE IF NOT EXISTS locks (namespace TEXT, key TEXT, owner TEXT, acquired REAL, PRIMARY KEY (namespace, key))')
+
+    def connection(self):
+        """ SQLite connections can't be shared between threads, each thread opens its own """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def bump(self, connection, namespace):
+        connection.execute(
+            'INSERT INTO generations VALUES (?, 1) ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1',
+            (namespace,))
+
+    def get(self, namespace, key, default=None):
+        row = self.connection().execute(
+            'SELECT value FROM entries WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, namespace, key, value):
+        connection = self.connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)', (namespace, key, json.dumps(value)))
+            self.bump(connection, namespace)
+
+    def add(self, namespace, key, value):
+        connection = self.connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            added = connection.execute('INSERT OR IGNORE INTO entries VALUES (?, ?, ?)',
+                                       (namespace, key, json.dumps(value))).rowcount == 1
+            if added:
+                self.bump(connection, namespace)
+        return added
+
+    def delete(self, namespace, key):
+        connection = self.connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM entries WHERE namespace = ? AND key = ?', (namespace, key))
+            self.bump(connection, namespace)
+
+    def items(self, namespace):
+        rows = self.connection().execute(
+            'SELECT key, value FROM entries WHERE namespace = ?', (namespace,)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def count(self, namespace):
+        return self.connection().execute(
+            'SELECT COUNT(*) FROM entries WHERE namespace = ?', (namespace,)).fetchone()[0]
+
+    def generation(self, namespace):
+        row = self.connection().execute(
+            'SELECT generation FROM generations WHERE namespace = ?', (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    @contextmanager
+    def locked(self, namespace, key, timeout=LOCK_TIMEOUT):
+        # Threads of this process queue on a local lock, only one of them polls the database
+        local_lock = self.key_locks.get(namespace, key)
+        deadline = time.monotonic() + timeout
+        if not local_lock.acquire(timeout=timeout):
+            raise StoreLockTimeout(f'{namespace}/{key} is locked')
+        try:
+            connection = self.connection()
+            while True:
+                now = time.time()
+                with connection:
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.execute('DELETE FROM locks WHERE namespace = ? AND key = ? AND acquired < ?',
+                                       (namespace, key, now - LOCK_LEASE))
+                    acquired = connection.execute('INSERT OR IGNORE INTO locks VALUES (?, ?, ?, ?)',
+                                                  (namespace, key, self.owner, now)).rowcount == 1
+                if acquired:
+                    break
+                if time.monotonic() > deadline:
+                    raise StoreLockTimeout(f'{namespace}/{key} is locked')
+                time.sleep(LOCK_POLL)
+
+            try:
+                yield
+            finally:
+                with connection:
+                    connection.execute('DELETE FROM locks WHERE namespace = ? AND key = ? AND owner = ?',
+                                       (namespace, key, self.owner))
+        finally:
+            local_lock.release()
+
+
+class StoreMapping(MutableMapping):
+    """
+    Dict-like view of one namespace. encode/decode convert the stored objects
+    to JSON compatible values, they are only used by shared stores.
+    """
+
+    def __init__(self, store, namespace, encode=None, decode=None):
+        self.store = store
+        self.namespace = namespace
+        self.encode = encode if store.shared and encode else (lambda value: value)
+        self.decode = decode if store.shared and decode else (lambda value: value)
+
+    def __getitem__(self, key):
+        value = self.store.get(self.namespace, key)
+        if value is None:
+            raise KeyError(key)
+        return self.decode(value)
+
+    def __setitem__(self, key, value):
+        self.store.put(self.namespace, key, self.encode(value))
+
+    def __delitem__(self, key):
+        if self.store.get(self.namespace, key) is None:
+            raise KeyError(key)
+        self.store.delete(self.namespace, key)
+
+    def __contains__(self, key):
+        return self.store.get(self.namespace, key) is not None
+
+    def __iter__(self):
+        return iter([key for key, _ in self.store.items(self.namespace)])
+
+    def __len__(self):
+        return self.store.count(self.namespace)
+
+    def items(self):
+        return [(key, self.decode(value)) for key, value in self.store.items(self.namespace)]
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def setdefault(self, key, default=None):
+        self.store.add(self.namespace, key, self.encode(default))
+        return self[key]
+
+    def locked(self, key):
+        return self.store.locked(self.namespace, key)
+
+
+def open_store(url):
+    """
+    'memory' for the in-process store, 'sqlite:///path/to/state.db' for the
+    shared SQLite store.
+    """
+    if not url or url == 'memory':
+        return MemoryStore()
+    if url.startswith('sqlite:///'):
+        return SqliteStore(url[len('sqlite:///'):])
+    raise ValueError(f'Unknown state store {url}')
@@ -0,0 +1,27 @@
+"""
+Regression checks of the built-in draughts engine at tiny budgets.
+
+Run with: python -m pytest test_checkers_ai.py (from the backend directory)
+"""
+from draughts import Board
+
+from checkers_ai import DraughtsEngine
+
+# The first generated move, 30-24, hangs a man to 19x30
+HANGING_FIRST_MOVE = 'W:W30,31,32,33,34,37,38,39,40,41,42,43,44,45,46,47,48,49,50:B1,10,11,12,13,14,15,16,18,19,2,22,25,3,4,5,7,8,9'
+
+
+def test_tiny_budget_still_searches_every_move():
+    board = Board(variant='standard', fen=HANGING_FIRST_MOVE)
+    legal_moves = board.legal_moves()
+    assert legal_moves[0].pdn_move == '30-24'
+
+    for time_limit, max_nodes in ((1.0, 1), (0.0001, None)):
+        engine = DraughtsEngine()
+        move = engine.play(board.copy(), time_limit, max_nodes)
+        assert engine.nodes >= len(legal_moves)
+        assert move.pdn_move != '30-24'
+
+
+def test_no_move_when_the_game_is_over():
+    assert DraughtsEngine().play(Board(variant='standard', fen='W:W:B5')) is None
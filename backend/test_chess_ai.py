@@ -0,0 +1,28 @@
+"""
+Regression checks of the built-in engine at the budgets /ai_move gives it.
+
+Run with: python -m pytest test_chess_ai.py (from the backend directory)
+"""
+import chess
+
+from chess_ai import BuiltinEngine
+
+MATE_IN_ONE = 'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4'
+KIWIPETE = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+LOW_LEVEL_TIME = 0.008  # BUILTIN_ENGINE_TIME
+
+
+def test_lowest_level_finds_mate_in_one():
+    engine = BuiltinEngine()
+    for depth, skill_level in ((64, 0), (3, 5), (3, 20)):
+        for _ in range(10):
+            assert engine.play(chess.Board(MATE_IN_ONE), depth, LOW_LEVEL_TIME, skill_level).uci() == 'h5f7'
+
+
+def test_tiny_budget_still_searches_every_move():
+    # The budget runs out before depth 1 would finish, the first pass must not
+    engine = BuiltinEngine()
+    _, _, root_scores = engine.search(chess.Board(KIWIPETE), 64, 0.0001, exact_root_scores=True)
+    assert len(root_scores) == chess.Board(KIWIPETE).legal_moves.count()
+    assert max(root_scores, key=root_scores.get).uci() != 'e5f7'
+    assert engine.play(chess.Board(KIWIPETE), 64, 0.0001, 20).uci() != 'e5f7'
@@ -0,0 +1,107 @@
+"""
+Search budgets driven by a target latency.
+
+A difficulty may declare "Target Latency" (milliseconds for the whole AI
+move) and "Max Nodes". Instead of a fixed depth or time, every move then gets
+a time limit derived from the target, minus the time the request is expected
+to wait for an engine slot, and a node limit derived from the engine's
+recently measured throughput. Capping the nodes keeps the strength about the
+same from move to move; the time limit only bites when the server is slow.
+
+The observed latencies of every difficulty are fed back: every move over the
+target shrinks the budget, and it grows back slowly while the p99 has room.
+"""
+import threading
+from collections import deque
+
+SAMPLES = 100          # latencies kept per difficulty for the p99
+MIN_FRACTION = 0.1     # the budget never drops below this share of the target
+START_FACTOR = 0.8     # share of the target given to the search, the rest is request overhead
+SHRINK = 0.85          # budget factor step after a move over the target
+GROW = 1.02            # budget factor step while the p99 is well under the target
+
+
+class Budget:
+    __slots__ = ('time', 'nodes')
+
+    def __init__(self, time, nodes):
+        self.time = time
+        self.nodes = nodes
+
+
+class LatencyTarget:
+    __slots__ = ('target', 'latencies', 'factor')
+
+    def __init__(self, target):
+        self.target = target
+        self.latencies = deque(maxlen=SAMPLES)
+        self.factor = START_FACTOR
+
+    def p99(self):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+class TimeManager:
+
+    def __init__(self, expected_wait):
+        self.expected_wait = expected_wait  # seconds a new search waits for a slot
+        self.lock = threading.Lock()
+        self.nps = {}      # engine -> moving average of nodes per second
+        self.targets = {}  # difficulty key -> LatencyTarget
+
+    def record_search(self, engine, nodes, seconds):
+        """ Throughput measured by a finished search """
+        if not nodes or seconds <= 0:
+            return
+        nps = nodes / seconds
+        with self.lock:
+            previous = self.nps.get(engine)
+            self.nps[engine] = nps if previous is None else 0.8 * previous + 0.2 * nps
+
+    def budget(self, key, target_ms, max_nodes=None, engine=None):
+        """ Time (seconds) and node limit (None for no limit) of the next search """
+        target = target_ms / 1000
+        with self.lock:
+            state = self.targets.get(key)
+            if state is None or state.target != target:
+                state = self.targets[key] = LatencyTarget(target)
+            factor = state.factor
+            nps = self.nps.get(engine)
+
+        search_time = max(target * MIN_FRACTION, target * factor - self.expected_wait())
+        nodes = None
+        if max_nodes:
+            # The engine could not search more than this in the time anyway, a
+            # node limit stops it exactly where a time check might overshoot
+            nodes = max_nodes if nps is None else max(1, min(max_nodes, int(nps * search_time)))
+        return Budget(search_time, nodes)
+
+    def record_latency(self, key, seconds):
+        """ End to end time of a budgeted AI move, adjusts the next budgets """
+        with self.lock:
+            state = self.targets.get(key)
+            if state is None:
+                return
+            state.latencies.append(seconds)
+            if seconds > state.target:
+                state.factor = max(MIN_FRACTION, state.factor * SHRINK)
+            elif state.p99() < 0.8 * state.target:
+                state.factor = min(1.0, state.factor * GROW)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'nps': {engine: round(nps) for engine, nps in self.nps.items()},
+                'targets': {
+                    ' '.join(map(str, key)) if isinstance(key, tuple) else str(key): {
+                        'target_ms': round(state.target * 1000),
+                        'p99_ms': None if not state.latencies else round(state.p99() * 1000, 1),
+                        'factor': round(state.factor, 3),
+                        'samples': len(state.latencies)
+                    }
+                    for key, state in self.targets.items()
+                }
+            }
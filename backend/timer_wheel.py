@@ -0,0 +1,118 @@
+"""
+Hierarchical timer wheel.
+
+One thread advances the wheel every tick. Level 0 has a slot per tick for the
+next 64 ticks, level 1 a slot per 64 ticks for the next 64 * 64, and so on; a
+timer goes into the coarsest level its delay needs and is moved down (once per
+level) when its slot comes up. Scheduling and cancelling are O(1), and a tick
+only touches the timers that are due or move down a level, however many are
+pending.
+"""
+import threading
+import time
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+LEVELS = 4  # 64 ** 4 ticks, about 19 days at 0.1 s per tick
+
+
+class Timer:
+    __slots__ = ('tick', 'callback', 'bucket')
+
+    def __init__(self, tick, callback):
+        self.tick = tick
+        self.callback = callback
+        self.bucket = None  # the slot holding it, None once it fired or was cancelled
+
+
+class TimerWheel:
+
+    def __init__(self, tick=0.1, name='timer-wheel'):
+        self.tick = tick
+        self.name = name
+        self.levels = [[set() for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.current = 0  # ticks since start
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pending = 0
+        self.fired = 0
+        self.cascaded = 0
+
+    def schedule(self, delay, callback):
+        """ Call callback() from the wheel's thread delay seconds from now, late by up to a tick """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                self.thread.start()
+            # The first tick at or after the due time, never earlier
+            tick = -int(-(time.monotonic() - self.started + delay) // self.tick)
+            timer = Timer(max(self.current + 1, tick), callback)
+            self.place(timer)
+            self.pending += 1
+            return timer
+
+    def cancel(self, timer):
+        with self.lock:
+            if timer.bucket is not None:
+                timer.bucket.discard(timer)
+                timer.bucket = None
+                self.pending -= 1
+
+    def place(self, timer):
+        """ Put the timer in the slot of the coarsest level its delay needs, call with the lock held """
+        delay = max(1, timer.tick - self.current)
+        level = 0
+        while level < LEVELS - 1 and delay >= SLOTS ** (level + 1):
+            level += 1
+        bucket = self.levels[level][(timer.tick >> (SLOT_BITS * level)) & (SLOTS - 1)]
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def advance(self):
+        """ Move one tick on, returns the callbacks due; call with the lock held """
+        self.current += 1
+        # Higher level slots coming up are spread over the levels below
+        for level in range(1, LEVELS):
+            if self.current & ((1 << (SLOT_BITS * level)) - 1):
+                break
+            bucket = self.levels[level][(self.current >> (SLOT_BITS * level)) & (SLOTS - 1)]
+            timers = list(bucket)
+            bucket.clear()
+            for timer in timers:
+                self.place(timer)
+            self.cascaded += len(timers)
+
+        bucket = self.levels[0][self.current & (SLOTS - 1)]
+        due = [timer for timer in bucket if timer.tick <= self.current]
+        for timer in due:
+            bucket.discard(timer)
+            timer.bucket = None
+        self.pending -= len(due)
+        self.fired += len(due)
+        return [timer.callback for timer in due]
+
+    def run(self):
+        while True:
+            time.sleep(self.tick)
+            target = int((time.monotonic() - self.started) / self.tick)
+            # A late wakeup catches up tick by tick, empty ticks are cheap
+            while True:
+                with self.lock:
+                    if self.current >= target:
+                        break
+                    callbacks = self.advance()
+                for callback in callbacks:
+                    try:
+                        callback()
+                    except Exception as e:
+                        print(f"Warning: timer callback failed ({e})")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'tick_ms': round(self.tick * 1000),
+                'pending': self.pending,
+                'fired': self.fired,
+                'cascaded': self.cascaded
+            }
@@ -0,0 +1,87 @@
+"""
+Chess board keeping its piece counts up to date move by move.
+
+push() and pop() adjust the counts by the captured and promoted pieces of the
+move. Every other change of the position (set_fen, reset, set_piece_at, ...)
+goes through clear_stack(), which drops the counts; they are recounted from
+the bitboards on the next read.
+"""
+import chess
+
+PIECE_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+STARTING_COUNTS = {chess.PAWN: 8, chess.KNIGHT: 2, chess.BISHOP: 2, chess.ROOK: 2, chess.QUEEN: 1}
+
+
+def count_index(color, piece_type):
+    return 6 * color + piece_type - 1
+
+
+class TrackedBoard(chess.Board):
+
+    def __init__(self, *args, **kwargs):
+        self._counts = None
+        self._count_deltas = []
+        super().__init__(*args, **kwargs)
+
+    def clear_stack(self):
+        super().clear_stack()
+        self._counts = None
+        self._count_deltas = []
+
+    def counts(self):
+        """ Pieces on the board per color and type, see count_index """
+        if self._counts is None:
+            self._counts = [chess.popcount(self.pieces_mask(piece_type, color))
+                            for color in (chess.BLACK, chess.WHITE) for piece_type in chess.PIECE_TYPES]
+        return self._counts
+
+    def move_delta(self, move):
+        """ (index, change) pairs the move makes to the counts """
+        delta = []
+        if move.drop:
+            delta.append((count_index(self.turn, move.drop), 1))
+        elif move:
+            if self.is_en_passant(move):
+                delta.append((count_index(not self.turn, chess.PAWN), -1))
+            elif self.occupied_co[not self.turn] & chess.BB_SQUARES[move.to_square]:
+                delta.append((count_index(not self.turn, self.piece_type_at(move.to_square)), -1))
+            if move.promotion:
+                delta.append((count_index(self.turn, chess.PAWN), -1))
+                delta.append((count_index(self.turn, move.promotion), 1))
+        return delta
+
+    def push(self, move):
+        delta = None
+        if self._counts is not None:
+            delta = self.move_delta(move)
+            for index, change in delta:
+                self._counts[index] += change
+        super().push(move)
+        self._count_deltas.append(delta)
+
+    def pop(self):
+        move = super().pop()
+        # Copies carry the move stack but not the deltas
+        delta = self._count_deltas.pop() if self._count_deltas else None
+        if delta is None:
+            self._counts = None
+        elif self._counts is not None:
+            for index, change in delta:
+                self._counts[index] -= change
+        return move
+
+    def material_balance(self):
+        """ White's material minus Black's, in pawns """
+        counts = self.counts()
+        return sum(value * (counts[count_index(chess.WHITE, piece_type)] - counts[count_index(chess.BLACK, piece_type)])
+                   for piece_type, value in PIECE_VALUES.items())
+
+    def captured_pieces(self):
+        """ Pieces each side has captured, counted against a full starting set """
+        counts = self.counts()
+
+        def captured(color):
+            return {chess.piece_symbol(piece_type): max(0, start - counts[count_index(color, piece_type)])
+                    for piece_type, start in STARTING_COUNTS.items()}
+
+        return {'white': captured(chess.BLACK), 'black': captured(chess.WHITE)}
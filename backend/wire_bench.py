@@ -0,0 +1,115 @@
+"""
+Wire format benchmark for the polled endpoints.
+
+Sets up a multiplayer game, a single player game, the default checkers game
+and a list of challenges in a fresh app instance, then requests each endpoint
+as JSON and as MessagePack (see wire_format.py), with and without gzip. Prints
+the bytes sent and the time spent serializing the payload per request.
+
+Usage: python wire_bench.py [--plies N] [--challenges N] [--repeat N]
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+from challenge_analysis import analyse_challenge
+
+MIDDLEGAME_FEN = 'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8'
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+CHALLENGE_ANALYSIS_TIME = 0.2  # seconds, only the shape of the result matters
+
+
+def median_us(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings)
+
+
+def setup(backend, plies, challenge_count):
+    """ Fill the app with the games the requests read, returns the requests to benchmark """
+    rng = random.Random(1)
+
+    game_id = 'bench'
+    game = backend.create_new_game('Benchmark', 'regular')
+    game.set_player('white', 'alice')
+    game.set_player('black', 'bob')
+    for _ in range(plies):
+        moves = list(game.board.legal_moves)
+        if not moves:
+            break
+        game.push(rng.choice(moves))
+    backend.games[game_id] = game
+
+    # One real analysis (see challenge_analysis.py), stored with every challenge
+    analysis = analyse_challenge(MIDDLEGAME_FEN, backend.STOCKFISH_PATH, CHALLENGE_ANALYSIS_TIME)
+    for i in range(challenge_count):
+        backend.challenges[f'bench{i}'] = {
+            'fen': MIDDLEGAME_FEN,
+            'name': f'Challenge {i}',
+            'analysis': dict(analysis)
+        }
+
+    def move():
+        backend.board.set_fen(MIDDLEGAME_FEN)
+        return {'method': 'POST', 'path': '/move', 'json': {'move': 'c4d5', 'include': ['captured_pieces', 'legal_moves']}}
+
+    return [
+        ('/multiplayer/game_state', lambda: {'method': 'GET', 'path': '/multiplayer/game_state', 'query_string': {'game_id': game_id}}),
+        ('/move', move),
+        ('/checkers/checkers_state', lambda: {'method': 'GET', 'path': '/checkers/checkers_state'}),
+        ('/get_challenges', lambda: {'method': 'GET', 'path': '/get_challenges'}),
+    ]
+
+
+def measure(backend, client, request, accept, repeat):
+    """ (body bytes, gzipped bytes, serialization us) of one endpoint in one format """
+    import msgpack
+
+    body = client.open(headers={'Accept': accept}, **request()).get_data()
+    gzipped = client.open(headers={'Accept': accept, 'Accept-Encoding': 'gzip'}, **request()).get_data()
+
+    if accept == MSGPACK:
+        payload = msgpack.unpackb(body)
+        serialize = lambda: msgpack.packb(payload)
+    else:
+        payload = json.loads(body)
+        serialize = lambda: backend.app.json.dumps(payload)
+    with backend.app.test_request_context():
+        return len(body), len(gzipped), median_us(serialize, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON vs MessagePack benchmark of the polled endpoints')
+    parser.add_argument('--plies', type=int, default=80, help='moves played in the multiplayer game')
+    parser.add_argument('--challenges', type=int, default=50, help='saved challenges listed by /get_challenges')
+    parser.add_argument('--repeat', type=int, default=2000, help='serializations timed per payload')
+    args = parser.parse_args()
+
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        print('msgpack is not installed (pip install msgpack)')
+        sys.exit(1)
+
+    import backend
+    client = backend.app.test_client()
+    requests = setup(backend, args.plies, args.challenges)
+
+    print(f"{'endpoint':<28} {'json B':>8} {'msgpack B':>10} {'saved':>7} {'json gz':>8} {'mp gz':>7} "
+          f"{'json us':>8} {'mp us':>7} {'saved us':>9}")
+    for name, request in requests:
+        json_bytes, json_gz, json_us = measure(backend, client, request, JSON, args.repeat)
+        mp_bytes, mp_gz, mp_us = measure(backend, client, request, MSGPACK, args.repeat)
+        print(f"{name:<28} {json_bytes:>8} {mp_bytes:>10} {1 - mp_bytes / json_bytes:>7.0%} {json_gz:>8} {mp_gz:>7} "
+              f"{json_us:>8.1f} {mp_us:>7.1f} {json_us - mp_us:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
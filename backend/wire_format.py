@@ -0,0 +1,89 @@
+"""
+Content negotiation between JSON and MessagePack.
+
+Every JSON response (jsonify or a returned dict) is sent as MessagePack
+instead when the client prefers application/x-msgpack in its Accept header
+and the msgpack package is installed. JSON stays the default.
+
+The polled endpoints also swap their verbose fields for packed binary ones in
+MessagePack responses:
+
+  board       chess position, 32 bytes with one nibble per square from a1 to h8
+              (low nibble first; 0 empty, 1-6 white PNBRQK, 9-14 black pnbrqk),
+              followed by the FEN fields after the placement (" w KQkq - 0 1")
+  moves       moves as little-endian 16 bit integers, from square (6 bits) |
+              to square << 6 | promotion piece type << 12 (see game_record.py)
+  legal_moves pairs of bytes (from square, to square) for the side to move
+  board_map   checkers board, one byte per square number 1-50
+              (0 empty, 1 r, 2 R, 3 b, 4 B)
+"""
+import sys
+from array import array
+
+import chess
+from flask import request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPE = 'application/x-msgpack'
+CHECKERS_PIECES = {'r': 1, 'R': 2, 'b': 3, 'B': 4}
+
+
+def wants_msgpack():
+    if msgpack is None or not has_request_context():
+        return False
+    return request.accept_mimetypes.best_match(('application/json', MSGPACK_TYPE)) == MSGPACK_TYPE
+
+
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    """ JSON provider answering in MessagePack when the client asks for it """
+
+    def response(self, *args, **kwargs):
+        if wants_msgpack():
+            data = msgpack.packb(self._prepare_response_obj(args, kwargs), default=self.default)
+            response = self._app.response_class(data, mimetype=MSGPACK_TYPE)
+        else:
+            response = super().response(*args, **kwargs)
+        response.vary.add('Accept')
+        return response
+
+
+def install_msgpack(app):
+    if msgpack is None:
+        print("Warning: msgpack is not installed, responses are JSON only")
+        return
+    app.json = NegotiatingJSONProvider(app)
+
+
+def pack_chess_fen(fen):
+    placement, _, rest = fen.partition(' ')
+    board = chess.BaseBoard(placement)
+    nibbles = bytearray(32)
+    for square, piece in board.piece_map().items():
+        code = piece.piece_type + (0 if piece.color == chess.WHITE else 8)
+        nibbles[square >> 1] |= code << (4 * (square & 1))
+    return bytes(nibbles) + b' ' + rest.encode()
+
+
+def pack_moves(codes):
+    codes = array('H', codes)
+    if sys.byteorder != 'little':
+        codes.byteswap()
+    return codes.tobytes()
+
+
+def pack_legal_moves(board):
+    # The four promotions of a pawn are one pair
+    pairs = dict.fromkeys((move.from_square, move.to_square) for move in board.legal_moves)
+    return bytes(square for pair in pairs for square in pair)
+
+
+def pack_checkers_map(board_map, position_to_square):
+    squares = bytearray(50)
+    for position, piece in board_map.items():
+        squares[position_to_square[position] - 1] = CHECKERS_PIECES[piece]
+    return bytes(squares)
@@ -2,7 +2,7 @@
 // Author: Norman Babiak (xbabia01)
 // Desc: Checkers board component for the Checkers game.
 
-import React, { useEffect, useState, useCallback } from 'react';
+import React, { useEffect, useState, useCallback, useRef } from 'react';
 import { useLocation } from 'react-router-dom';
 import { Square } from './Square';
 import '../board/Board.css';
@@ -20,8 +20,12 @@ interface GameState {
   turn: string;
   is_over: boolean;
   board_map: { [position: string]: string };
+  version: number;
 }
 
+// Changed squares returned by the backend after a move, null = emptied square
+type BoardDelta = { [position: string]: string | null };
+
 export const CheckersBoard: React.FC = () => {
   const [gameState, setGameState] = useState<GameState | null>(null);
   const [selectedPiece, setSelectedPiece] = useState<string | null>(null);  // Selected piece position
@@ -33,6 +37,8 @@ export const CheckersBoard: React.FC = () => {
   const mode = location.state?.mode || 'freeplay';
   const [moveHistory, setMoveHistory] = useState<string[]>([]); // Move history for the sidebar
   const fenFromState = location.state?.fen; // Custom fen from board setup mode
+  const versionRef = useRef<number>(-1); // Board map version the client currently shows
+  const gameIdRef = useRef<string | null>(null); // Backend game of this board, created on start
 
   // Initial piece and king count
   const initialPieceCount = location.state?.piece_count || (variant === 'frysk' ? 5 : 20);
@@ -44,8 +50,9 @@ export const CheckersBoard: React.FC = () => {
   // Fetch the game state from the backend
   const fetchGameState = async () => {
     try {
-      const response = await fetch('http://127.0.0.1:5000/checkers/checkers_state');
+      const response = await fetch(`http://127.0.0.1:5000/checkers/checkers_state?game_id=${gameIdRef.current}`);
       const data = await response.json();
+      versionRef.current = data.version;
       setGameState(data); // Update the game state
 
     } catch (error) {
@@ -56,13 +63,15 @@ export const CheckersBoard: React.FC = () => {
   // Start a new game
   const startNewGame = useCallback(async () => {
     try {
-      const response = await fetch('http://127.0.0.1:5000/checkers/checkers_new_game', {
+      const response = await fetch('http://127.0.0.1:5000/checkers/create', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ variant, piece_count: pieceCount, king_count: kingCount }),
       });
   
       const data = await response.json();
+      gameIdRef.current = data.game_id;
+      versionRef.current = data.version;
       setGameState(data); // Update the game state
       setMoveHistory([]); // Clear move history for the new game
 
@@ -75,12 +84,14 @@ export const CheckersBoard: React.FC = () => {
   const applyCustomFen = useCallback(async () => {
     if (fenFromState) {
       try {
-        const response = await fetch('http://127.0.0.1:5000/checkers/checkers_custom_setup', {
+        const response = await fetch('http://127.0.0.1:5000/checkers/create', {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
           body: JSON.stringify({ fen: fenFromState, variant }),
         });
         const data = await response.json();
+        gameIdRef.current = data.game_id;
+        versionRef.current = data.version;
         setGameState(data);
         setMoveHistory([]);
         
@@ -99,13 +110,35 @@ export const CheckersBoard: React.FC = () => {
     }
   }, [startNewGame, fenFromState, mode, applyCustomFen]);
 
+  // Apply the changed squares of a move, fetch the whole state if a version was missed
+  const applyMoveDelta = async (data: { fen: string; turn: string; is_over: boolean; delta: BoardDelta; version: number }) => {
+    if (versionRef.current + 1 !== data.version) {
+      await fetchGameState();
+      return;
+    }
+
+    versionRef.current = data.version;
+    setGameState((prevState) => {
+      if (!prevState) return prevState;
+      const boardMap = { ...prevState.board_map };
+      Object.entries(data.delta).forEach(([position, piece]) => {
+        if (piece === null) {
+          delete boardMap[position];
+        } else {
+          boardMap[position] = piece;
+        }
+      });
+      return { fen: data.fen, turn: data.turn, is_over: data.is_over, board_map: boardMap, version: data.version };
+    });
+  };
+
   // Fetch legal moves for a given position
   const fetchLegalMoves = async (position: string) => {
     try {
       const response = await fetch('http://127.0.0.1:5000/checkers/checkers_legal_moves', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ position }),
+        body: JSON.stringify({ position, game_id: gameIdRef.current }),
       });
   
       if (!response.ok) {
@@ -136,7 +169,7 @@ export const CheckersBoard: React.FC = () => {
   // Fetch playable pieces for the current turn
   const fetchPlayablePieces = async () => {
     try {
-      const response = await fetch('http://127.0.0.1:5000/checkers/playable_pieces', {
+      const response = await fetch(`http://127.0.0.1:5000/checkers/playable_pieces?game_id=${gameIdRef.current}`, {
         method: 'GET',
       });
   
@@ -202,7 +235,7 @@ export const CheckersBoard: React.FC = () => {
       const response = await fetch('http://127.0.0.1:5000/checkers/checkers_move', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ move: movePDN }),
+        body: JSON.stringify({ move: movePDN, game_id: gameIdRef.current }),
       });
       const data = await response.json();
   
@@ -239,7 +272,7 @@ export const CheckersBoard: React.FC = () => {
         }
       }
 
-      await fetchGameState();
+      await applyMoveDelta(data);
 
     } catch (error) {
       console.error('Error making move:', error);
@@ -252,6 +285,7 @@ export const CheckersBoard: React.FC = () => {
       const response = await fetch('http://127.0.0.1:5000/checkers/checkers_ai_move', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ game_id: gameIdRef.current }),
       });
       const data = await response.json();
 
@@ -270,7 +304,7 @@ export const CheckersBoard: React.FC = () => {
         ...prevHistory, 
       `AI: ${data.ai_move}`]);
 
-      await fetchGameState(); // Update the game state after the move
+      await applyMoveDelta(data); // Update the game state after the move
 
     } catch (error) {
       console.error('Error making AI move:', error);
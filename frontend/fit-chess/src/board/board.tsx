@@ -28,6 +28,8 @@ interface GameState {
     is_check: boolean;
     material_balance: number;
     check_square?: string;
+    captured_pieces?: CapturedPieces; // sent along with moves
+    legal_moves?: Record<string, string[]>; // target squares of the side to move, keyed by piece square
 }
 
 interface Players {
@@ -170,16 +172,10 @@ export const Board: React.FC<BoardProps> = ({initialFen}) => {
         
         if (moveMode === "selectingPiece") {
             // First selection mode: fetch legal moves for the selected piece
-            const response = await fetch('http://127.0.0.1:5000/legal_moves', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ position: selectedSquare }),
-            });
-            const data = await response.json();
+            const moves = await fetchLegalMoves(selectedSquare);
         
-            if (data.legal_moves.length > 0) {
+            if (moves.length > 0) {
                 setSelectedPiece(selectedSquare); // Set selected piece if it has legal moves
-                setLegalMoves(data.legal_moves);
                 setMoveMode("selectingTarget"); // Switch to target selection mode
             } else {
                 console.log('No legal moves for selected square');
@@ -193,7 +189,7 @@ export const Board: React.FC<BoardProps> = ({initialFen}) => {
                 setMoveMode("selectingPiece"); // Switch back to piece selection mode
             }
         }
-    }, [selectedSquare, moveMode, selectedPiece, handleMove]);
+    }, [selectedSquare, moveMode, selectedPiece, handleMove, gameState]);
 
     // Author: Milan Jakubec (xjakub41)
     // Keyboard navigation
@@ -244,12 +240,17 @@ export const Board: React.FC<BoardProps> = ({initialFen}) => {
                 return;
             }
 
+            // The AI reply, captured pieces and next legal moves come back with the move
             const response = await fetch('http://127.0.0.1:5000/move', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ move }),
+                body: JSON.stringify({
+                    move,
+                    include: ['captured_pieces', 'legal_moves'],
+                    ...(difficultyLevel !== 'none' ? { respond: difficultyLevel } : {}),
+                }),
             });
             
             const data = await response.json();
@@ -268,8 +269,12 @@ export const Board: React.FC<BoardProps> = ({initialFen}) => {
             setLegalMoves([]); // Reset legal moves
             setHint(null);
 
-            if (difficultyLevel !== 'none') {
-                callAIMove();
+            if (data.ai_move) {
+                setMoveHistory(moveHistory => [...moveHistory, `AI: ${data.from} to ${data.to}`]);
+            } else if (data.ai_error) {
+                // The move stands, ask for the reply again once the server has room
+                console.error('AI reply failed:', data.ai_error);
+                setTimeout(callAIMove, (data.retry_after ?? 0) * 1000);
             }
         } catch (e) {
             console.error('Failed to make a move: ', e);
@@ -403,12 +408,19 @@ export const Board: React.FC<BoardProps> = ({initialFen}) => {
                 setMoveMode('selectingPiece');
             }
         }
-      }, [moveMode, selectedSquare, handleMove]);
+      }, [moveMode, selectedSquare, handleMove, gameState]);
       
 
     // Author: xracek12
     // fetch legal moves for the selected piece and square
     const fetchLegalMoves = async (selectedSquare: string) => {
+    // The last move response already lists them
+    if (gameState?.legal_moves) {
+        const moves = gameState.legal_moves[selectedSquare] ?? [];
+        setLegalMoves(moves);
+        return moves;
+    }
+
     const response = await fetch('http://127.0.0.1:5000/legal_moves', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
@@ -470,8 +482,12 @@ export const Board: React.FC<BoardProps> = ({initialFen}) => {
     }, [gameState]);
 
     useEffect(() => {
-        getCapturedPieces();
-    }, [gameState?.material_balance]);
+        if (gameState?.captured_pieces) {
+            setCapturedPieces(gameState.captured_pieces);
+        } else {
+            getCapturedPieces();
+        }
+    }, [gameState?.material_balance, gameState?.captured_pieces]);
 
     // if the game state is not loaded, show a loading message
     // this prevents stuff breaking on the first load,